@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Storage codecs for causal attention tensors.
+
+- `dense`:   the full (layers, heads, seq, seq) float16 array.
+- `tril`:    only the causal lower triangle, packed row-major into
+             (layers, heads, seq * (seq + 1) / 2) float16. Lossless; the upper
+             triangle of a decoder's attention is always zero.
+- `tril_q8`: the packed triangle quantised to uint8 with one float16 scale per
+             (layer, head, row): value = code * scale, scale = row max / 255.
+- `topk`:    lossy top-k keys per query row in CSR form, for multi-thousand-token
+             prompts (see sparse_attention.py).
+
+Decoding a head is one scatter of the packed row into a reused (seq, seq)
+buffer whose upper triangle is never written.
+
+    python attention_codec.py report gemma2            # round-trip error of tril_q8
+    python attention_codec.py report gemma2 --codec topk --topk 8
+    python attention_codec.py encode gemma2 --codec tril
+"""
+import argparse
+import functools
+import os
+import sys
+import threading
+
+import numpy as np
+
+CODECS = ("dense", "tril", "tril_q8", "topk")
+
+
+@functools.lru_cache(maxsize=256)
+def tril_index(seq_len):
+    """Row and column indices of the packed lower triangle, plus each row's start."""
+    rows, cols = np.tril_indices(seq_len)
+    row_starts = np.arange(seq_len) * (np.arange(seq_len) + 1) // 2
+    for array in (rows, cols, row_starts):
+        array.flags.writeable = False
+    return rows, cols, row_starts
+
+
+def packed_length(seq_len):
+    return seq_len * (seq_len + 1) // 2
+
+
+def encode_tril(attention):
+    """Pack (..., seq, seq) attention into (..., seq * (seq + 1) / 2)."""
+    rows, cols, _ = tril_index(attention.shape[-1])
+    return np.asarray(attention)[..., rows, cols]
+
+
+def quantize_rows(packed, seq_len):
+    """Quantise a packed triangle to uint8 codes with a per-row scale."""
+    packed = np.asarray(packed, dtype=np.float32)
+    rows, _, row_starts = tril_index(seq_len)
+    row_max = np.maximum.reduceat(packed, row_starts, axis=-1)
+    scales = (row_max / 255.0).astype(np.float16)
+    safe = np.where(scales > 0, scales, 1).astype(np.float32)
+    codes = np.rint(packed / safe[..., rows])
+    return np.clip(codes, 0, 255).astype(np.uint8), scales
+
+
+def dequantize_rows(codes, scales, seq_len):
+    rows, _, _ = tril_index(seq_len)
+    return codes * scales.astype(np.float32)[..., rows]
+
+
+def decode_tensor(packed, seq_len, scales=None):
+    """Unpack (..., packed) back to a dense (..., seq, seq) array."""
+    rows, cols, _ = tril_index(seq_len)
+    values = dequantize_rows(packed, scales, seq_len) if scales is not None else np.asarray(packed)
+    dense = np.zeros(values.shape[:-1] + (seq_len, seq_len), dtype=values.dtype)
+    dense[..., rows, cols] = values
+    return dense
+
+
+class HeadDecoder:
+    """Decodes single heads into per-thread buffers that are reused between calls.
+
+    The returned array is overwritten by the next decode of the same sequence
+    length and dtype on the same thread; copy it if it must outlive that
+    (`AttentionStore.head` does, `AttentionStore.head_view` does not).
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _buffer(self, seq_len, dtype):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get((seq_len, dtype))
+        if buffer is None:
+            # Upper triangle stays zero forever: decoding only writes rows >= cols
+            buffer = buffers[(seq_len, dtype)] = np.zeros((seq_len, seq_len), dtype=dtype)
+        return buffer
+
+    def decode(self, packed_head, seq_len, scales=None):
+        rows, cols, _ = tril_index(seq_len)
+        if scales is None:
+            out = self._buffer(seq_len, np.dtype(np.float16))
+            out[rows, cols] = packed_head
+        else:
+            out = self._buffer(seq_len, np.dtype(np.float32))
+            out[rows, cols] = packed_head * np.asarray(scales, dtype=np.float32)[rows]
+        return out
+
+
+class EncodingSink:
+    """Layer-by-layer writer that packs (and optionally quantises) into memmaps.
+
+    Quacks like the dense memmap returned by `StoreWriter.create_tensor`:
+    `sink[layer] = (heads, seq, seq)` (or `sink[layer, head] = (seq, seq)`) and
+    `sink.shape` is the dense shape.
+    """
+
+    def __init__(self, packed, scales, shape):
+        self.packed = packed
+        self.scales = scales
+        self.shape = shape
+
+    def __setitem__(self, key, value):
+        packed = encode_tril(value)
+        if self.scales is None:
+            self.packed[key] = packed
+        else:
+            self.packed[key], self.scales[key] = quantize_rows(packed, self.shape[-1])
+
+    def flush(self):
+        self.packed.flush()
+        if self.scales is not None:
+            self.scales.flush()
+
+
+def open_sink(directory, stem, codec, shape, topk=None):
+    """Create the files for one entry; return (sink, manifest fields)."""
+    num_layers, num_heads, seq_len, _ = shape
+    if codec == "topk":
+        from sparse_attention import DEFAULT_TOPK, open_topk_sink
+
+        return open_topk_sink(directory, stem, shape, topk or DEFAULT_TOPK)
+    if codec == "dense":
+        relative_path = f"{stem}.npy"
+        array = np.lib.format.open_memmap(os.path.join(directory, relative_path), mode="w+",
+                                          dtype=np.float16, shape=shape)
+        return array, {"codec": codec, "file": relative_path}
+
+    packed_shape = (num_layers, num_heads, packed_length(seq_len))
+    relative_path = f"{stem}.{codec}.npy"
+    packed = np.lib.format.open_memmap(
+        os.path.join(directory, relative_path), mode="w+",
+        dtype=np.float16 if codec == "tril" else np.uint8, shape=packed_shape)
+    fields = {"codec": codec, "file": relative_path}
+    scales = None
+    if codec == "tril_q8":
+        fields["scales_file"] = f"{stem}.scales.npy"
+        scales = np.lib.format.open_memmap(os.path.join(directory, fields["scales_file"]), mode="w+",
+                                           dtype=np.float16, shape=(num_layers, num_heads, seq_len))
+    return EncodingSink(packed, scales, shape), fields
+
+
+def reencode_store(model_name, codec, root=None, topk=None):
+    """Rewrite every entry of a store with `codec`, removing the old files."""
+    from attention_store import STORE_ROOT, StoreWriter, open_store
+
+    root = root or STORE_ROOT
+    store = open_store(model_name, root)
+    writer = StoreWriter(model_name, root, codec=codec, topk=topk)
+    for trio_name in store.trios():
+        for lang in store.languages(trio_name):
+            entry = store.entry(trio_name, lang)
+            if entry.get("codec", "dense") == codec and entry.get("topk") == writer.manifest.get("topk"):
+                continue
+            attention = np.array(store.tensor(trio_name, lang))
+            # The writer removes the entry's old files once the new ones exist
+            store.release(trio_name, lang)
+            writer.add_tensor(trio_name, lang, entry["prompt"], entry["tokens"], attention)
+    writer.close()
+    return writer.path
+
+
+def roundtrip(attention, codec, topk=None):
+    """(..., seq, seq) float32 attention after storing it with `codec` and reading it back."""
+    original = np.asarray(attention, dtype=np.float32)
+    seq_len = original.shape[-1]
+    stored = original.astype(np.float16)
+    if codec == "dense":
+        return stored.astype(np.float32)
+    if codec == "topk":
+        from sparse_attention import DEFAULT_TOPK, row_layout, topk_rows
+
+        topk = topk or DEFAULT_TOPK
+        indices, values = topk_rows(stored, topk)
+        _, _, keep = row_layout(seq_len, topk)
+        # Slots beyond a row's causal width point at (zero) upper-triangle keys
+        values = np.where(keep, values.astype(np.float16).astype(np.float32), 0)
+        decoded = np.zeros_like(original)
+        np.put_along_axis(decoded, indices, values, axis=-1)
+        return decoded
+    packed = encode_tril(stored)
+    if codec == "tril_q8":
+        codes, scales = quantize_rows(packed, seq_len)
+        return decode_tensor(codes, seq_len, scales)
+    if codec == "tril":
+        return decode_tensor(packed, seq_len).astype(np.float32)
+    raise ValueError(f"Unknown codec {codec!r}; expected one of {CODECS}")
+
+
+def roundtrip_report(store, codec="tril_q8", topk=None):
+    """Per-entry error of encoding a store's dense attention with `codec` (`topk` keys for top-k).
+
+    Reports the max/mean absolute error on the displayed values, how many of
+    the heatmap's 2-decimal annotations change, and the largest change in each
+    per-head statistic plus how often the last-token argmax moves.
+    """
+    from head_stats import METRICS, compute_head_stats
+
+    rows = []
+    for trio_name in store.trios():
+        for lang in store.languages(trio_name):
+            original = np.asarray(store.tensor(trio_name, lang), dtype=np.float32)
+            seq_len = original.shape[-1]
+            decoded = roundtrip(original, codec, topk)
+            error = np.abs(decoded - original)
+            rows_index, cols_index, _ = tril_index(seq_len)
+            original_stats = compute_head_stats(original)
+            decoded_stats = compute_head_stats(decoded)
+            row = {
+                "entry": f"{trio_name}/{lang}",
+                "seq_len": seq_len,
+                "max_abs_error": float(error.max()),
+                "mean_abs_error": float(error[..., rows_index, cols_index].mean()),
+                "annotation_changes": float(np.mean(np.round(decoded, 2) != np.round(original, 2))),
+                "argmax_changes": float(np.mean(decoded_stats["argmax"] != original_stats["argmax"])),
+            }
+            for name in METRICS:
+                row[f"max_delta_{name}"] = float(np.abs(decoded_stats[name] - original_stats[name]).max())
+            rows.append(row)
+    return rows
+
+
+def main():
+    """Encode stores with a codec or report a codec's round-trip error."""
+    from attention_store import ENTRY_FILE_KEYS, STORE_ROOT, open_store
+
+    parser = argparse.ArgumentParser(description="Packed / quantised attention storage.")
+    parser.add_argument("command", choices=["report", "encode"])
+    parser.add_argument("models", nargs="*", default=["gemma2"], help="model names")
+    parser.add_argument("--codec", choices=CODECS, default=None,
+                        help="codec to encode with (default: tril) or to report on (default: tril_q8)")
+    parser.add_argument("--topk", type=int, default=None, help="keys kept per row for --codec topk")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    args = parser.parse_intermixed_args()
+
+    for model_name in args.models:
+        store = open_store(model_name, args.root)
+        if store is None:
+            print(f"Skipping {model_name}: no store under {args.root}")
+            continue
+        if args.command == "encode":
+            codec = args.codec or "tril"
+            path = reencode_store(model_name, codec, args.root, args.topk)
+            store = open_store(model_name, args.root)
+            size = sum(os.path.getsize(os.path.join(path, store.entry(trio_name, lang)[key]))
+                       for trio_name in store.trios() for lang in store.languages(trio_name)
+                       for key in ENTRY_FILE_KEYS if key in store.entry(trio_name, lang))
+            print(f"Encoded {path} as {codec} ({size / 2**20:.2f} MiB of attention)")
+            continue
+
+        codec = args.codec or "tril_q8"
+        rows = roundtrip_report(store, codec, args.topk)
+        if codec == "topk":
+            from sparse_attention import DEFAULT_TOPK
+
+            codec = f"topk (k={args.topk or DEFAULT_TOPK})"
+        print(f"{model_name}: {codec} round trip")
+        print(f"{'entry':<18}{'seq':>5}{'max err':>10}{'mean err':>10}{'annot':>8}{'argmax':>8}"
+              f"{'d entropy':>11}{'d bos':>8}")
+        for row in rows:
+            print(f"{row['entry']:<18}{row['seq_len']:>5}{row['max_abs_error']:>10.4f}"
+                  f"{row['mean_abs_error']:>10.5f}{row['annotation_changes']:>8.1%}"
+                  f"{row['argmax_changes']:>8.1%}{row['max_delta_entropy']:>11.4f}"
+                  f"{row['max_delta_bos_mass']:>8.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+"""Figure drawing shared by the Streamlit app and offline tools.
+
+matplotlib and seaborn are imported on the first figure (`pyplot()`), not at
+import time, so the image and hover renderers never pay for them. Shipped
+fonts are registered from `fonts/font_cache.json` without parsing the TTFs;
+rebuild it with `python attention_render.py build-font-cache`.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from tracing import traced
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+FONT_CACHE = os.path.join(FONT_DIR, "font_cache.json")
+FONT_FILES = ("NotoSansDevanagari-Regular.ttf", "NotoSansDevanagari-Bold.ttf")
+
+# Settings that change the rendered pixels; they are part of every render-cache key
+RENDER_SETTINGS = {
+    "format": "png",
+    "dpi": 200,
+    "token_bar_figsize": (10, 2),
+    "heatmap_figsize": (10, 8),
+    "annotate": True,
+    # Image renderer: target edge in pixels and the largest grid drawn cell-for-cell
+    "image_pixels": 800,
+    "image_max_cells": 256,
+}
+
+# Above this many tokens the annotated seaborn heatmap is replaced by the image renderer
+ANNOTATION_TOKEN_LIMIT = 48
+# Cells per axis in the hover (Altair) heatmap before pooling kicks in
+INTERACTIVE_MAX_CELLS = 64
+
+# First shipped Devanagari font; found without importing matplotlib
+DEVANAGARI_FONT_PATH = next((os.path.join(FONT_DIR, name) for name in FONT_FILES
+                             if os.path.exists(os.path.join(FONT_DIR, name))), None)
+
+_pyplot = None
+_devanagari_font = None
+_setup_lock = threading.Lock()
+# pyplot's figure manager is process-wide state, so every figure (Streamlit
+# script threads and prefetch workers alike) is drawn and encoded under one lock
+_figure_lock = threading.RLock()
+
+
+def register_fonts():
+    """Add the shipped fonts to matplotlib's font manager.
+
+    Entries come from the prebuilt cache when it was written by this
+    matplotlib version and lists the file; anything else (an older cache, a
+    `FontEntry` whose fields changed) falls back to `addfont`, which parses
+    the TTF.
+    """
+    import matplotlib
+    import matplotlib.font_manager as fm
+
+    cached = {}
+    if os.path.exists(FONT_CACHE):
+        with open(FONT_CACHE, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and data.get("matplotlib") == matplotlib.__version__:
+            cached = {entry["fname"]: entry for entry in data["fonts"]}
+    appended = False
+    for name in FONT_FILES:
+        path = os.path.join(FONT_DIR, name)
+        if not os.path.exists(path):
+            continue
+        try:
+            entry = fm.FontEntry(**dict(cached[name], fname=path)) if name in cached else None
+        except TypeError:
+            entry = None
+        if entry is None:
+            fm.fontManager.addfont(path)
+        else:
+            fm.fontManager.ttflist.append(entry)
+            appended = True
+    # Same invalidation addfont does, for the entries appended directly (a private cache)
+    cache_clear = getattr(getattr(fm.fontManager, "_findfont_cached", None), "cache_clear", None)
+    if appended and cache_clear is not None:
+        cache_clear()
+
+
+def build_font_cache():
+    """Write the font cache for the shipped fonts and warm matplotlib's own font list."""
+    import dataclasses
+
+    import matplotlib
+    import matplotlib.font_manager as fm
+
+    entries = []
+    for name in FONT_FILES:
+        path = os.path.join(FONT_DIR, name)
+        if os.path.exists(path):
+            entry = dataclasses.asdict(fm.ttfFontProperty(fm.get_font(path)))
+            entries.append(dict(entry, fname=name))
+    with open(FONT_CACHE, "w", encoding="utf-8") as f:
+        json.dump({"matplotlib": matplotlib.__version__, "fonts": entries}, f, indent=1)
+    return FONT_CACHE
+
+
+def pyplot():
+    """matplotlib.pyplot, imported and set up (fonts, rcParams) on first use."""
+    global _pyplot
+    if _pyplot is None:
+        with _setup_lock:
+            if _pyplot is None:
+                import matplotlib.pyplot as plt
+
+                register_fonts()
+                # Set up fonts for Hindi/Devanagari text
+                plt.rcParams['font.family'] = ['DejaVu Sans', 'Noto Sans Devanagari']
+                _pyplot = plt
+    return _pyplot
+
+
+def warm_up():
+    """Import the figure stack ahead of the first figure (e.g. from a background thread)."""
+    pyplot()
+    import seaborn  # noqa: F401
+
+
+# Function to create a custom colormap (red shades for attention)
+def create_attention_colormap():
+    from matplotlib.colors import LinearSegmentedColormap
+
+    colors = [(1, 1, 1), (1, 0.8, 0.8), (1, 0.6, 0.6), (1, 0.4, 0.4), (1, 0, 0)]
+    return LinearSegmentedColormap.from_list('attention_cmap', colors, N=100)
+
+
+_attention_lut = None
+
+
+def attention_lut():
+    """(256, 3) uint8 lookup table sampled from the attention colormap.
+
+    Computed with numpy alone (same 100-step quantisation as
+    `create_attention_colormap`) so the image renderer does not import matplotlib.
+    """
+    global _attention_lut
+    if _attention_lut is None:
+        anchors = np.array([(1, 1, 1), (1, 0.8, 0.8), (1, 0.6, 0.6), (1, 0.4, 0.4), (1, 0, 0)])
+        steps = np.linspace(0, 1, 100)
+        table = np.stack([np.interp(steps, np.linspace(0, 1, len(anchors)), anchors[:, c])
+                          for c in range(3)], axis=-1)
+        index = np.minimum((np.linspace(0, 1, 256) * 100).astype(int), 99)
+        _attention_lut = np.round(table[index] * 255).astype(np.uint8)
+    return _attention_lut
+
+
+def attention_palette():
+    """Hex colours of six evenly spaced LUT entries, the colour range of the Altair charts."""
+    return [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in attention_lut()[::51]]
+
+
+def has_font_for_language(language):
+    """Whether `get_font_for_language` returns a font, without loading it."""
+    return language.lower() == "hindi" and DEVANAGARI_FONT_PATH is not None
+
+
+# Function to get appropriate font based on language
+def get_font_for_language(language):
+    global _devanagari_font
+    if not has_font_for_language(language):
+        return None  # Use default font
+    if _devanagari_font is None:
+        pyplot()
+        import matplotlib.font_manager as fm
+
+        _devanagari_font = fm.FontProperties(fname=DEVANAGARI_FONT_PATH)
+    return _devanagari_font
+
+
+def last_token_attention(attn_matrix, tokens):
+    """How the last token attends to all previous tokens, normalised to sum to 1."""
+    token_attention = attn_matrix[-1, :len(tokens)].astype(np.float32)
+    if np.sum(token_attention) > 0:
+        token_attention = token_attention / np.sum(token_attention)
+    return token_attention
+
+
+@traced("token_bar.draw")
+def draw_token_bar(tokens, token_attention, font=None, figsize=None):
+    """Draw tokens on a strip with backgrounds shaded by attention weight."""
+    plt = pyplot()
+    fig, ax = plt.subplots(figsize=figsize or RENDER_SETTINGS["token_bar_figsize"])
+
+    # Display tokens with colored backgrounds based on attention
+    current_pos = 0
+    for i, token in enumerate(tokens):
+        # Calculate text width (approximate)
+        token_width = len(token) * 0.1 + 0.2
+
+        # Add colored rectangle based on attention weight
+        color_intensity = token_attention[i]
+        rect = plt.Rectangle((current_pos, 0), token_width, 0.8,
+                             color=(1, 1 - color_intensity, 1 - color_intensity),
+                             alpha=0.8)
+        ax.add_patch(rect)
+
+        # Add token text with appropriate font
+        if font is not None:
+            ax.text(current_pos + token_width / 2, 0.4, token,
+                    ha='center', va='center', fontsize=12, fontweight='bold',
+                    fontproperties=font)
+        else:
+            ax.text(current_pos + token_width / 2, 0.4, token,
+                    ha='center', va='center', fontsize=12, fontweight='bold')
+
+        # Move to next position with a small gap
+        current_pos += token_width + 0.05
+
+    # Set appropriate limits
+    ax.set_xlim(0, current_pos)
+    ax.set_ylim(0, 1)
+    ax.axis('off')
+    return fig
+
+
+@traced("heatmap.draw")
+def draw_heatmap(display_matrix, tokens, layer, head, font=None, figsize=None, annotate=None, title=None):
+    """Draw the annotated seaborn heatmap for one head (or any titled square matrix)."""
+    import seaborn as sns
+
+    plt = pyplot()
+    if annotate is None:
+        annotate = RENDER_SETTINGS["annotate"]
+    fig, ax = plt.subplots(figsize=figsize or RENDER_SETTINGS["heatmap_figsize"])
+    attention_cmap = create_attention_colormap()
+
+    sns.heatmap(display_matrix, cmap=attention_cmap, ax=ax,
+                xticklabels=tokens, yticklabels=tokens, annot=annotate, fmt='.2f')
+
+    # Apply font to tick labels if needed
+    if font is not None:
+        plt.setp(ax.get_xticklabels(), fontproperties=font, rotation=45, ha="right")
+        plt.setp(ax.get_yticklabels(), fontproperties=font)
+    else:
+        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+
+    ax.set_title(title or f"Layer {layer}, Head {head} Attention Matrix")
+    fig.tight_layout()
+    return fig
+
+
+@traced("figure.encode")
+def figure_to_bytes(fig, fmt=None, dpi=None):
+    """Encode a figure (same savefig defaults as st.pyplot) and free it."""
+    plt = pyplot()
+    buffer = io.BytesIO()
+    with _figure_lock:
+        fig.savefig(buffer, format=fmt or RENDER_SETTINGS["format"],
+                    dpi=dpi or RENDER_SETTINGS["dpi"], bbox_inches="tight")
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_figure(draw, fmt=None, dpi=None):
+    """Encoded bytes of the figure `draw()` returns, drawn and encoded under the figure lock.
+
+    Use this rather than calling a draw function directly whenever figures
+    may be drawn on more than one thread.
+    """
+    with _figure_lock:
+        return figure_to_bytes(draw(), fmt, dpi)
+
+
+@traced("heatmap.pool")
+def pool_matrix(matrix, max_cells):
+    """Max-pool a square matrix into at most `max_cells` blocks per axis.
+
+    Returns the pooled matrix and the block size. Max pooling keeps sharp
+    single-key peaks (sinks, previous token) visible after downsampling.
+    """
+    size = matrix.shape[0]
+    block = -(-size // max_cells)
+    if block <= 1:
+        return np.asarray(matrix, dtype=np.float32), 1
+    cells = -(-size // block)
+    padded = np.zeros((cells * block, cells * block), dtype=np.float32)
+    padded[:size, :size] = matrix
+    return padded.reshape(cells, block, cells, block).max(axis=(1, 3)), block
+
+
+def matrix_to_rgb(matrix, vmin=None, vmax=None):
+    """Map a matrix to RGB with one lookup into the attention colormap."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    vmin = float(np.nanmin(matrix)) if vmin is None else vmin
+    vmax = float(np.nanmax(matrix)) if vmax is None else vmax
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+    indices = np.clip((matrix - vmin) * scale, 0, 255).astype(np.uint8)
+    return attention_lut()[indices]
+
+
+def render_heatmap_image(display_matrix, pixels=None, max_cells=None):
+    """Encode the heatmap as a PNG without matplotlib.
+
+    Long sequences are pooled to `max_cells` per axis and short ones are
+    upscaled by pixel repetition, so the image (and the time to build it)
+    stays roughly the same size from a dozen to thousands of tokens.
+    """
+    max_cells = max_cells or RENDER_SETTINGS["image_max_cells"]
+    pooled, _ = pool_matrix(display_matrix, max_cells)
+    return render_pooled_image(pooled, pixels)
+
+
+@traced("heatmap.image")
+def render_pooled_image(pooled, pixels=None):
+    """Encode an already pooled grid (e.g. `SparseHead.pooled`) as a PNG heatmap."""
+    from PIL import Image
+
+    pixels = pixels or RENDER_SETTINGS["image_pixels"]
+    rgb = matrix_to_rgb(pooled)
+    scale = max(1, pixels // rgb.shape[0])
+    if scale > 1:
+        rgb = rgb.repeat(scale, axis=0).repeat(scale, axis=1)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def heatmap_cells(display_matrix, tokens, max_cells=INTERACTIVE_MAX_CELLS):
+    """Long-form table of (query, key, weight) cells for a hover heatmap."""
+    import pandas as pd
+
+    pooled, block = pool_matrix(display_matrix, max_cells)
+    cells = pooled.shape[0]
+    if block == 1:
+        labels = [f"{i}: {token}" for i, token in enumerate(tokens)]
+    else:
+        labels = [f"{i * block}-{min((i + 1) * block, len(tokens)) - 1}" for i in range(cells)]
+    rows, cols = np.indices(pooled.shape)
+    return pd.DataFrame({
+        "query_index": rows.ravel(),
+        "key_index": cols.ravel(),
+        "query": np.asarray(labels, dtype=object)[rows.ravel()],
+        "key": np.asarray(labels, dtype=object)[cols.ravel()],
+        "weight": pooled.ravel(),
+    }), block
+
+
+@traced("heatmap.interactive")
+def draw_interactive_heatmap(display_matrix, tokens, layer, head, max_cells=INTERACTIVE_MAX_CELLS, title=None):
+    """Altair heatmap that shows weights on hover instead of baked-in annotations."""
+    import altair as alt
+
+    cells, block = heatmap_cells(display_matrix, tokens, max_cells)
+    title = title or f"Layer {layer}, Head {head} Attention Matrix"
+    if block > 1:
+        title += f" (max over {block}x{block} token blocks)"
+    return alt.Chart(cells, title=title).mark_rect().encode(
+        x=alt.X("key:N", sort=None, title=None),
+        y=alt.Y("query:N", sort=None, title=None),
+        color=alt.Color("weight:Q", scale=alt.Scale(range=attention_palette())),
+        tooltip=["query", "key", alt.Tooltip("weight:Q", format=".3f")],
+    ).properties(width=700, height=600)
+
+
+def draw_diff_heatmap(difference, tokens, title, max_cells=INTERACTIVE_MAX_CELLS):
+    """Altair heatmap of a signed matrix (e.g. one model's attention minus another's), centred on zero."""
+    import altair as alt
+
+    cells, _ = heatmap_cells(difference, tokens, max_cells)
+    limit = max(float(np.abs(difference).max()), 1e-6)
+    return alt.Chart(cells, title=title).mark_rect().encode(
+        x=alt.X("key:N", sort=None, title=None),
+        y=alt.Y("query:N", sort=None, title=None),
+        color=alt.Color("weight:Q", scale=alt.Scale(scheme="redblue", domain=[-limit, limit], reverse=True),
+                        title="difference"),
+        tooltip=["query", "key", alt.Tooltip("weight:Q", format="+.3f")],
+    ).properties(width=700, height=600)
+
+
+def draw_head_grid(values, title, argmax_tokens=None, value_format=".3f"):
+    """Altair grid of one value per (layer, head), with hover details."""
+    import altair as alt
+    import pandas as pd
+
+    layers, heads = np.indices(values.shape)
+    cells = pd.DataFrame({
+        "layer": layers.ravel(),
+        "head": heads.ravel(),
+        "value": np.asarray(values, dtype=np.float32).ravel(),
+    })
+    tooltip = ["layer", "head", alt.Tooltip("value:Q", format=value_format)]
+    if argmax_tokens is not None:
+        cells["argmax_token"] = np.asarray(argmax_tokens, dtype=object).ravel()
+        tooltip.append("argmax_token")
+    return alt.Chart(cells, title=title).mark_rect().encode(
+        x=alt.X("head:O"),
+        y=alt.Y("layer:O"),
+        color=alt.Color("value:Q", scale=alt.Scale(range=attention_palette()), title=None),
+        tooltip=tooltip,
+    ).properties(width=min(60 * values.shape[1], 900), height=min(22 * values.shape[0], 700))
+
+
+def draw_layer_token_chart(values, tokens, title):
+    """Altair grid of (layer, token) values, e.g. the last token's rollout at every depth."""
+    import altair as alt
+    import pandas as pd
+
+    layers, positions = np.indices(values.shape)
+    labels = np.asarray([f"{i}: {token}" for i, token in enumerate(tokens)], dtype=object)
+    cells = pd.DataFrame({
+        "layer": layers.ravel(),
+        "token": labels[positions.ravel()],
+        "value": np.asarray(values, dtype=np.float32).ravel(),
+    })
+    return alt.Chart(cells, title=title).mark_rect().encode(
+        x=alt.X("token:N", sort=None, title=None),
+        y=alt.Y("layer:O"),
+        color=alt.Color("value:Q", scale=alt.Scale(range=attention_palette()), title=None),
+        tooltip=["layer", "token", alt.Tooltip("value:Q", format=".3f")],
+    ).properties(width=min(40 * values.shape[1], 900), height=min(22 * values.shape[0], 700))
+
+
+def draw_feature_grid(values, tokens, features, title):
+    """Altair grid of (feature, token) SAE activations; empty cells are features outside a token's top k."""
+    import altair as alt
+    import pandas as pd
+
+    rows, positions = np.indices(values.shape[::-1])
+    labels = np.asarray([f"{i}: {token}" for i, token in enumerate(tokens)], dtype=object)
+    cells = pd.DataFrame({
+        "feature": np.asarray(features)[rows.ravel()],
+        "token": labels[positions.ravel()],
+        "activation": np.asarray(values, dtype=np.float32).T.ravel(),
+    })
+    cells = cells[cells["activation"] > 0]
+    return alt.Chart(cells, title=title).mark_rect().encode(
+        x=alt.X("token:N", sort=list(labels), title=None),
+        y=alt.Y("feature:O", sort=[int(feature) for feature in features]),
+        color=alt.Color("activation:Q", scale=alt.Scale(range=attention_palette()), title=None),
+        tooltip=["feature", "token", alt.Tooltip("activation:Q", format=".2f")],
+    ).properties(width=min(40 * len(tokens), 900), height=min(22 * len(features), 700))
+
+
+def main():
+    """Font cache maintenance."""
+    parser = argparse.ArgumentParser(description="Rendering helpers.")
+    parser.add_argument("command", choices=["build-font-cache"])
+    parser.parse_args()
+    print(f"Wrote {build_font_cache()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""Columnar, memory-mapped attention store.
+
+Layout on disk (one directory per model):
+
+    attention_store/<model>/manifest.json
+    attention_store/<model>/outputs.json
+    attention_store/<model>/<trio>/<language>.npy      # (layers, heads, seq, seq)
+    attention_store/<model>/<trio>/<language>.tril.npy # or packed/sparse, see attention_codec
+    attention_store/<model>/activations/<tag>/<trio>/<language>.npy  # (seq, dim) or (layers, seq, dim)
+    attention_store/<model>/features/<sae>/<trio>/<language>.indices.npy  # top-k SAE features, see sae_features
+
+Every (prompt, language) pair is one contiguous float16 array so the app can
+memory-map it and slice a single head without reading the rest of the file.
+
+Corpus-sized stores are split into shards, each an ordinary store directory;
+the top-level manifest only maps prompt ids to shards (see ShardedStore):
+
+    attention_store/<model>/manifest.json               # {"shards": [...], "trios": {...}}
+    attention_store/<model>/shards/<shard>/manifest.json
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+
+import numpy as np
+
+from attention_codec import CODECS, HeadDecoder, decode_tensor, open_sink
+from word_spans import word_starts, words_from_starts
+
+STORE_ROOT = "attention_store"
+STORE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+OUTPUTS_NAME = "outputs.json"
+SHARDS_DIR = "shards"
+# Activation tag of full-depth residual-stream captures (extract_attention.capture_activations)
+ACTIVATIONS_TAG = "residual"
+# Manifest fields of an entry that name files on disk
+ENTRY_FILE_KEYS = ("file", "scales_file", "indices_file", "residual_file")
+
+
+def store_path(model_name, root=STORE_ROOT):
+    """Return the directory holding the store for a model."""
+    return os.path.join(root, model_name)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    """Write JSON atomically so readers never see a half-written manifest."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+class AttentionStore:
+    """Read-only view over a model's store; tensors are opened lazily as memmaps.
+
+    One instance is meant to be shared by every session of a process: arrays
+    are opened read-only, head slices are views into the page cache, and the
+    lazy opens are guarded by a lock.
+    """
+
+    def __init__(self, path, manifest=None):
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        self.manifest = manifest if manifest is not None else _read_json(manifest_path)
+        # Changes whenever the store is rebuilt; lets derived caches invalidate
+        self.version = os.stat(manifest_path).st_mtime_ns
+        self.model = self.manifest["model"]
+        self.num_layers = self.manifest["num_layers"]
+        self.num_heads = self.manifest["num_heads"]
+        self.entries = self.manifest["entries"]
+        self._outputs = None
+        self._arrays = {}
+        self._lock = threading.Lock()
+        self._decoder = HeadDecoder()
+
+    def trios(self):
+        return list(self.entries)
+
+    def languages(self, trio):
+        return list(self.entries.get(trio, {}))
+
+    def has_entry(self, trio, language):
+        return language in self.entries.get(trio, {})
+
+    def entry(self, trio, language):
+        return self.entries[trio][language]
+
+    def shard_name(self, trio):
+        """Shard holding a prompt; None for unsharded stores."""
+        return None
+
+    def prompt(self, trio, language):
+        return self.entry(trio, language)["prompt"]
+
+    def tokens(self, trio, language):
+        return self.entry(trio, language)["tokens"]
+
+    def word_starts(self, trio, language):
+        """Token index where each word starts (recorded when the entry was written)."""
+        entry = self.entry(trio, language)
+        if "word_starts" not in entry:
+            entry["word_starts"] = word_starts(entry["tokens"])
+        return entry["word_starts"]
+
+    def words(self, trio, language):
+        return words_from_starts(self.tokens(trio, language), self.word_starts(trio, language))
+
+    def generation(self, trio, language):
+        """Decoding settings of an entry captured during generation, or None."""
+        return self.entry(trio, language).get("generation")
+
+    def response(self, trio, language):
+        """Return the stored model response, or an empty string."""
+        with self._lock:
+            if self._outputs is None:
+                outputs_path = os.path.join(self.path, OUTPUTS_NAME)
+                if os.path.exists(outputs_path):
+                    with open(outputs_path, encoding="utf-8") as f:
+                        self._outputs = json.load(f)
+                else:
+                    self._outputs = {}
+        return self._outputs.get(trio, {}).get(language, "")
+
+    def _open(self, relative_path):
+        array = self._arrays.get(relative_path)
+        if array is None:
+            with self._lock:
+                array = self._arrays.get(relative_path)
+                if array is None:
+                    array = np.load(os.path.join(self.path, relative_path), mmap_mode="r")
+                    self._arrays[relative_path] = array
+        return array
+
+    def tensor(self, trio, language):
+        """(layers, heads, seq, seq) array for one prompt.
+
+        Dense entries are returned as a memmap; packed entries are decoded.
+        """
+        entry = self.entry(trio, language)
+        array = self._open(entry["file"])
+        codec = entry.get("codec", "dense")
+        if codec == "dense":
+            return array
+        if codec == "topk":
+            return self.sparse_tensor(trio, language).to_dense()
+        scales = self._open(entry["scales_file"]) if codec == "tril_q8" else None
+        return decode_tensor(array, entry["seq_len"], scales)
+
+    def head(self, trio, language, layer, head):
+        """Materialise a single (seq, seq) head; only its pages are read.
+
+        The array belongs to the caller: it can be kept, cached or compared
+        with other heads.
+        """
+        matrix = self.head_view(trio, language, layer, head)
+        return matrix.copy() if self.entry(trio, language).get("codec") in ("tril", "tril_q8") else matrix
+
+    def head_view(self, trio, language, layer, head):
+        """Like `head`, but packed entries decode into a per-thread buffer without copying.
+
+        The buffer is overwritten by the next head_view() of the same sequence
+        length on the same thread, so use the result before decoding another
+        head and never keep it (use `head` for that).
+        """
+        entry = self.entry(trio, language)
+        array = self._open(entry["file"])
+        codec = entry.get("codec", "dense")
+        if codec == "dense":
+            return np.asarray(array[layer, head])
+        if codec == "topk":
+            return self.sparse_tensor(trio, language).head(layer, head).to_dense()
+        scales = self._open(entry["scales_file"])[layer, head] if codec == "tril_q8" else None
+        return self._decoder.decode(array[layer, head], entry["seq_len"], scales)
+
+    def is_sparse(self, trio, language):
+        return self.entry(trio, language).get("codec") == "topk"
+
+    def sparse_tensor(self, trio, language):
+        """SparseTensor view of a top-k entry (see sparse_attention.py)."""
+        from sparse_attention import SparseTensor
+
+        entry = self.entry(trio, language)
+        return SparseTensor(self._open(entry["indices_file"]), self._open(entry["file"]),
+                            self._open(entry["residual_file"]), entry["seq_len"], entry["topk"])
+
+    def release(self, trio, language):
+        """Drop any open memmaps for an entry (e.g. before its files are replaced)."""
+        entry = self.entry(trio, language)
+        for key in ENTRY_FILE_KEYS:
+            self._arrays.pop(entry.get(key), None)
+
+    def activation_tags(self):
+        return list(self.manifest.get("activations", {}))
+
+    def activations(self, tag, trio, language):
+        """Memory-mapped activation array for one prompt."""
+        return self._open(self.manifest["activations"][tag][trio][language]["file"])
+
+    def activation_entry(self, tag, trio, language):
+        """Manifest entry of one activation array: prompt, tokens, shape and, for full-depth captures, layers."""
+        return self.manifest["activations"][tag][trio][language]
+
+    def feature_sets(self):
+        return list(self.manifest.get("features", {}))
+
+    def feature_info(self, name):
+        """SAE and capture settings of a feature set (see sae_features.encode_store)."""
+        return self.manifest["features"][name]["info"]
+
+    def has_features(self, name, trio, language):
+        return language in self.manifest.get("features", {}).get(name, {}).get("entries", {}).get(trio, {})
+
+    def features(self, name, trio, language):
+        """Memory-mapped (seq, k) feature ids and activations of one prompt; unused slots hold id -1."""
+        entry = self.manifest["features"][name]["entries"][trio][language]
+        return self._open(entry["indices_file"]), self._open(entry["values_file"])
+
+
+class ShardedStore:
+    """Read-only view over a corpus store split into shards of ordinary stores.
+
+    Prompt ids, texts and languages come from the top-level manifest, so
+    listing and searching the corpus never opens a shard; everything about an
+    entry (tokens, tensors, responses) is answered by its shard's
+    AttentionStore, opened on first use.
+    """
+
+    def __init__(self, path, manifest=None):
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        self.manifest = manifest if manifest is not None else _read_json(manifest_path)
+        self.version = os.stat(manifest_path).st_mtime_ns
+        self.model = self.manifest["model"]
+        self.num_layers = self.manifest["num_layers"]
+        self.num_heads = self.manifest["num_heads"]
+        self.index = self.manifest["trios"]
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def trios(self):
+        return list(self.index)
+
+    def languages(self, trio):
+        return list(self.index.get(trio, {}).get("prompts", {}))
+
+    def has_entry(self, trio, language):
+        return language in self.index.get(trio, {}).get("prompts", {})
+
+    def prompt(self, trio, language):
+        return self.index[trio]["prompts"][language]
+
+    def shard_name(self, trio):
+        return self.index[trio]["shard"]
+
+    def shard(self, name):
+        """AttentionStore of one shard, shared by every caller."""
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = AttentionStore(os.path.join(self.path, SHARDS_DIR, name))
+            return self._shards[name]
+
+    def _store(self, trio):
+        return self.shard(self.shard_name(trio))
+
+    def entry(self, trio, language):
+        return self._store(trio).entry(trio, language)
+
+    def tokens(self, trio, language):
+        return self._store(trio).tokens(trio, language)
+
+    def word_starts(self, trio, language):
+        return self._store(trio).word_starts(trio, language)
+
+    def words(self, trio, language):
+        return self._store(trio).words(trio, language)
+
+    def generation(self, trio, language):
+        return self._store(trio).generation(trio, language)
+
+    def response(self, trio, language):
+        return self._store(trio).response(trio, language)
+
+    def tensor(self, trio, language):
+        return self._store(trio).tensor(trio, language)
+
+    def head(self, trio, language, layer, head):
+        return self._store(trio).head(trio, language, layer, head)
+
+    def head_view(self, trio, language, layer, head):
+        return self._store(trio).head_view(trio, language, layer, head)
+
+    def is_sparse(self, trio, language):
+        return self._store(trio).is_sparse(trio, language)
+
+    def sparse_tensor(self, trio, language):
+        return self._store(trio).sparse_tensor(trio, language)
+
+    def release(self, trio, language):
+        self._store(trio).release(trio, language)
+
+    def activation_tags(self):
+        return []
+
+    def feature_sets(self):
+        return []
+
+
+def list_stores(root=STORE_ROOT):
+    """Names of the models with a store under `root`."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, MANIFEST_NAME)))
+
+
+def store_version(model_name, root=STORE_ROOT):
+    """Manifest mtime (see AttentionStore.version), or None when there is no store."""
+    try:
+        return os.stat(os.path.join(store_path(model_name, root), MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def open_store(model_name, root=STORE_ROOT):
+    """Open a model's store, or return None when it has not been built."""
+    path = store_path(model_name, root)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    manifest = _read_json(manifest_path)
+    if "shards" in manifest:
+        return ShardedStore(path, manifest)
+    return AttentionStore(path, manifest)
+
+
+class StoreWriter:
+    """Incrementally builds (or extends) a model's store directory."""
+
+    def __init__(self, model_name, root=STORE_ROOT, num_layers=None, num_heads=None, codec=None,
+                 topk=None):
+        self.path = store_path(model_name, root)
+        os.makedirs(self.path, exist_ok=True)
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {
+                "format": STORE_FORMAT,
+                "model": model_name,
+                "num_layers": num_layers,
+                "num_heads": num_heads,
+                "dtype": "float16",
+                "codec": "dense",
+                "entries": {},
+            }
+        if codec is not None:
+            if codec not in CODECS:
+                raise ValueError(f"Unknown codec {codec!r}; expected one of {CODECS}")
+            self.manifest["codec"] = codec
+        if topk is not None:
+            self.manifest["topk"] = topk
+        outputs_path = os.path.join(self.path, OUTPUTS_NAME)
+        if os.path.exists(outputs_path):
+            with open(outputs_path, encoding="utf-8") as f:
+                self.outputs = json.load(f)
+        else:
+            self.outputs = {}
+
+    def _check_shape(self, num_layers, num_heads):
+        for key, value in (("num_layers", num_layers), ("num_heads", num_heads)):
+            if self.manifest[key] is None:
+                self.manifest[key] = value
+            elif self.manifest[key] != value:
+                raise ValueError(f"{key} mismatch: store has {self.manifest[key]}, got {value}")
+
+    def create_tensor(self, trio, language, prompt, tokens, num_layers, num_heads):
+        """Register an entry and return a writable sink to fill layer by layer.
+
+        The sink is a dense memmap or an `attention_codec.EncodingSink`; both
+        accept `sink[layer] = (heads, seq, seq)`.
+        """
+        self._check_shape(num_layers, num_heads)
+        os.makedirs(os.path.join(self.path, trio), exist_ok=True)
+        # Unlink rather than overwrite: readers keep their memmaps and files
+        # hard-linked from the extraction cache are never written through
+        self._remove_files(trio, language)
+        seq_len = len(tokens)
+        codec = self.manifest.get("codec", "dense")
+        sink, fields = open_sink(self.path, os.path.join(trio, language), codec,
+                                 (num_layers, num_heads, seq_len, seq_len), self.manifest.get("topk"))
+        self.manifest["entries"].setdefault(trio, {})[language] = {
+            "prompt": prompt,
+            "tokens": list(tokens),
+            "seq_len": seq_len,
+            "word_starts": word_starts(tokens),
+            **fields,
+        }
+        return sink
+
+    def _remove_files(self, trio, language):
+        previous = self.manifest["entries"].get(trio, {}).get(language, {})
+        for key in ENTRY_FILE_KEYS:
+            if previous.get(key) and os.path.exists(os.path.join(self.path, previous[key])):
+                os.remove(os.path.join(self.path, previous[key]))
+
+    def link_entry(self, trio, language, entry, source_dir, num_layers, num_heads):
+        """Register an entry whose files already exist in `source_dir` (e.g. an extraction cache object).
+
+        The files are hard-linked into the store under the entry's usual names
+        (copied when `source_dir` is on another filesystem).
+        """
+        self._check_shape(num_layers, num_heads)
+        os.makedirs(os.path.join(self.path, trio), exist_ok=True)
+        self._remove_files(trio, language)
+        entry = dict(entry)
+        for key in ENTRY_FILE_KEYS:
+            if entry.get(key):
+                relative_path = os.path.join(trio, os.path.basename(entry[key]))
+                source = os.path.join(source_dir, os.path.basename(entry[key]))
+                try:
+                    os.link(source, os.path.join(self.path, relative_path))
+                except OSError:
+                    shutil.copyfile(source, os.path.join(self.path, relative_path))
+                entry[key] = relative_path
+        self.manifest["entries"].setdefault(trio, {})[language] = entry
+
+    def add_tensor(self, trio, language, prompt, tokens, attention):
+        """Write a complete (layers, heads, seq, seq) array for one prompt."""
+        num_layers, num_heads = attention.shape[:2]
+        sink = self.create_tensor(trio, language, prompt, tokens, num_layers, num_heads)
+        for layer in range(num_layers):
+            sink[layer] = attention[layer]
+        sink.flush()
+        del sink
+
+    def set_response(self, trio, language, response):
+        self.outputs.setdefault(trio, {})[language] = response
+
+    def set_generation(self, trio, language, generation):
+        """Record how an entry's response tokens were decoded (prompt length, seed, sampling)."""
+        self.manifest["entries"][trio][language]["generation"] = generation
+
+    def create_activations(self, tag, trio, language, prompt, tokens, shape, layers=None):
+        """Register an activation entry and return a writable float16 memmap of `shape`.
+
+        Full-depth captures pass the model layers they hold; `shape` is then
+        (len(layers), seq, dim).
+        """
+        relative_path = os.path.join("activations", tag, trio, f"{language}.npy")
+        path = os.path.join(self.path, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        entry = {
+            "prompt": prompt,
+            "tokens": list(tokens),
+            "shape": list(shape),
+            "file": relative_path,
+        }
+        if layers is not None:
+            entry["layers"] = list(layers)
+        self.manifest.setdefault("activations", {}).setdefault(tag, {}).setdefault(trio, {})[language] = entry
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=tuple(shape))
+
+    def add_activations(self, tag, trio, language, prompt, tokens, activations):
+        activations = np.asarray(activations)
+        sink = self.create_activations(tag, trio, language, prompt, tokens, activations.shape)
+        sink[...] = activations
+        sink.flush()
+        del sink
+
+    def add_features(self, name, trio, language, indices, values):
+        """Write one prompt's (seq, k) top-k SAE feature ids and activations."""
+        relative_stem = os.path.join("features", name, trio, language)
+        os.makedirs(os.path.dirname(os.path.join(self.path, relative_stem)), exist_ok=True)
+        entry = {"seq_len": len(indices), "indices_file": relative_stem + ".indices.npy",
+                 "values_file": relative_stem + ".values.npy"}
+        for key, array in (("indices_file", indices), ("values_file", values)):
+            path = os.path.join(self.path, entry[key])
+            if os.path.exists(path):
+                os.remove(path)
+            np.save(path, array)
+        feature_set = self.manifest.setdefault("features", {}).setdefault(name, {"info": {}, "entries": {}})
+        feature_set["entries"].setdefault(trio, {})[language] = entry
+
+    def set_feature_info(self, name, info):
+        self.manifest.setdefault("features", {}).setdefault(name, {"info": {}, "entries": {}})["info"] = info
+
+    def close(self):
+        """Write the manifest and outputs; call once all tensors are on disk."""
+        _write_json(os.path.join(self.path, MANIFEST_NAME), self.manifest)
+        _write_json(os.path.join(self.path, OUTPUTS_NAME), self.outputs)
+
+
+class ShardedStoreWriter:
+    """Builds a sharded corpus store one shard at a time.
+
+    Each shard is written by a StoreWriter under `shards/`; `add_shard`
+    indexes it in the top-level manifest, which is rewritten atomically so
+    readers (and a resumed extraction) only ever see complete shards.
+    """
+
+    def __init__(self, model_name, root=STORE_ROOT):
+        self.path = store_path(model_name, root)
+        self.shards_root = os.path.join(self.path, SHARDS_DIR)
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            self.manifest = _read_json(manifest_path)
+            if "shards" not in self.manifest:
+                raise ValueError(f"{self.path} holds an unsharded store; write the corpus under another name")
+        else:
+            self.manifest = {
+                "format": STORE_FORMAT,
+                "model": model_name,
+                "num_layers": None,
+                "num_heads": None,
+                "shards": [],
+                "trios": {},
+            }
+        os.makedirs(self.shards_root, exist_ok=True)
+
+    def has_shard(self, name):
+        return name in self.manifest["shards"]
+
+    def add_shard(self, name):
+        """Index a finished shard's prompts and publish the manifest."""
+        shard = AttentionStore(os.path.join(self.shards_root, name))
+        for key in ("num_layers", "num_heads"):
+            if self.manifest[key] is None:
+                self.manifest[key] = shard.manifest[key]
+            elif self.manifest[key] != shard.manifest[key]:
+                raise ValueError(f"{key} mismatch: store has {self.manifest[key]}, "
+                                 f"shard {name} has {shard.manifest[key]}")
+        for trio in shard.trios():
+            self.manifest["trios"][trio] = {
+                "shard": name,
+                "prompts": {lang: shard.prompt(trio, lang) for lang in shard.languages(trio)},
+            }
+        if name not in self.manifest["shards"]:
+            self.manifest["shards"].append(name)
+        _write_json(os.path.join(self.path, MANIFEST_NAME), self.manifest)
+
+
+def _stack_heads(attention):
+    """Turn the legacy layer -> head dict of (seq, seq) arrays into one 4-D array."""
+    layers = sorted(attention)
+    return np.stack([
+        np.stack([np.asarray(attention[layer][head], dtype=np.float16)
+                  for head in sorted(attention[layer])])
+        for layer in layers
+    ])
+
+
+def convert_attention_pickle(model_name, attention_path=None, output_path=None, root=STORE_ROOT,
+                             codec=None, topk=None):
+    """Migrate attention_data_<model>.pkl / output_data_<model>.pkl into the store."""
+    attention_path = attention_path or f"attention_data_{model_name}.pkl"
+    output_path = output_path or f"output_data_{model_name}.pkl"
+    with open(attention_path, "rb") as f:
+        attention_data = pickle.load(f)
+
+    writer = StoreWriter(model_name, root, codec=codec, topk=topk)
+    for trio_name, languages in attention_data.items():
+        for lang, record in languages.items():
+            # Older dumps stored layers directly under the language key
+            attention = record["attention"] if "attention" in record else {
+                key: value for key, value in record.items() if isinstance(key, int)}
+            writer.add_tensor(trio_name, lang, record["prompt"], record["tokens"],
+                              _stack_heads(attention))
+
+    if os.path.exists(output_path):
+        with open(output_path, "rb") as f:
+            output_data = pickle.load(f)
+        for trio_name, languages in output_data.items():
+            for lang, response in languages.items():
+                writer.set_response(trio_name, lang, response)
+
+    writer.close()
+    return writer.path
+
+
+def convert_activation_pickle(model_name, activation_path, tag, root=STORE_ROOT):
+    """Migrate an activations_<model>_<tag>.pkl dump into the store."""
+    with open(activation_path, "rb") as f:
+        activation_data = pickle.load(f)
+
+    writer = StoreWriter(model_name, root)
+    for trio_name, languages in activation_data.items():
+        for lang, record in languages.items():
+            activations = np.asarray(record["activations"])
+            # Drop the batch axis that some dumps kept: (1, seq, dim) -> (seq, dim)
+            if activations.ndim == 3 and activations.shape[0] == 1:
+                activations = activations[0]
+            writer.add_activations(tag, trio_name, lang, record["prompt"], record["tokens"],
+                                   activations)
+    writer.close()
+    return writer.path
+
+
+def convert_pickles(model_name, root=STORE_ROOT, codec=None, topk=None):
+    """Convert a model's legacy pickles in the working directory and build its indexes.
+
+    Yields one progress line per file written; nothing when there are no pickles.
+    """
+    from cross_lingual import build_comparison
+    from head_search import build_head_search
+    from head_stats import build_head_stats
+
+    attention_path = f"attention_data_{model_name}.pkl"
+    if os.path.exists(attention_path):
+        path = convert_attention_pickle(model_name, root=root, codec=codec, topk=topk)
+        yield f"Converted {attention_path} -> {path}"
+        store = open_store(model_name, root)
+        yield f"Wrote {build_head_stats(store)}"
+        yield f"Wrote {build_head_search(store)}"
+        yield f"Wrote {build_comparison(store)}"
+
+    prefix = f"activations_{model_name}_"
+    for filename in sorted(os.listdir(".")):
+        if filename.startswith(prefix) and filename.endswith(".pkl"):
+            tag = filename[len(prefix):-len(".pkl")]
+            path = convert_activation_pickle(model_name, filename, tag, root=root)
+            yield f"Converted {filename} -> {path} (activations '{tag}')"
+
+
+def main():
+    """Convert the legacy pickles in the working directory into the store."""
+    parser = argparse.ArgumentParser(description="Convert attention pickles into the memory-mapped store.")
+    parser.add_argument("models", nargs="*", default=["gemma2"], help="model names to convert")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    parser.add_argument("--codec", choices=CODECS, default=None,
+                        help="attention codec (default: keep the store's, 'dense' for new stores)")
+    parser.add_argument("--topk", type=int, default=None, help="keys kept per row for --codec topk")
+    args = parser.parse_intermixed_args()
+
+    for model_name in args.models:
+        if not os.path.exists(f"attention_data_{model_name}.pkl"):
+            print(f"Skipping {model_name}: attention_data_{model_name}.pkl not found")
+        for line in convert_pickles(model_name, args.root, args.codec, args.topk):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
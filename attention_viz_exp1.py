@@ -1,31 +1,34 @@
-import streamlit as st
-import pickle
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.colors import LinearSegmentedColormap
-import matplotlib.font_manager as fm
+import functools
+import json
 import os
+import threading
+import uuid
 
-# Page configuration
-st.set_page_config(page_title="Attention Visualization", layout="wide")
-
-# Set up fonts for Hindi/Devanagari text
-plt.rcParams['font.family'] = ['DejaVu Sans', 'Noto Sans Devanagari']
+import numpy as np
+import streamlit as st
 
-# Try to find and register Noto Sans Devanagari font
-font_paths = [
-    'fonts/NotoSansDevanagari-Regular.ttf',
-    'fonts/NotoSansDevanagari-Bold.ttf'
-]
+from attention_render import (ANNOTATION_TOKEN_LIMIT, DEVANAGARI_FONT_PATH, RENDER_SETTINGS, draw_diff_heatmap,
+                              draw_feature_grid, draw_head_grid, draw_heatmap,
+                              draw_interactive_heatmap, draw_layer_token_chart, draw_token_bar,
+                              get_font_for_language, has_font_for_language, last_token_attention,
+                              render_figure, render_heatmap_image, render_pooled_image, warm_up)
+from attention_store import convert_pickles, list_stores, open_store, store_version
+from corpus import PAGE_SIZE, PromptIndex, load_aggregates, page
+from cross_lingual import LANGUAGES, aligned_trios, load_comparison
+from head_search import TOP_K, load_head_search, query_terms, search_heads
+from head_stats import METRICS, compute_head_stats, load_head_stats
+from model_diff import ModelDiff
+from prefetch import Prefetcher, head_view_key, head_view_renders, neighbours, sweep_animation
+from render_cache import RenderCache, make_key
+from rollout import RESIDUAL_WEIGHT, Rollout
+from sae_features import load_feature_summary, prompt_features, strongest_features
+from tracing import TraceRecorder, deactivate, span
+from word_spans import pool_words
 
-devanagari_font = None
-for font_path in font_paths:
-    if os.path.exists(font_path):
-        devanagari_font = fm.FontProperties(fname=font_path)
-        break
+# Page configuration
+st.set_page_config(page_title="Attention Visualization", layout="wide")
 
-if devanagari_font is None:
+if DEVANAGARI_FONT_PATH is None:
     st.warning("Devanagari font not found. Hindi text may not display correctly.")
 
 # Custom CSS for styling
@@ -62,96 +65,492 @@ st.markdown("""
 # Title in main area
 st.markdown('<div class="main-header">Attention Visualization</div>', unsafe_allow_html=True)
 
-# Define prompts for reference
-all_prompts = {
-    "trio1": {
-        "english": "Will you please help me understand the concept of kinetic energy?",
-        "hindi": "क्या आप कृपया मुझे गतिज ऊर्जा की अवधारणा को समझने में मदद करेंगे?",
-        "hinglish": "Kya aap mujhe kinetic energy ke concept ko samajhne mein help karoge?"
-    },
-    "trio2": {
-        "english": "I want you to tell me a secret about the stars tonight.",
-        "hindi": "मैं चाहता हूँ कि आप आज रात मुझे सितारों के बारे में एक रहस्य बताएँ।",
-        "hinglish": "Main chahta hoon ki aaj raat aap mujhe stars ke baare mein ek secret batao."
-    },
-    "trio3": {
-        "english": "I understand kinetic energy.",
-        "hindi": "मुझे काइनेटिक ऊर्जा समझ आती है।",
-        "hinglish": "Mujhe kinetic energy samajh aata hai."
-    },
-    "trio4": {
-        "english": "Can you help me learn about gravity?",
-        "hindi": "क्या आप मुझे गुरुत्वाकर्षण के बारे में सिखा सकते हैं?",
-        "hinglish": "Kya aap mujhe gravity ke bare mein sikha sakte hain?"
-    }
-}
-
-# Load the attention and output data
-@st.cache_data
-def load_data(model_name="gemma2"):
-    attention_path = f"attention_data_{model_name}.pkl"
-    output_path = f"output_data_{model_name}.pkl"
-    
-    try:
-        with open(attention_path, 'rb') as f:
-            attention_data = pickle.load(f)
-        with open(output_path, 'rb') as f:
-            output_data = pickle.load(f)
-        return attention_data, output_data, True
-    except FileNotFoundError:
-        st.error(f"Data files for {model_name} not found.")
-        return {}, {}, False
+# Load the attention store once per process; every session and rerun slices
+# the same read-only memmaps (cache_data would pickle a copy per call). The
+# manifest version is part of the key so a rebuilt store replaces the old one.
+@st.cache_resource(max_entries=4)
+def load_data(model_name="gemma2", store_version=None):
+    store = open_store(model_name)
+    if store is None and os.path.exists(f"attention_data_{model_name}.pkl"):
+        # attention_store/ is not committed: build it from the shipped pickles on first use
+        with st.spinner(f"Building the attention store for {model_name} from its pickles..."):
+            for _ in convert_pickles(model_name, codec="tril"):
+                pass
+        store = open_store(model_name)
+    if store is None:
+        st.error(f"Attention store for {model_name} not found. "
+                 f"Run `python attention_store.py {model_name}` to build it.")
+        return None, False
+    return store, True
+
+# Per-head statistics index (built offline by head_stats.py); sharded corpus
+# stores keep one index per shard
+@st.cache_resource(max_entries=16)
+def load_stats(model_name, store_version, shard=None):
+    store, _ = load_data(model_name, store_version)
+    if store is None:
+        return None
+    return load_head_stats(store.shard(shard) if shard else store)
+
+# Running per-language means and variances over the whole corpus (corpus.py)
+@st.cache_resource(max_entries=4)
+def load_corpus_aggregates(model_name, store_version):
+    store, _ = load_data(model_name, store_version)
+    return load_aggregates(store) if store is not None else None
+
+# Searchable prompt ids and texts, read from the (top-level) manifest only
+@st.cache_resource(max_entries=4)
+def load_prompt_index(model_name, store_version):
+    store, _ = load_data(model_name, store_version)
+    return PromptIndex(store)
+
+# Word -> head inverted index (head_search.py); one part per shard of a corpus store
+@st.cache_resource(max_entries=8)
+def load_search_index(model_name, store_version):
+    store, _ = load_data(model_name, store_version)
+    return load_head_search(store) if store is not None else None
+
+# Cached cross-lingual comparison (built offline by cross_lingual.py)
+@st.cache_resource
+def load_language_comparison(model_name, store_version):
+    store, _ = load_data(model_name, store_version)
+    return load_comparison(store) if store is not None else None
+
+# Word-level attention for one prompt: the whole layers x heads tensor is
+# pooled at once, so every head's word view and statistics come for free
+@st.cache_resource(max_entries=64)
+def load_word_attention(model_name, store_version, trio_name, language):
+    store, _ = load_data(model_name, store_version)
+    return pool_words(store.tensor(trio_name, language), store.word_starts(trio_name, language))
+
+@st.cache_resource(max_entries=64)
+def load_word_stats(model_name, store_version, trio_name, language):
+    return compute_head_stats(load_word_attention(model_name, store_version, trio_name, language))
+
+# Attention rollout of one prompt; the layer prefixes computed so far are shared
+# by every session, so moving to another layer only multiplies the new layers
+@st.cache_resource(max_entries=64)
+def load_rollout(model_name, store_version, trio_name, language):
+    store, _ = load_data(model_name, store_version)
+    return Rollout(store, trio_name, language)
+
+# Two models' cached stores and head statistics aligned for comparison (model_diff.py)
+@st.cache_resource(max_entries=4)
+def load_model_comparison(model_a, version_a, model_b, version_b):
+    stats_a, stats_b = load_stats(model_a, version_a), load_stats(model_b, version_b)
+    if stats_a is None or stats_b is None:
+        return None
+    return ModelDiff(load_data(model_a, version_a)[0], stats_a, load_data(model_b, version_b)[0], stats_b)
+
+# Per-language firing counts of an SAE feature set (sae_features.py); per-token
+# features are small memmaps read straight from the store
+@st.cache_resource(max_entries=8)
+def load_sae_summary(model_name, store_version, feature_set):
+    store, _ = load_data(model_name, store_version)
+    return load_feature_summary(store, feature_set)
+
+# One render cache per process, shared by every session
+@st.cache_resource
+def get_render_cache():
+    return RenderCache()
+
+# Background renderer for the views next to the one on screen (prefetch.py)
+@st.cache_resource
+def get_prefetcher():
+    return Prefetcher(get_render_cache())
+
+# matplotlib/seaborn are imported lazily by the first figure; once the first
+# page is out, load them in the background so later figures don't wait
+@st.cache_resource
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name="figure-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# Debug panel: per-stage timings of this session's recent reruns. Spans are
+# only recorded while it is on; otherwise instrumentation is a no-op. The
+# checkbox is drawn further down, but its state is known here, so the whole
+# rerun (store loading and prompt search included) is recorded
+show_timing = st.session_state.get("show_timing", False)
+if show_timing:
+    trace_recorder = st.session_state.setdefault("trace_recorder", TraceRecorder())
+    trace_recorder.start_rerun()
+else:
+    deactivate()
 
 # ===== SIDEBAR CONTROLS =====
 st.sidebar.title("Visualization Controls")
 
-# Model selection in sidebar
-model_name = st.sidebar.selectbox("Select Model", ["gemma2", "Llama3.2"], index=0)
+# Head search opens a result by recording it as the navigation target: the
+# view, model, prompt, layer, head and language widgets are then re-created
+# under fresh keys with the target as their defaults (setting their values
+# through session state would fight the defaults below)
+VIEWS = ["Head detail", "Head search", "Rollout", "All-heads overview", "Language comparison",
+         "Model comparison", "SAE features"]
+LANGUAGE_OPTIONS = ["English", "Hindi", "Hinglish"]
+target = st.session_state.get("head_view_target", {})
+nav = target.get("count", 0)
 
-# Prompt selection in sidebar
-trio_name = st.sidebar.selectbox("Select Prompt", ["trio1", "trio2", "trio3", "trio4"], index=0)
+def open_head_view(model, trio, language, layer, head, query):
+    st.session_state["head_view_target"] = {
+        "count": st.session_state.get("head_view_target", {}).get("count", 0) + 1,
+        "model": model, "trio": trio, "query": query,
+        "language": language.title(), "layer": int(layer), "head": int(head),
+    }
+
+view_mode = st.sidebar.radio("View", VIEWS, index=0, key=f"view-{nav}")
+
+# Model selection in sidebar: every store on disk, gemma2 first (Llama3.2 and
+# corpus stores appear once extract_attention.py has built them)
+models = sorted(list_stores(), key=lambda name: name != "gemma2") or ["gemma2"]
+model_name = st.sidebar.selectbox("Select Model", models, key=f"model-{nav}",
+                                  index=models.index(target["model"]) if target.get("model") in models else 0)
+
+# Background prefetch: renders this session queued for its previous view are
+# dropped before anything competes with this rerun; views queue new ones in
+# `prefetch_jobs`, submitted once the page is out (end of script)
+prefetcher = get_prefetcher()
+prefetch_owner = st.session_state.setdefault("prefetch_owner", uuid.uuid4().hex)
+prefetcher.cancel(prefetch_owner)
+prefetch_jobs = []
 
-# Layer and head selection in sidebar
-max_layer = 25 if model_name == "gemma2" else 15  # Llama has 16 layers (0-15)
-layer = st.sidebar.number_input("Layer", min_value=0, max_value=max_layer, value=6, step=1)
+# Load data based on model selection
+with span("load_data"):
+    store, data_loaded = load_data(model_name, store_version(model_name))
+
+# Prompt selection in sidebar: search ids and prompt text in any language and
+# page through the matches, so corpus stores with thousands of triples stay usable
+trio_name = None
+if data_loaded:
+    prompt_index = load_prompt_index(model_name, store.version)
+    query = st.sidebar.text_input("Search prompts", target.get("query", ""), key=f"query-{nav}",
+                                  placeholder="id or words in any language")
+    with span("prompt_search"):
+        matches = prompt_index.search(query)
+    page_number = 1
+    if len(matches) > PAGE_SIZE:
+        page_number = st.sidebar.number_input("Results page", min_value=1,
+                                              max_value=-(-len(matches) // PAGE_SIZE), value=1, step=1)
+    options, pages = page(matches, page_number)
+    if query:
+        st.sidebar.caption(f"{len(matches)} of {len(prompt_index.trios)} prompts match"
+                           + (f" (page {page_number} of {pages})" if pages > 1 else ""))
+    trio_name = st.sidebar.selectbox("Select Prompt", options, format_func=prompt_index.label, key=f"trio-{nav}",
+                                     index=options.index(target["trio"]) if target.get("trio") in options else 0)
 
-max_head = 7 if model_name == "gemma2" else 31  # Gemma2 has 8 heads (0-7), Llama has 32 heads (0-31)
-head = st.sidebar.number_input("Head", min_value=0, max_value=max_head, value=0, step=1)
+# Layer and head selection in sidebar, bounded by the store's shape
+num_layers = store.num_layers if data_loaded else 1
+layer = st.sidebar.number_input("Layer", min_value=0, max_value=num_layers - 1, step=1, key=f"layer-{nav}",
+                                value=min(target.get("layer", 6), num_layers - 1))
+
+num_heads = store.num_heads if data_loaded else 1
+head = st.sidebar.number_input("Head", min_value=0, max_value=num_heads - 1, step=1, key=f"head-{nav}",
+                               value=min(target.get("head", 0), num_heads - 1))
 
 # Language selection in sidebar
 st.sidebar.markdown("### Select Language")
-language = st.sidebar.radio("Language", ["English", "Hindi", "Hinglish"], index=2)
+language = st.sidebar.radio("Language", LANGUAGE_OPTIONS, key=f"language-{nav}",
+                            index=LANGUAGE_OPTIONS.index(target["language"]) if "language" in target else 2)
 selected_language = language.lower()
 
-# Load data based on model selection
-attention_data, output_data, data_loaded = load_data(model_name)
+# Heatmap renderer: annotated seaborn for short prompts, a single-lookup image
+# for long ones, or an Altair chart that shows weights on hover
+heatmap_mode = st.sidebar.radio("Heatmap renderer", ["Auto", "Annotated", "Image", "Interactive"], index=0)
+
+# Word granularity pools subword tokens (e.g. ' गति' + 'ज') into whole words
+granularity = st.sidebar.radio("Granularity", ["Token", "Word"], index=0, horizontal=True)
+
+st.sidebar.checkbox("Timing panel", value=False, key="show_timing")
+
+# Top-k entries (long prompts) have no dense matrix to pool into words
+sparse_entry = data_loaded and store.has_entry(trio_name, selected_language) and store.is_sparse(trio_name, selected_language)
+if sparse_entry and granularity == "Word":
+    st.sidebar.caption("Word granularity is not available for top-k sparse entries; showing tokens.")
+    granularity = "Token"
 
 # Display model name in main area
 st.markdown(f"## {model_name.upper()}")
 
-# Function to create a custom colormap (red shades for attention)
-def create_attention_colormap():
-    colors = [(1, 1, 1), (1, 0.8, 0.8), (1, 0.6, 0.6), (1, 0.4, 0.4), (1, 0, 0)]
-    return LinearSegmentedColormap.from_list('attention_cmap', colors, N=100)
+if view_mode == "Head search":
+    # Threshold and top-k queries over every model's word -> head index; no
+    # attention tensor is opened, and a result opens in Head detail
+    indexes = {name: load_search_index(name, store_version(name)) for name in models}
+    missing = [name for name, parts in indexes.items() if parts is None]
+    indexes = {name: parts for name, parts in indexes.items() if parts is not None}
+    if missing:
+        st.caption(f"No head-search index for {', '.join(missing)}. "
+                   f"Run `python head_search.py build {' '.join(missing)}`.")
+    search_query = st.text_input("Words or tokens", "kinetic गतिज",
+                                 help="Alternatives separated by spaces, commas or slashes, in any language; "
+                                      "matched case-insensitively, whole words or single subword tokens")
+    threshold_col, k_col, language_col = st.columns([2, 1, 2])
+    threshold = threshold_col.slider("Minimum share of the last token's attention", min_value=0.0,
+                                     max_value=1.0, value=0.3, step=0.05)
+    top_k = k_col.number_input("Top k", min_value=1, max_value=1000, value=TOP_K, step=10)
+    search_languages = sorted({lang for parts in indexes.values() for index in parts for lang in index.languages})
+    chosen_languages = language_col.multiselect("Languages", search_languages, default=search_languages)
 
-# Function to get appropriate font based on language
-def get_font_for_language(language):
-    if language.lower() == "hindi" and devanagari_font is not None:
-        return devanagari_font
-    return None  # Use default font
+    with span("head_search"):
+        results = search_heads(indexes, search_query, threshold or None, int(top_k), chosen_languages)
+    if not indexes:
+        st.warning("No store has a head-search index yet.")
+    elif results.empty:
+        st.info(f"No head puts at least {threshold:.2f} of the last token's attention on these words.")
+        suggestions = sorted({term for parts in indexes.values() for index in parts
+                              for word in query_terms(search_query) for term in index.complete(word[:3])})
+        if suggestions:
+            st.caption("Indexed terms with the same start: " + ", ".join(suggestions[:20]))
+    else:
+        st.caption(f"{len(results)} heads, heaviest first: the share of the last token's attention that "
+                   f"falls on the word's tokens.")
+        st.dataframe(results, hide_index=True, column_config={"weight": st.column_config.NumberColumn(format="%.3f")})
+        labels = [f"{row.model} {row.trio}/{row.language} layer {row.layer} head {row.head} "
+                  f"({row.term}, {row.weight:.3f})" for row in results.itertuples()]
+        choice = st.selectbox("Result", range(len(results)), format_func=labels.__getitem__)
+        result = results.iloc[choice].to_dict()
+        # The prompt picker only lists one page of matches; search for the id
+        # when the prompt is not on the first page
+        result_prompts = load_prompt_index(result["model"], store_version(result["model"])).trios
+        st.button("Open in Head detail", on_click=open_head_view,
+                  disabled=result["language"].title() not in LANGUAGE_OPTIONS,
+                  args=(result["model"], result["trio"], result["language"], result["layer"], result["head"],
+                        "" if result["trio"] in page(result_prompts, 1)[0] else result["trio"]))
 
-if data_loaded:
+elif data_loaded and trio_name is None:
+    st.warning("No prompt matches the search.")
+
+elif data_loaded and view_mode == "All-heads overview":
+    # Every layer x head at once, drawn from the statistics index only
+    aggregates = load_corpus_aggregates(model_name, store.version)
+    scope = "This prompt"
+    if aggregates is not None and selected_language in aggregates.languages():
+        scope = st.radio("Statistic", ["This prompt", "Corpus mean", "Corpus std"], horizontal=True)
+    head_stats = None
+    if scope == "This prompt" and store.has_entry(trio_name, selected_language):
+        head_stats = load_stats(model_name, store.version, store.shard_name(trio_name))
+
+    if scope != "This prompt":
+        # Token-level running statistics over every prompt in this language
+        metric = st.selectbox("Metric", list(METRICS), format_func=METRICS.get)
+        values = (aggregates.mean if scope == "Corpus mean" else aggregates.std)(metric, selected_language)
+        st.altair_chart(draw_head_grid(values, f"{METRICS[metric]}: {scope.split()[1]} over "
+                                               f"{aggregates.count(selected_language)} {selected_language} prompts"))
+        st.caption("Running statistics accumulated while the corpus was extracted (token level).")
+    elif not store.has_entry(trio_name, selected_language):
+        st.warning(f"Data for {trio_name} not found in the loaded files. Please select another prompt.")
+    elif head_stats is None:
+        st.warning(f"No head statistics for {model_name}. Run `python head_stats.py {model_name}`.")
+    elif not head_stats.has_entry(trio_name, selected_language):
+        st.warning(f"Data for {trio_name} not found in the loaded files. Please select another prompt.")
+    else:
+        metric = st.selectbox("Metric", list(METRICS), format_func=METRICS.get)
+        if granularity == "Word":
+            word_stats = load_word_stats(model_name, store.version, trio_name, selected_language)
+            tokens = store.words(trio_name, selected_language)
+            values, argmax = word_stats[metric], word_stats["argmax"]
+        else:
+            tokens = store.tokens(trio_name, selected_language)
+            values = head_stats.metric(metric, trio_name, selected_language)
+            argmax = head_stats.argmax(trio_name, selected_language)
+        argmax_tokens = np.asarray(tokens, dtype=object)[argmax]
+        st.markdown(f"**Prompt:** {store.prompt(trio_name, selected_language)}")
+        st.altair_chart(draw_head_grid(values, f"{METRICS[metric]} for {selected_language} "
+                                               f"({granularity.lower()} level)",
+                                       argmax_tokens))
+        st.caption("Hover a cell for its value and the token the last position attends to most; "
+                   "switch to Head detail with that layer and head to inspect it.")
+
+elif data_loaded and view_mode == "Rollout":
+    # Head-averaged, residual-corrected attention chained through layers 0..layer
+    if not store.has_entry(trio_name, selected_language):
+        st.warning(f"Data for {trio_name} not found in the loaded files. Please select another prompt.")
+    elif sparse_entry:
+        st.warning("Rollout needs dense attention and is not available for top-k sparse entries.")
+    else:
+        rollout = load_rollout(model_name, store.version, trio_name, selected_language)
+        with span("rollout"):
+            rollout_matrix = rollout.at(layer)
+            last_rows = rollout.last_token_rollout(layer)
+        tokens = store.tokens(trio_name, selected_language)
+        if granularity == "Word":
+            starts = store.word_starts(trio_name, selected_language)
+            tokens = store.words(trio_name, selected_language)
+            rollout_matrix = pool_words(rollout_matrix, starts)
+            # Rollout rows are distributions over keys: sum each word's tokens
+            last_rows = np.add.reduceat(last_rows, starts, axis=-1)
+
+        st.markdown(f"{model_name.upper()}: attention rollout through layer {layer} for {selected_language} "
+                    f"(heads averaged, residual weight {RESIDUAL_WEIGHT})")
+        st.markdown(f"**Prompt:** {store.prompt(trio_name, selected_language)}")
+
+        st.markdown("#### Last token's rollout by layer")
+        hide_bos = st.checkbox("Hide the BOS sink", value=True)
+        row_tokens = tokens
+        if hide_bos and len(tokens) > 1:
+            last_rows, row_tokens = last_rows[:, 1:], tokens[1:]
+            last_rows = last_rows / np.maximum(last_rows.sum(axis=-1, keepdims=True), 1e-12)
+        st.altair_chart(draw_layer_token_chart(last_rows, row_tokens, f"Share of the last token's rollout "
+                                                                      f"({granularity.lower()} level)"))
+
+        st.markdown(f"#### Rollout matrix through layer {layer}")
+        render_cache = get_render_cache()
+        view_key = (model_name, store.version, trio_name, selected_language, int(layer), RESIDUAL_WEIGHT,
+                    tuple(sorted(RENDER_SETTINGS.items())), has_font_for_language(selected_language),
+                    granularity)
+        title = f"Attention rollout through layer {layer}"
+        if heatmap_mode in ("Auto", "Annotated", "Interactive") and len(tokens) <= ANNOTATION_TOKEN_LIMIT:
+            heatmap = render_cache.get_or_render(
+                make_key("rollout_heatmap", *view_key),
+                lambda: render_figure(lambda: draw_heatmap(rollout_matrix, tokens, layer, None,
+                                                           get_font_for_language(selected_language), title=title)))
+        else:
+            heatmap = render_cache.get_or_render(make_key("rollout_image", *view_key),
+                                                 lambda: render_heatmap_image(rollout_matrix))
+        st.image(heatmap, caption=f"{title} (rows = queries, columns = keys)")
+
+elif data_loaded and view_mode == "Language comparison":
+    # English / Hindi / Hinglish side by side for the selected layer and head
+    comparison = load_language_comparison(model_name, store.version)
+    has_aligned = bool(comparison.trios if comparison is not None else aligned_trios(store))
+    if not has_aligned:
+        st.warning(f"{model_name} has no prompt trios aligned across {', '.join(LANGUAGES)} "
+                   f"(`concept_alignments` in prompts.py), so there is nothing to compare.")
+    elif comparison is None:
+        st.warning(f"No cross-lingual comparison for {model_name}. Run `python cross_lingual.py {model_name}`.")
+    elif not comparison.has_trio(trio_name):
+        st.warning(f"Data for {trio_name} not found in the loaded files. Please select another prompt.")
+    else:
+        st.markdown(f"{model_name.upper()}: Layer {layer}, Head {head} last-token attention across languages")
+        render_cache = get_render_cache()
+        for lang, column in zip(LANGUAGES, st.columns(len(LANGUAGES))):
+            with column:
+                st.markdown(f"**{lang.capitalize()}:** {store.prompt(trio_name, lang)}")
+                tokens = store.tokens(trio_name, lang)
+                view_key = (model_name, store.version, trio_name, lang, int(layer), int(head),
+                            tuple(sorted(RENDER_SETTINGS.items())), has_font_for_language(lang))
+                with span("slice"):
+                    attn_matrix = store.head(trio_name, lang, layer, head)
+                st.image(render_cache.get_or_render(
+                    make_key("token_bar", *view_key),
+                    lambda: render_figure(lambda: draw_token_bar(tokens, last_token_attention(attn_matrix, tokens),
+                                                                 get_font_for_language(lang)))))
+                labels, masses = comparison.concept_mass(trio_name, lang, layer, head)
+                st.bar_chart(dict(zip(labels, masses.tolist())))
+
+        jsd = comparison.jsd(trio_name)
+        pair_stats = {name: f"{jsd[i, layer, head]:.3f}" for i, name in enumerate(comparison.pair_names)}
+        st.markdown("**Jensen-Shannon divergence (bits) for this head:** "
+                    + ", ".join(f"{name} {value}" for name, value in pair_stats.items()))
+
+        st.markdown("#### Mean divergence across language pairs")
+        st.altair_chart(draw_head_grid(jsd.mean(axis=0), "Mean Jensen-Shannon divergence (bits)"))
+
+        st.markdown("#### Most language-divergent heads")
+        st.dataframe(comparison.divergent_heads(trio_name), hide_index=True)
+
+elif data_loaded and view_mode == "Model comparison":
+    # The same prompt through another model: its layer at the same relative depth,
+    # the head there with the closest statistics, both pooled onto the prompt's words
+    other_models = [name for name in models if name != model_name]
+    diff = None
+    if other_models:
+        model_b = st.selectbox("Compare with", other_models)
+        with span("load_comparison"):
+            diff = load_model_comparison(model_name, store.version, model_b, store_version(model_b))
+    if not other_models:
+        st.warning("Only one model store was found. Extract another model with `python extract_attention.py "
+                   "--model-id <id> --name <name>` to compare.")
+    elif diff is None:
+        st.warning(f"No head statistics for {model_name} or {model_b}. Run `python head_stats.py {model_name} "
+                   f"{model_b}`.")
+    elif not diff.has_entry(trio_name, selected_language):
+        st.warning(f"{trio_name} ({selected_language}) is not in both stores with the same text. "
+                   f"Please select another prompt.")
+    else:
+        layer_b, head_b = diff.partner(layer, head)
+        st.markdown(f"{model_name.upper()} layer {layer}, head {head} vs {model_b.upper()} layer {layer_b}, "
+                    f"head {head_b} for {selected_language}")
+        st.caption(f"{model_b} layer at the same relative depth ({store.num_layers} vs {diff.b.store.num_layers} "
+                   f"layers); head with the closest statistics profile over {diff.shared_prompts} shared prompts "
+                   f"(distance {diff.distance[layer, head]:.2f}).")
+        st.markdown(f"**Prompt:** {store.prompt(trio_name, selected_language)}")
+
+        with span("slice"):
+            labels, matrix_a, matrix_b = diff.head_matrices(trio_name, selected_language, layer, head)
+        for name, (matrix, layer_shown, head_shown), column in zip(
+                (model_name, model_b), ((matrix_a, layer, head), (matrix_b, layer_b, head_b)), st.columns(2)):
+            with column:
+                st.altair_chart(draw_interactive_heatmap(matrix, labels, layer_shown, head_shown,
+                                                         title=f"{name}: layer {layer_shown}, head {head_shown}"))
+        st.altair_chart(draw_diff_heatmap(matrix_a - matrix_b, labels, f"{model_name} minus {model_b}"))
+        st.caption("Word-level attention (keys summed, queries averaged over each word's tokens); "
+                   f"{labels[0]} collects special tokens such as BOS.")
+
+        with span("divergence"):
+            depth_divergence = diff.layer_divergence(trio_name, selected_language)
+            divergent = diff.divergent_heads(trio_name, selected_language)
+        st.markdown(f"#### Last-token divergence by depth ({model_name} layer)")
+        st.line_chart({"Jensen-Shannon divergence (bits)": depth_divergence.tolist()})
+        st.markdown("#### Most divergent head pairs")
+        st.dataframe(divergent, hide_index=True)
+
+elif data_loaded and view_mode == "SAE features":
+    # Top-k SAE features per token: which features fire on one language and not the other
+    feature_sets = store.feature_sets()
+    summary = None
+    if feature_sets:
+        feature_set = st.selectbox("Feature set", feature_sets) if len(feature_sets) > 1 else feature_sets[0]
+        summary = load_sae_summary(model_name, store.version, feature_set)
+    if summary is None:
+        st.warning(f"No SAE features for {model_name}. Run `python extract_attention.py --activations`, then "
+                   f"`python sae_features.py encode {model_name} --sae <params.npz> --layer <N>`.")
+    else:
+        info = store.feature_info(feature_set)
+        languages = summary.languages()
+        column_a, column_b = st.columns(2)
+        language_a = column_a.selectbox("Compare", languages,
+                                        index=languages.index("hindi") if "hindi" in languages else 0)
+        language_b = column_b.selectbox("with", languages,
+                                        index=languages.index("hinglish") if "hinglish" in languages else 0)
+        st.markdown(f"{model_name.upper()}: layer {info['layer']} residual-stream SAE, {info['d_sae']} features "
+                    f"(top {info['k']} kept per token)")
+
+        st.markdown("#### Features by firing rate over all prompts")
+        st.caption(", ".join(f"{lang}: {summary.tokens(lang)} tokens, {summary.mean_l0(lang):.1f} active "
+                             f"features per token" for lang in dict.fromkeys([language_a, language_b])))
+        with span("feature_contrast"):
+            contrast = summary.contrast(language_a, language_b)
+        st.dataframe(contrast, hide_index=True)
+
+        st.markdown(f"#### Strongest features in {trio_name}")
+        prompt_languages = [lang for lang in dict.fromkeys([language_a, language_b])
+                            if store.has_features(feature_set, trio_name, lang)]
+        if not prompt_languages:
+            st.warning(f"No features for {trio_name} in {language_a} or {language_b}. Please select another prompt.")
+        else:
+            with span("prompt_features"):
+                features = strongest_features(store, feature_set, trio_name, prompt_languages)
+            for lang, column in zip(prompt_languages, st.columns(len(prompt_languages))):
+                with column:
+                    st.markdown(f"**{lang.capitalize()}:** {store.prompt(trio_name, lang)}")
+                    tokens = store.activation_entry(info["tag"], trio_name, lang)["tokens"]
+                    values = prompt_features(store, feature_set, trio_name, lang, features)
+                    st.altair_chart(draw_feature_grid(values, tokens, features, f"{lang.capitalize()} tokens"))
+            st.caption("Rows are this prompt's strongest features over both languages; a cell is empty where the "
+                       "feature is not among the token's top k.")
+
+elif data_loaded:
     # Check if the selected trio exists in the data
-    if trio_name not in attention_data:
+    if not store.has_entry(trio_name, selected_language):
         st.warning(f"Data for {trio_name} not found in the loaded files. Please select another prompt.")
     else:
         # Display the selected configuration
         st.markdown(f"{model_name.upper()}: Layer {layer}, Head {head} attention for {selected_language}")
         
         # Get the prompt, tokens, and model response
-        prompt = attention_data[trio_name][selected_language]["prompt"]
-        tokens = attention_data[trio_name][selected_language]["tokens"]
-        model_response = output_data[trio_name][selected_language]
+        prompt = store.prompt(trio_name, selected_language)
+        tokens = store.tokens(trio_name, selected_language)
+        model_response = store.response(trio_name, selected_language)
         
         # Display the prompt and model response
         st.markdown(f"**Prompt:** {prompt}")
@@ -161,90 +560,120 @@ if data_loaded:
                     '</div>', 
                     unsafe_allow_html=True)
         
-        # Get attention matrix
-        if "attention" in attention_data[trio_name][selected_language]:
-            attn_matrix = attention_data[trio_name][selected_language]["attention"][layer][head]
-        else:
-            attn_matrix = attention_data[trio_name][selected_language][layer][head]
+        # Get attention matrix (only this head's slice is read from disk, and
+        # only once a figure actually has to be drawn)
+        sparse_head = None
+        if granularity == "Word":
+            tokens = store.words(trio_name, selected_language)
+            word_attention = load_word_attention(model_name, store.version, trio_name, selected_language)
+        elif sparse_entry:
+            # Only the last row is densified; the heatmap is pooled from the kept entries
+            with span("slice"):
+                sparse_head = store.sparse_tensor(trio_name, selected_language).head(layer, head)
+                attn_matrix = sparse_head.last_row()[None, :]
+
+        # Entries captured during generation: scrub the query through the response
+        generation = store.generation(trio_name, selected_language)
+        query_position = None
+        if generation is not None and granularity == "Token" and sparse_head is None:
+            prompt_len = generation["prompt_len"]
+            query_position = st.select_slider(
+                "Decoding step (query token)", options=list(range(prompt_len - 1, len(tokens))),
+                value=len(tokens) - 1, format_func=lambda i: f"{i}: {tokens[i]!r}")
+            st.caption(f"Prompt is {prompt_len} tokens; {len(tokens) - prompt_len} generated with seed "
+                       f"{generation['seed']} ({'sampled' if generation['do_sample'] else 'greedy'}, "
+                       f"temperature {generation['temperature']}, top-p {generation['top_p']}).")
+            # The view up to a step is the causal prefix of the full matrix
+            tokens = tokens[:query_position + 1]
+
+        def view_matrix(layer, head):
+            """One head's attention as this view shows it (also called from prefetch threads)."""
+            with span("slice"):
+                if granularity == "Word":
+                    matrix = word_attention[layer, head]
+                else:
+                    matrix = store.head(trio_name, selected_language, layer, head)
+                return matrix[:len(tokens), :len(tokens)]
+
+        def view_renders(layer, head, mode):
+            key = head_view_key(model_name, store, trio_name, selected_language, layer, head, granularity,
+                                query_position)
+            return head_view_renders(key, mode, tokens, functools.partial(view_matrix, layer, head),
+                                     selected_language, layer, head)
         
         # Visualization container
         viz_container = st.container()
         
         with viz_container:
             # Token-level attention visualization
-            st.markdown("#### Token-level Attention")
-            
-            # Get the last row of attention matrix (how the last token attends to all previous tokens)
-            token_attention = attn_matrix[-1, :len(tokens)]
-            
-            # Normalize if needed
-            if np.sum(token_attention) > 0:
-                token_attention = token_attention / np.sum(token_attention)
+            st.markdown(f"#### {granularity}-level Attention")
             
-            # Create a horizontal bar for each token
-            fig, ax = plt.subplots(figsize=(10, 2))
-            
-            # Get font for the current language
-            font = get_font_for_language(selected_language)
-            
-            # Display tokens with colored backgrounds based on attention
-            current_pos = 0
-            for i, token in enumerate(tokens):
-                # Calculate text width (approximate)
-                token_width = len(token) * 0.1 + 0.2
-                
-                # Add colored rectangle based on attention weight
-                color_intensity = token_attention[i]
-                rect = plt.Rectangle((current_pos, 0), token_width, 0.8, 
-                                    color=(1, 1-color_intensity, 1-color_intensity), 
-                                    alpha=0.8)
-                ax.add_patch(rect)
-                
-                # Add token text with appropriate font
-                if font is not None:
-                    ax.text(current_pos + token_width/2, 0.4, token, 
-                            ha='center', va='center', fontsize=12, fontweight='bold',
-                            fontproperties=font)
-                else:
-                    ax.text(current_pos + token_width/2, 0.4, token, 
-                            ha='center', va='center', fontsize=12, fontweight='bold')
-                
-                # Move to next position with a small gap
-                current_pos += token_width + 0.05
-            
-            # Set appropriate limits
-            ax.set_xlim(0, current_pos)
-            ax.set_ylim(0, 1)
-            ax.axis('off')
-            
-            st.pyplot(fig)
-            
-            # Heatmap visualization
-            st.markdown("#### Attention Heatmap")
-            
-            # Create attention heatmap
-            fig, ax = plt.subplots(figsize=(10, 8))
-            attention_cmap = create_attention_colormap()
-            
-            # Ensure matrix dimensions match token count
-            display_matrix = attn_matrix[:len(tokens), :len(tokens)]
-            
-            # Create heatmap
-            sns.heatmap(display_matrix, cmap=attention_cmap, ax=ax, 
-                        xticklabels=tokens, yticklabels=tokens, annot=True, fmt='.2f')
-            
-            # Apply font to tick labels if needed
-            if font is not None:
-                plt.setp(ax.get_xticklabels(), fontproperties=font, rotation=45, ha="right")
-                plt.setp(ax.get_yticklabels(), fontproperties=font)
+            # Figures are keyed by the view plus render settings; repeat views
+            # are served as encoded images without touching (or even importing)
+            # matplotlib, and views prefetched in the background are picked up
+            render_cache = get_render_cache()
+            view_key = head_view_key(model_name, store, trio_name, selected_language, layer, head, granularity,
+                                     query_position)
+            if heatmap_mode == "Auto":
+                heatmap_mode = "Annotated" if len(tokens) <= ANNOTATION_TOKEN_LIMIT else "Image"
+
+            if sparse_head is not None:
+                st.image(render_cache.get_or_render(
+                    make_key("token_bar", *view_key),
+                    lambda: render_figure(lambda: draw_token_bar(tokens, last_token_attention(attn_matrix, tokens),
+                                                                 get_font_for_language(selected_language)))))
+                st.markdown("#### Attention Heatmap")
+                heatmap = render_cache.get_or_render(
+                    make_key("heatmap_sparse", *view_key),
+                    lambda: render_pooled_image(sparse_head.pooled(RENDER_SETTINGS["image_max_cells"])))
+                st.image(heatmap, caption=f"Layer {layer}, Head {head} top-{sparse_head.topk} attention "
+                                          f"({len(tokens)} tokens; rows = queries, columns = keys)")
             else:
-                plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-            
-            ax.set_title(f"Layer {layer}, Head {head} Attention Matrix")
-            plt.tight_layout()
-            
-            st.pyplot(fig)
-        
+                renders = view_renders(layer, head, heatmap_mode)
+                st.image(prefetcher.render(*renders["token_bar"]))
+
+                # Heatmap visualization
+                st.markdown("#### Attention Heatmap")
+                if heatmap_mode == "Interactive":
+                    st.altair_chart(draw_interactive_heatmap(view_matrix(layer, head), tokens, layer, head))
+                elif heatmap_mode == "Image":
+                    st.image(prefetcher.render(*renders["heatmap"]),
+                             caption=f"Layer {layer}, Head {head} Attention Matrix "
+                                     f"({len(tokens)} tokens; rows = queries, columns = keys)")
+                else:
+                    st.image(prefetcher.render(*renders["heatmap"]))
+
+                # Layer sweep: this head's heatmap through every layer as a looping
+                # animation. Frames are the (fast) image heatmaps, shared with
+                # stepping in Image mode and rendered on the prefetch workers
+                sweeping = st.checkbox(f"Sweep layers 0-{store.num_layers - 1} for head {head}", value=False)
+                if sweeping:
+                    frame_ms = st.slider("Frame duration (ms)", min_value=100, max_value=1000, value=300, step=50)
+
+                    def build_sweep():
+                        frame_renders = [view_renders(frame_layer, head, "Image")["heatmap"]
+                                         for frame_layer in range(store.num_layers)]
+                        for frame_render in frame_renders:
+                            prefetcher.prefetch({"heatmap": frame_render}, prefetch_owner)
+                        frames = [prefetcher.render(*frame_render) for frame_render in frame_renders]
+                        return sweep_animation(frames, frame_ms, [f"Layer {frame_layer}, Head {head}"
+                                                                  for frame_layer in range(store.num_layers)])
+
+                    with span("sweep"):
+                        sweep = render_cache.get_or_render(
+                            make_key("sweep", *view_key[:4], int(head), *view_key[6:], frame_ms), build_sweep)
+                    st.image(sweep, caption=f"Head {head} through layers 0-{store.num_layers - 1} "
+                                            f"({frame_ms} ms per layer; rows = queries, columns = keys)")
+
+                # Neighbouring layers and heads (and, while sweeping, the sweep
+                # frames of the neighbouring heads) render in the background
+                for neighbour_layer, neighbour_head in neighbours(layer, head, store.num_layers, store.num_heads):
+                    prefetch_jobs.append(view_renders(neighbour_layer, neighbour_head, heatmap_mode))
+                for neighbour_head in [head - 1, head + 1] if sweeping else []:
+                    if 0 <= neighbour_head < store.num_heads:
+                        prefetch_jobs.extend({"heatmap": view_renders(frame_layer, neighbour_head, "Image")["heatmap"]}
+                                             for frame_layer in range(store.num_layers))
+
         # Key observations
         st.markdown('<div class="observation-header">Key Observations:</div>', unsafe_allow_html=True)
         
@@ -253,7 +682,7 @@ if data_loaded:
             st.markdown('<div class="observation-item">• The semantic tokens related to "kinetic energy" receive higher attention</div>', unsafe_allow_html=True)
         elif trio_name == "trio2":
             st.markdown('<div class="observation-item">• The semantic tokens related to "stars" and "secret" receive higher attention</div>', unsafe_allow_html=True)
-        else:  # trio4
+        elif trio_name == "trio4":
             st.markdown('<div class="observation-item">• The semantic tokens related to "gravity" receive higher attention</div>', unsafe_allow_html=True)
         
         st.markdown('<div class="observation-item">• Key semantic terms maintain consistent focus across languages</div>', unsafe_allow_html=True)
@@ -264,3 +693,26 @@ if data_loaded:
 
 else:
     st.warning("Please make sure the data files are available in the current directory.")
+
+start_warm_up()
+
+# Render cache counters (shown after this rerun's lookups)
+counters = get_render_cache().counters()
+prefetch_stats = prefetcher.stats
+st.sidebar.caption(f"Render cache: {counters['memory_hits'] + counters['disk_hits']} hits "
+                   f"({counters['disk_hits']} from disk) / {counters['misses']} misses; "
+                   f"prefetched {prefetch_stats['used']} of {prefetch_stats['submitted']} figures used")
+
+if show_timing:
+    trace_recorder.finish_rerun(f"{view_mode}: {model_name} {trio_name}/{selected_language} "
+                                f"L{layer} H{head} {granularity.lower()}")
+    with st.expander("Timing: last reruns (ms per stage)", expanded=True):
+        st.dataframe([{name: round(value, 2) if isinstance(value, float) else value
+                       for name, value in row.items()}
+                      for row in reversed(trace_recorder.stage_breakdown())], hide_index=True)
+        st.download_button("Download Chrome trace", json.dumps(trace_recorder.chrome_trace()),
+                           file_name="attention_viz_trace.json", mime="application/json")
+
+# Queue the background renders last so they don't compete with this rerun
+for renders in prefetch_jobs:
+    prefetcher.prefetch(renders, prefetch_owner)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""Reproducible benchmarks for the viewer's load, slice and render paths.
+
+Synthetic stores with the real model shapes (Gemma2 26 layers x 8 heads,
+Llama 16 x 32) are generated once from a fixed seed under `--data` in every
+storage codec. Each (shape, codec, sequence length) case is then measured in a
+fresh process so timings start cold and peak RSS belongs to that case alone:
+
+- `load_ms`:        open the store (what the app's `load_data` does)
+- `cold_slice_ms`:  first head read with the entry's pages evicted from the page cache
+- `slice_ms`:       median head read over random (layer, head) pairs
+- `token_bar_ms`, `heatmap_annotated_ms`, `heatmap_image_ms`,
+  `heatmap_interactive_ms`: median render time of each renderer the app
+  would use for that case (None where the app would not use it)
+- `peak_rss_mib`:   peak resident memory of the measuring process
+
+Results are written as JSON together with the git commit, so two runs can be
+compared with `--compare`. Everything runs headless and downloads nothing.
+
+    python benchmark.py --quick                      # seq 13 and 256 only
+    python benchmark.py --output bench.json          # full suite (large: ~50 GB of data at 4096)
+    python benchmark.py --quick --compare bench_main.json
+    python benchmark.py --startup --output startup.json   # cold-start time to first render
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SHAPES = {"gemma2": (26, 8), "llama": (16, 32)}
+SEQ_LENS = (13, 256, 1024, 4096)
+QUICK_SEQ_LENS = (13, 256)
+DATA_ROOT = ".bench_data"
+TRIO = "synthetic"
+SEED = 0
+# A timing more than this much slower than the baseline is flagged by --compare
+REGRESSION_RATIO = 1.2
+
+
+def synthetic_head(seq_len, rng):
+    """Causal (seq, seq) attention with a BOS sink, a local window and noise, rows summing to 1."""
+    sink, local = rng.uniform(0.05, 0.8), rng.uniform(0.05, 0.6)
+    weights = rng.random((seq_len, seq_len), dtype=np.float32) ** 4 * 0.05
+    weights[:, 0] += sink
+    positions = np.arange(seq_len)
+    for offset in range(1, 4):
+        rows = positions[offset:]
+        weights[rows, rows - offset] += local / offset
+    weights[np.triu_indices(seq_len, 1)] = 0
+    weights /= weights.sum(axis=-1, keepdims=True)
+    return weights
+
+
+def dataset_language(seq_len):
+    return f"seq{seq_len}"
+
+
+def generate_datasets(shape_names, seq_lens, codecs, data_root=DATA_ROOT):
+    """Write any missing synthetic entries; every codec store gets the same heads."""
+    from attention_store import StoreWriter, open_store
+
+    for shape_name in shape_names:
+        num_layers, num_heads = SHAPES[shape_name]
+        for seq_len in seq_lens:
+            language = dataset_language(seq_len)
+            missing = []
+            for codec in codecs:
+                store = open_store(f"{shape_name}_{codec}", data_root)
+                if store is None or not store.has_entry(TRIO, language):
+                    missing.append(codec)
+            if not missing:
+                continue
+            print(f"Generating {shape_name} seq {seq_len} ({', '.join(missing)})", flush=True)
+            tokens = [""] + [f" t{i}" for i in range(1, seq_len)]
+            prompt = "".join(tokens)
+            writers = [StoreWriter(f"{shape_name}_{codec}", data_root, codec=codec) for codec in missing]
+            sinks = [writer.create_tensor(TRIO, language, prompt, tokens, num_layers, num_heads)
+                     for writer in writers]
+            # Seeded per (shape, length) so adding a case does not change the others
+            rng = np.random.default_rng([SEED, num_layers, num_heads, seq_len])
+            for layer in range(num_layers):
+                for head in range(num_heads):
+                    weights = synthetic_head(seq_len, rng)
+                    for sink in sinks:
+                        sink[layer, head] = weights
+            for writer, sink in zip(writers, sinks):
+                sink.flush()
+                writer.close()
+            del sinks
+
+
+def _evict(store, language):
+    """Drop an entry's files from the page cache so the next read is cold."""
+    from attention_store import ENTRY_FILE_KEYS
+
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    entry = store.entry(TRIO, language)
+    for key in ENTRY_FILE_KEYS:
+        if key in entry:
+            fd = os.open(os.path.join(store.path, entry[key]), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def _median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def measure_case(data_root, shape_name, codec, seq_len, repeat=5):
+    """Time one case; meant to run in a fresh process (see `run_benchmarks`)."""
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    import matplotlib.pyplot as plt
+
+    from attention_render import (ANNOTATION_TOKEN_LIMIT, RENDER_SETTINGS, draw_heatmap,
+                                  draw_interactive_heatmap, draw_token_bar, figure_to_bytes,
+                                  last_token_attention, render_heatmap_image, render_pooled_image)
+    from attention_store import open_store
+
+    language = dataset_language(seq_len)
+    model_name = f"{shape_name}_{codec}"
+    evicted = _evict(open_store(model_name, data_root), language)
+
+    start = time.perf_counter()
+    store = open_store(model_name, data_root)
+    load_ms = (time.perf_counter() - start) * 1000
+    tokens = store.tokens(TRIO, language)
+    sparse = store.is_sparse(TRIO, language)
+
+    def read_head(layer, head):
+        if sparse:
+            return store.sparse_tensor(TRIO, language).head(layer, head)
+        return store.head(TRIO, language, layer, head)
+
+    start = time.perf_counter()
+    view = read_head(store.num_layers // 2, store.num_heads // 2)
+    cold_slice_ms = (time.perf_counter() - start) * 1000
+
+    rng = np.random.default_rng(SEED)
+    pairs = itertools.cycle([(int(rng.integers(store.num_layers)), int(rng.integers(store.num_heads)))
+                             for _ in range(repeat)])
+    slice_ms = _median_ms(lambda: read_head(*next(pairs)), repeat)
+
+    def render_figure(draw):
+        figure_to_bytes(draw())
+        plt.close("all")
+
+    if sparse:
+        last_row = view.last_row()[None, :]
+        token_bar_ms = _median_ms(lambda: render_figure(
+            lambda: draw_token_bar(tokens, last_token_attention(last_row, tokens))), repeat)
+        heatmap_image_ms = _median_ms(
+            lambda: render_pooled_image(view.pooled(RENDER_SETTINGS["image_max_cells"])), repeat)
+        annotated_ms = interactive_ms = None
+    else:
+        token_bar_ms = _median_ms(lambda: render_figure(
+            lambda: draw_token_bar(tokens, last_token_attention(view, tokens))), repeat)
+        heatmap_image_ms = _median_ms(lambda: render_heatmap_image(view), repeat)
+        interactive_ms = _median_ms(lambda: draw_interactive_heatmap(view, tokens, 0, 0).to_dict(), repeat)
+        annotated_ms = None
+        if seq_len <= ANNOTATION_TOKEN_LIMIT:
+            annotated_ms = _median_ms(lambda: render_figure(lambda: draw_heatmap(view, tokens, 0, 0)), repeat)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "shape": shape_name,
+        "layers": store.num_layers,
+        "heads": store.num_heads,
+        "codec": codec,
+        "seq_len": seq_len,
+        "cold": evicted,
+        "load_ms": load_ms,
+        "cold_slice_ms": cold_slice_ms,
+        "slice_ms": slice_ms,
+        "token_bar_ms": token_bar_ms,
+        "heatmap_annotated_ms": annotated_ms,
+        "heatmap_image_ms": heatmap_image_ms,
+        "heatmap_interactive_ms": interactive_ms,
+        "peak_rss_mib": (peak if sys.platform == "darwin" else peak * 1024) / 2**20,
+    }
+
+
+# Runs in a fresh interpreter: seconds to import streamlit's test harness and to
+# finish the app's first script run (default sidebar selection)
+_FIRST_RENDER_PROBE = """
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+app.run()
+assert not app.exception, app.exception
+print(imported - start, time.perf_counter() - imported)
+"""
+
+# (name, render cache already filled by an earlier process, e.g. a restarted container)
+STARTUP_SCENARIOS = (
+    ("empty render cache", False),
+    ("warm render cache", True),
+)
+
+
+def time_to_first_render(runs=3, repo=None):
+    """First-rerun time of a new app process with an empty matplotlib cache, per scenario.
+
+    Each run gets a fresh working directory (empty render cache) and
+    MPLCONFIGDIR (no font list), like a new container; the store is symlinked.
+    """
+    repo = repo or os.path.dirname(os.path.abspath(__file__))
+    app_path = os.path.join(repo, "attention_viz_exp1.py")
+
+    def first_render(work):
+        env = dict(os.environ, MPLCONFIGDIR=tempfile.mkdtemp(dir=work))
+        output = subprocess.run([sys.executable, "-c", _FIRST_RENDER_PROBE, app_path], cwd=work,
+                                env=env, capture_output=True, text=True, check=True).stdout
+        return float(output.split()[-1])
+
+    rows = []
+    for name, warm_cache in STARTUP_SCENARIOS:
+        timings = []
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory() as work:
+                os.symlink(os.path.join(repo, "attention_store"), os.path.join(work, "attention_store"))
+                if warm_cache:
+                    first_render(work)
+                timings.append(first_render(work))
+        rows.append({"scenario": name, "median_ms": float(np.median(timings) * 1000),
+                     "min_ms": float(np.min(timings) * 1000)})
+        print(f"{name:<20}{rows[-1]['median_ms']:8.0f} ms (min {rows[-1]['min_ms']:.0f})", flush=True)
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(shape_names, seq_lens, codecs, data_root=DATA_ROOT, repeat=5):
+    """Generate missing data, then measure every case in its own process."""
+    generate_datasets(shape_names, seq_lens, codecs, data_root)
+    # maxtasksperchild=1: a fresh interpreter (cold imports, clean RSS) per case
+    pool = multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1)
+    results = []
+    try:
+        for shape_name in shape_names:
+            for seq_len in seq_lens:
+                for codec in codecs:
+                    row = pool.apply(measure_case, (data_root, shape_name, codec, seq_len, repeat))
+                    print(f"{shape_name:<8}{codec:<9}{seq_len:>6}  load {row['load_ms']:7.1f} ms  "
+                          f"slice {row['slice_ms']:8.2f} ms  image {row['heatmap_image_ms']:7.1f} ms  "
+                          f"token bar {row['token_bar_ms']:8.1f} ms  rss {row['peak_rss_mib']:6.0f} MiB",
+                          flush=True)
+                    results.append(row)
+    finally:
+        pool.close()
+        pool.join()
+    return {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current, baseline, ratio=REGRESSION_RATIO):
+    """Lines describing every timing that changed by more than `ratio` against a baseline run."""
+    key = lambda row: (row["shape"], row["codec"], row["seq_len"])
+    previous = {key(row): row for row in baseline["results"]}
+    lines = []
+    for row in current["results"]:
+        old = previous.get(key(row))
+        if old is None:
+            continue
+        for metric, value in row.items():
+            if not metric.endswith(("_ms", "_mib")) or value is None or not old.get(metric):
+                continue
+            change = value / old[metric]
+            if change > ratio or change < 1 / ratio:
+                label = "slower" if change > 1 else "faster"
+                if metric.endswith("_mib"):
+                    label = "more" if change > 1 else "less"
+                lines.append(f"{'/'.join(map(str, key(row)))} {metric}: {old[metric]:.2f} -> {value:.2f} "
+                             f"({change:.2f}x {label})")
+    return lines
+
+
+def main():
+    """Run the benchmark suite and write machine-readable results."""
+    from attention_codec import CODECS
+
+    parser = argparse.ArgumentParser(description="Benchmark load, slice and render paths on synthetic data.")
+    parser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=None,
+                        help=f"sequence lengths (default: {' '.join(map(str, SEQ_LENS))})")
+    parser.add_argument("--codecs", nargs="+", choices=CODECS, default=list(CODECS))
+    parser.add_argument("--quick", action="store_true",
+                        help=f"only sequence lengths {' '.join(map(str, QUICK_SEQ_LENS))}")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repetitions per measurement")
+    parser.add_argument("--data", default=DATA_ROOT, help="directory for the synthetic stores")
+    parser.add_argument("--output", default="benchmark.json", help="results file")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--startup", action="store_true",
+                        help="only measure the app's time to first render on a cold start")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = {"commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                  "startup": time_to_first_render(args.repeat)}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        return 0
+
+    seq_lens = args.seq_lens or (QUICK_SEQ_LENS if args.quick else SEQ_LENS)
+    report = run_benchmarks(args.shapes, seq_lens, args.codecs, args.data, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        changes = compare(report, baseline)
+        print(f"Against {args.compare} ({baseline.get('commit')}): "
+              f"{len(changes)} change(s) beyond {REGRESSION_RATIO}x")
+        for line in changes:
+            print(f"  {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
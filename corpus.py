@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""Prompt corpora: JSONL reading, prompt search and streaming per-head aggregates.
+
+A corpus is a JSONL file with one prompt triple per line; `id` is optional
+(the line number is used otherwise) and any subset of the languages may be
+present:
+
+    {"id": "physics-0001", "english": "...", "hindi": "...", "hinglish": "..."}
+
+`extract_attention.py --corpus prompts.jsonl` streams it into a sharded store
+(attention_store.ShardedStore) `SHARD_SIZE` triples at a time. After each
+shard is written its per-head statistics are folded into running means and
+variances per language (Chan et al.'s pairwise update), so the corpus-wide
+aggregates cost one pass and one shard of memory and the corpus itself is
+never held in memory.
+
+    python corpus.py aggregate gemma2        # (re)build aggregates from the head-stats indices
+    python corpus.py search corpus "gravity"  # ids of matching prompts
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from attention_store import STORE_ROOT, open_store
+from cross_lingual import LANGUAGES
+from head_stats import METRICS, load_head_stats
+
+SHARD_SIZE = 256
+PAGE_SIZE = 50
+AGGREGATES_NAME = "aggregates.npz"
+
+
+def read_corpus(path):
+    """Yield (prompt id, {language: prompt}) for every line of a JSONL corpus."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            prompts = {lang: record[lang] for lang in LANGUAGES if record.get(lang)}
+            if not prompts:
+                raise ValueError(f"{path}:{line_number}: no prompt in any of {LANGUAGES}")
+            yield str(record.get("id", f"p{line_number:06d}")), prompts
+
+
+def shard_name(index):
+    return f"shard-{index:05d}"
+
+
+def iter_shards(path, shard_size=SHARD_SIZE):
+    """Yield (shard name, {prompt id: {language: prompt}}) chunks of a corpus."""
+    shard = {}
+    index = 0
+    for trio, prompts in read_corpus(path):
+        if trio in shard:
+            raise ValueError(f"Duplicate prompt id {trio!r} in {path}")
+        shard[trio] = prompts
+        if len(shard) == shard_size:
+            yield shard_name(index), shard
+            shard = {}
+            index += 1
+    if shard:
+        yield shard_name(index), shard
+
+
+class RunningStats:
+    """Running mean and variance of equally shaped arrays, updated a batch at a time."""
+
+    def __init__(self, shape, count=0, mean=None, m2=None):
+        self.count = count
+        self.mean = np.zeros(shape) if mean is None else mean
+        self.m2 = np.zeros(shape) if m2 is None else m2
+
+    def update(self, values):
+        """Fold in a (n, *shape) batch; merging batch moments keeps the update stable."""
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+
+    def variance(self):
+        """Sample variance (zero until two values have been seen)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self.m2)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+
+class CorpusAggregates:
+    """Running (layers, heads) statistics of every head-stats metric, per language."""
+
+    def __init__(self, stats=None, shards=()):
+        self.stats = stats or {}
+        self.shards = set(shards)
+
+    def add_head_stats(self, head_stats, shard):
+        """Fold one shard's HeadStats index in; a shard already folded is ignored."""
+        if shard in self.shards:
+            return
+        keys = head_stats.arrays["keys"].tolist()
+        for lang in LANGUAGES:
+            rows = [i for i, key in enumerate(keys) if key.rsplit("/", 1)[1] == lang]
+            if not rows:
+                continue
+            for metric in METRICS:
+                values = head_stats.arrays[metric][rows]
+                if (lang, metric) not in self.stats:
+                    self.stats[lang, metric] = RunningStats(values.shape[1:])
+                self.stats[lang, metric].update(values)
+        self.shards.add(shard)
+
+    def languages(self):
+        return [lang for lang in LANGUAGES if (lang, "entropy") in self.stats]
+
+    def count(self, language):
+        return self.stats[language, "entropy"].count
+
+    def mean(self, metric, language):
+        return self.stats[language, metric].mean
+
+    def std(self, metric, language):
+        return self.stats[language, metric].std()
+
+    def save(self, path):
+        arrays = {"shards": np.array(sorted(self.shards))}
+        for (lang, metric), stats in self.stats.items():
+            arrays[f"{lang}/{metric}/count"] = np.array(stats.count)
+            arrays[f"{lang}/{metric}/mean"] = stats.mean
+            arrays[f"{lang}/{metric}/m2"] = stats.m2
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            stats = {}
+            for name in data.files:
+                if name.endswith("/count"):
+                    lang, metric, _ = name.split("/")
+                    prefix = f"{lang}/{metric}"
+                    stats[lang, metric] = RunningStats(data[f"{prefix}/mean"].shape, int(data[name]),
+                                                       data[f"{prefix}/mean"], data[f"{prefix}/m2"])
+            return cls(stats, data["shards"].tolist())
+
+
+def load_aggregates(store):
+    """Return the store's CorpusAggregates, or None when they have not been built."""
+    path = os.path.join(store.path, AGGREGATES_NAME)
+    if not os.path.exists(path):
+        return None
+    return CorpusAggregates.load(path)
+
+
+def build_aggregates(store):
+    """Fold every shard's head-stats index (or the store's own) into fresh aggregates."""
+    aggregates = CorpusAggregates()
+    shards = store.manifest.get("shards")
+    for name in shards if shards is not None else [store.model]:
+        head_stats = load_head_stats(store.shard(name) if shards is not None else store)
+        if head_stats is None:
+            raise FileNotFoundError(f"No head statistics for {name}; run head_stats.py first")
+        aggregates.add_head_stats(head_stats, name)
+    path = os.path.join(store.path, AGGREGATES_NAME)
+    aggregates.save(path)
+    return path
+
+
+class PromptIndex:
+    """Case-insensitive substring search over prompt ids and texts, in corpus order."""
+
+    def __init__(self, store):
+        self.store = store
+        self.trios = store.trios()
+        self.texts = ["\n".join([trio] + [store.prompt(trio, lang) for lang in store.languages(trio)]).casefold()
+                      for trio in self.trios]
+
+    def search(self, query):
+        """Ids whose id or prompts contain every whitespace-separated term of `query`."""
+        terms = query.casefold().split()
+        if not terms:
+            return list(self.trios)
+        return [trio for trio, text in zip(self.trios, self.texts) if all(term in text for term in terms)]
+
+    def label(self, trio, width=60):
+        """Id plus the start of the prompt's first language, for select boxes."""
+        languages = self.store.languages(trio)
+        text = self.store.prompt(trio, languages[0]) if languages else ""
+        return f"{trio}: {text[:width]}{'…' if len(text) > width else ''}"
+
+
+def page(items, number, page_size=PAGE_SIZE):
+    """Items on 1-based page `number` and the page count."""
+    pages = max(1, -(-len(items) // page_size))
+    number = min(max(number, 1), pages)
+    return items[(number - 1) * page_size:number * page_size], pages
+
+
+def main():
+    """Rebuild corpus aggregates or search a store's prompts."""
+    parser = argparse.ArgumentParser(description="Corpus aggregates and prompt search.")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    aggregate = commands.add_parser("aggregate", help="rebuild per-language running statistics")
+    aggregate.add_argument("models", nargs="*", default=["gemma2"])
+    search = commands.add_parser("search", help="list prompt ids matching a query")
+    search.add_argument("model")
+    search.add_argument("query")
+    args = parser.parse_args()
+
+    if args.command == "search":
+        store = open_store(args.model, args.root)
+        if store is None:
+            print(f"No store for {args.model} under {args.root}")
+            return 1
+        index = PromptIndex(store)
+        for trio in index.search(args.query):
+            print(index.label(trio))
+        return 0
+
+    for model_name in args.models:
+        store = open_store(model_name, args.root)
+        if store is None:
+            print(f"Skipping {model_name}: no store under {args.root}")
+            continue
+        path = build_aggregates(store)
+        aggregates = load_aggregates(store)
+        counts = ", ".join(f"{lang} {aggregates.count(lang)}" for lang in aggregates.languages())
+        print(f"Wrote {path} ({counts} prompts)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
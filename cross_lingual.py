@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Cross-lingual comparison of last-token attention over English/Hindi/Hinglish trios.
+
+Languages tokenise the same sentence very differently, so distributions are
+compared over aligned *concept slots* rather than raw tokens: the BOS sink,
+one slot per concept in `prompts.concept_alignments` (e.g. "kinetic energy" /
+"गतिज ऊर्जा") and an "other" slot with the remaining mass. For every trio
+and language pair, Jensen-Shannon divergence and Spearman rank correlation
+are computed for all layers and heads at once from the head statistics index
+and cached next to the store.
+"""
+import argparse
+import itertools
+import os
+import sys
+
+import numpy as np
+
+from attention_store import STORE_ROOT, open_store
+from head_stats import load_head_stats
+from prompts import concept_alignments
+
+COMPARISON_NAME = "cross_lingual.npz"
+LANGUAGES = ("english", "hindi", "hinglish")
+PAIRS = tuple(itertools.combinations(range(len(LANGUAGES)), 2))
+
+
+def token_char_spans(tokens, prompt):
+    """(start, end) character offsets of each decoded token within the prompt."""
+    spans = []
+    position = 0
+    for token in tokens:
+        if prompt.startswith(token, position):
+            start = position
+        else:
+            # Decoding can normalise whitespace; fall back to searching ahead
+            found = prompt.find(token.strip(), position) if token.strip() else -1
+            start = found if found >= 0 else position
+        end = start + len(token) if prompt.startswith(token, start) else start + len(token.strip())
+        spans.append((start, end))
+        position = end
+    return spans
+
+
+def concept_assignment(tokens, prompt, phrases):
+    """One-hot (seq, slots) matrix mapping tokens to [BOS, concepts..., other]."""
+    assignment = np.zeros((len(tokens), len(phrases) + 2), dtype=np.float32)
+    lowered = prompt.lower()
+    concept_spans = []
+    for phrase in phrases:
+        start = lowered.find(phrase.lower())
+        if start < 0:
+            raise ValueError(f"Concept {phrase!r} not found in prompt {prompt!r}")
+        concept_spans.append((start, start + len(phrase)))
+
+    for i, (start, end) in enumerate(token_char_spans(tokens, prompt)):
+        if i == 0 and end == start:
+            assignment[i, 0] = 1  # BOS: decodes to an empty string
+            continue
+        for slot, (concept_start, concept_end) in enumerate(concept_spans, start=1):
+            if start < concept_end and end > concept_start and end > start:
+                assignment[i, slot] = 1
+                break
+        else:
+            assignment[i, -1] = 1
+    return assignment
+
+
+def jensen_shannon(p, q, axis=-1):
+    """Jensen-Shannon divergence in bits (0 = identical, 1 = disjoint)."""
+    m = 0.5 * (p + q)
+
+    def kl(a, b):
+        ratio = np.divide(a, b, out=np.ones_like(a), where=(a > 0) & (b > 0))
+        return (a * np.log2(ratio)).sum(axis=axis)
+
+    return 0.5 * kl(p, m) + 0.5 * kl(q, m)
+
+
+def spearman(x, y, axis=-1):
+    """Spearman rank correlation along `axis` (ties broken by position)."""
+    rx = np.argsort(np.argsort(x, axis=axis), axis=axis).astype(np.float32)
+    ry = np.argsort(np.argsort(y, axis=axis), axis=axis).astype(np.float32)
+    rx -= rx.mean(axis=axis, keepdims=True)
+    ry -= ry.mean(axis=axis, keepdims=True)
+    denominator = np.sqrt((rx ** 2).sum(axis=axis) * (ry ** 2).sum(axis=axis))
+    return np.divide((rx * ry).sum(axis=axis), denominator,
+                     out=np.full(denominator.shape, np.nan, dtype=np.float32),
+                     where=denominator > 0)
+
+
+def compare_trio(store, head_stats, trio_name):
+    """Concept masses (languages, layers, heads, slots), JSD and Spearman (pairs, layers, heads)."""
+    phrases = concept_alignments[trio_name]
+    masses = np.stack([
+        head_stats.last_attention(trio_name, lang).astype(np.float32)
+        @ concept_assignment(store.tokens(trio_name, lang), store.prompt(trio_name, lang),
+                             [concept[lang] for concept in phrases])
+        for lang in LANGUAGES
+    ])
+    jsd = np.stack([jensen_shannon(masses[a], masses[b]) for a, b in PAIRS])
+    # Rank correlation only over the concept slots, not the BOS/other buckets
+    rho = np.stack([spearman(masses[a][..., 1:-1], masses[b][..., 1:-1]) for a, b in PAIRS])
+    return masses, jsd, rho
+
+
+def aligned_trios(store):
+    """Trios of a store with concept alignments (`prompts.concept_alignments`); corpus prompts have none."""
+    return [trio_name for trio_name in store.trios() if trio_name in concept_alignments]
+
+
+def build_comparison(store, head_stats=None):
+    """Compare every aligned trio in a store and cache the results beside it.
+
+    A store without aligned trios gets an empty comparison.
+    """
+    trios = aligned_trios(store)
+    if trios:
+        head_stats = head_stats or load_head_stats(store)
+        if head_stats is None:
+            raise FileNotFoundError(f"No head statistics in {store.path}; run head_stats.py first")
+        trios = [trio_name for trio_name in trios
+                 if all(head_stats.has_entry(trio_name, lang) for lang in LANGUAGES)]
+    max_slots = max((len(concept_alignments[trio_name]) + 2 for trio_name in trios), default=2)
+    shape = (len(trios), len(LANGUAGES), store.num_layers, store.num_heads, max_slots)
+    masses = np.full(shape, np.nan, dtype=np.float32)
+    labels = np.full((len(trios), max_slots), "", dtype=object)
+    jsd = np.empty((len(trios), len(PAIRS), store.num_layers, store.num_heads), dtype=np.float32)
+    rho = np.empty_like(jsd)
+    for t, trio_name in enumerate(trios):
+        trio_masses, jsd[t], rho[t] = compare_trio(store, head_stats, trio_name)
+        masses[t, ..., :trio_masses.shape[-1]] = trio_masses
+        slot_labels = ["<bos>"] + [concept["english"] for concept in concept_alignments[trio_name]] + ["<other>"]
+        labels[t, :len(slot_labels)] = slot_labels
+
+    path = os.path.join(store.path, COMPARISON_NAME)
+    np.savez(path, trios=np.array(trios), languages=np.array(LANGUAGES), pairs=np.array(PAIRS),
+             jsd=jsd, spearman=rho, concept_mass=masses, slot_labels=labels.astype(str))
+    return path
+
+
+class CrossLingualComparison:
+    """Loaded comparison results for one model."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.arrays = {name: data[name] for name in data.files}
+        self.trios = self.arrays["trios"].tolist()
+        self.languages = self.arrays["languages"].tolist()
+        self.pair_names = [f"{self.languages[a]}-{self.languages[b]}" for a, b in self.arrays["pairs"]]
+
+    def has_trio(self, trio):
+        return trio in self.trios
+
+    def jsd(self, trio):
+        """(pairs, layers, heads) Jensen-Shannon divergence."""
+        return self.arrays["jsd"][self.trios.index(trio)]
+
+    def spearman(self, trio):
+        return self.arrays["spearman"][self.trios.index(trio)]
+
+    def concept_mass(self, trio, language, layer, head):
+        """Mass on each concept slot for one head, with the slot labels."""
+        t = self.trios.index(trio)
+        labels = [str(label) for label in self.arrays["slot_labels"][t] if label]
+        masses = self.arrays["concept_mass"][t, self.languages.index(language), layer, head]
+        return labels, masses[:len(labels)]
+
+    def divergent_heads(self, trio):
+        """Table of every head with per-pair JSD/Spearman, most divergent first."""
+        import pandas as pd
+
+        jsd = self.jsd(trio)
+        rho = self.spearman(trio)
+        layers, heads = np.indices(jsd.shape[1:])
+        table = pd.DataFrame({"layer": layers.ravel(), "head": heads.ravel(),
+                              "mean_jsd": jsd.mean(axis=0).ravel()})
+        for i, name in enumerate(self.pair_names):
+            table[f"jsd {name}"] = jsd[i].ravel()
+        for i, name in enumerate(self.pair_names):
+            table[f"rho {name}"] = rho[i].ravel()
+        return table.sort_values("mean_jsd", ascending=False, ignore_index=True)
+
+
+def load_comparison(store):
+    """Return the store's cached comparison, or None when it has not been built."""
+    path = os.path.join(store.path, COMPARISON_NAME)
+    if not os.path.exists(path):
+        return None
+    return CrossLingualComparison(path)
+
+
+def main():
+    """Build the cross-lingual comparison cache for one or more stores."""
+    parser = argparse.ArgumentParser(description="Compare attention across trio languages.")
+    parser.add_argument("models", nargs="*", default=["gemma2"], help="model names to compare")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        store = open_store(model_name, args.root)
+        if store is None:
+            print(f"Skipping {model_name}: no store under {args.root}")
+            continue
+        path = build_comparison(store)
+        trios = load_comparison(store).trios
+        print(f"Wrote {path} ({len(trios)} trios aligned in {', '.join(LANGUAGES)})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Render every layer/head/language view of a store into a static gallery.
+
+Uses the app's own drawing (`attention_render`): the token bar and the
+heatmap the app's *Auto* renderer would show (annotated seaborn for short
+prompts, the pooled image for long or top-k ones), with the attention palette
+and Devanagari font. Work is split into one task per (trio, language, layer)
+across a process pool; each finished layer also gets a contact sheet of its
+heads. Existing files are skipped, so an interrupted export resumes where it
+stopped.
+
+    gallery/<model>/index.html
+    gallery/<model>/<trio>/<language>/L06_H03_token_bar.png
+    gallery/<model>/<trio>/<language>/L06_H03_heatmap.png
+    gallery/<model>/<trio>/<language>/L06_sheet.png
+
+    python export_gallery.py gemma2 --workers 8
+    python export_gallery.py gemma2 --trios trio1 --languages hindi --layers 0 6
+"""
+import argparse
+import html
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from attention_store import STORE_ROOT, open_store
+
+GALLERY_ROOT = "gallery"
+SHEET_COLUMNS = 8
+SHEET_THUMBNAIL = 320
+
+_stores = {}
+
+
+def _worker_init():
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+def _store(root, model_name):
+    """One store per worker process, reused by every task it runs."""
+    key = (root, model_name)
+    if key not in _stores:
+        _stores[key] = open_store(model_name, root)
+    return _stores[key]
+
+
+def _write_bytes(path, data):
+    """Write atomically so a killed export never leaves a truncated image behind."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def view_paths(directory, layer, head):
+    stem = os.path.join(directory, f"L{layer:02d}_H{head:02d}")
+    return f"{stem}_token_bar.png", f"{stem}_heatmap.png"
+
+
+def sheet_path(directory, layer):
+    return os.path.join(directory, f"L{layer:02d}_sheet.png")
+
+
+def render_layer(root, model_name, trio, language, layer, directory):
+    """Render every head of one layer that is not on disk yet, then its contact sheet.
+
+    Returns the number of figures written.
+    """
+    from attention_render import (ANNOTATION_TOKEN_LIMIT, RENDER_SETTINGS, draw_heatmap,
+                                  draw_token_bar, figure_to_bytes, get_font_for_language,
+                                  last_token_attention, render_heatmap_image, render_pooled_image)
+
+    store = _store(root, model_name)
+    tokens = store.tokens(trio, language)
+    font = get_font_for_language(language)
+    sparse = store.is_sparse(trio, language)
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for head in range(store.num_heads):
+        token_bar_path, heatmap_path = view_paths(directory, layer, head)
+        if os.path.exists(token_bar_path) and os.path.exists(heatmap_path):
+            continue
+        if sparse:
+            sparse_head = store.sparse_tensor(trio, language).head(layer, head)
+            attn_matrix = sparse_head.last_row()[None, :]
+        else:
+            attn_matrix = store.head(trio, language, layer, head)
+        if not os.path.exists(token_bar_path):
+            _write_bytes(token_bar_path, figure_to_bytes(
+                draw_token_bar(tokens, last_token_attention(attn_matrix, tokens), font)))
+            written += 1
+        if not os.path.exists(heatmap_path):
+            # Same choice as the app's "Auto" heatmap renderer
+            if sparse:
+                data = render_pooled_image(sparse_head.pooled(RENDER_SETTINGS["image_max_cells"]))
+            elif len(tokens) <= ANNOTATION_TOKEN_LIMIT:
+                data = figure_to_bytes(draw_heatmap(attn_matrix[:len(tokens), :len(tokens)],
+                                                    tokens, layer, head, font))
+            else:
+                data = render_heatmap_image(attn_matrix[:len(tokens), :len(tokens)])
+            _write_bytes(heatmap_path, data)
+            written += 1
+    if written or not os.path.exists(sheet_path(directory, layer)):
+        write_contact_sheet(directory, layer, store.num_heads)
+    return written
+
+
+def write_contact_sheet(directory, layer, num_heads, columns=SHEET_COLUMNS, thumbnail=SHEET_THUMBNAIL):
+    """Tile one layer's heatmaps into a labelled grid image."""
+    import io
+
+    from PIL import Image, ImageDraw
+
+    columns = min(columns, num_heads)
+    rows = -(-num_heads // columns)
+    label_height = 20
+    sheet = Image.new("RGB", (columns * thumbnail, rows * (thumbnail + label_height)), "white")
+    draw = ImageDraw.Draw(sheet)
+    for head in range(num_heads):
+        with Image.open(view_paths(directory, layer, head)[1]) as image:
+            image = image.convert("RGB")
+            image.thumbnail((thumbnail, thumbnail))
+        x = (head % columns) * thumbnail
+        y = (head // columns) * (thumbnail + label_height)
+        draw.text((x + 4, y + 4), f"Layer {layer}, Head {head}", fill="black")
+        sheet.paste(image, (x + (thumbnail - image.width) // 2, y + label_height))
+    buffer = io.BytesIO()
+    sheet.save(buffer, format="PNG")
+    _write_bytes(sheet_path(directory, layer), buffer.getvalue())
+
+
+def write_index(output, store, trios, languages, layers):
+    """Static HTML page linking every contact sheet."""
+    lines = [f"<html><head><meta charset='utf-8'><title>{html.escape(store.model)} attention</title></head><body>",
+             f"<h1>{html.escape(store.model)}: {store.num_layers} layers x {store.num_heads} heads</h1>"]
+    for trio in trios:
+        for language in languages:
+            if not store.has_entry(trio, language):
+                continue
+            lines.append(f"<h2>{trio} / {language}</h2><p>{html.escape(store.prompt(trio, language))}</p>")
+            for layer in layers:
+                relative = os.path.relpath(sheet_path(os.path.join(output, trio, language), layer), output)
+                lines.append(f"<h3>Layer {layer}</h3><a href='{relative}'><img src='{relative}' width='100%'></a>")
+    lines.append("</body></html>")
+    path = os.path.join(output, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return path
+
+
+def export_gallery(model_name, root=STORE_ROOT, output=None, workers=None, trios=None, languages=None,
+                   layers=None):
+    """Render the selected grid with a process pool; returns (figures written, seconds)."""
+    store = open_store(model_name, root)
+    if store is None:
+        raise FileNotFoundError(f"No attention store for {model_name} under {root}")
+    output = output or os.path.join(GALLERY_ROOT, model_name)
+    trios = trios or store.trios()
+    languages = languages or sorted({lang for trio in trios for lang in store.languages(trio)})
+    layers = layers if layers is not None else list(range(store.num_layers))
+    tasks = [(root, model_name, trio, language, layer, os.path.join(output, trio, language))
+             for trio in trios for language in languages if store.has_entry(trio, language)
+             for layer in layers]
+
+    start = time.perf_counter()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_worker_init) as pool:
+        futures = [pool.submit(render_layer, *task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), start=1):
+            written += future.result()
+            elapsed = time.perf_counter() - start
+            print(f"\r{done}/{len(tasks)} layers, {written} figures, {written / elapsed:.1f} figures/s",
+                  end="", flush=True)
+    print()
+    write_index(output, store, trios, languages, layers)
+    return written, time.perf_counter() - start
+
+
+def main():
+    """Export the gallery for one or more models."""
+    parser = argparse.ArgumentParser(description="Render every attention view to a static gallery.")
+    parser.add_argument("models", nargs="*", default=["gemma2"], help="model names to export")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    parser.add_argument("--output", default=GALLERY_ROOT, help="gallery directory")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--trios", nargs="+", default=None, help="only these prompts")
+    parser.add_argument("--languages", nargs="+", default=None, help="only these languages")
+    parser.add_argument("--layers", type=int, nargs="+", default=None, help="only these layers")
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        if open_store(model_name, args.root) is None:
+            print(f"Skipping {model_name}: no store under {args.root}")
+            continue
+        written, seconds = export_gallery(model_name, args.root, os.path.join(args.output, model_name),
+                                          args.workers, args.trios, args.languages, args.layers)
+        print(f"Wrote {written} figures for {model_name} in {seconds:.1f}s "
+              f"to {os.path.join(args.output, model_name)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
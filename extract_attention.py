@@ -0,0 +1,755 @@
+#!/usr/bin/env python3
+"""Batched, hook-based attention extraction that streams straight into the store.
+
+Instead of keeping the whole `outputs.attentions` tuple and copying every head
+with `.cpu().numpy()`, a forward hook on each attention module copies that
+layer's weights for the whole batch to host memory, writes them into the
+memory-mapped store files and drops the device tensor. Peak host memory is one
+layer of one batch.
+
+Run `python extract_attention.py --tiny` to exercise the pipeline on CPU with a
+small stand-in causal LM (no GPU or Hugging Face hub needed).
+"""
+import argparse
+import math
+import os
+import shutil
+import sys
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from torch import nn
+
+from attention_codec import CODECS
+from attention_store import ACTIVATIONS_TAG, STORE_ROOT, ShardedStoreWriter, StoreWriter, open_store
+from corpus import AGGREGATES_NAME, SHARD_SIZE, CorpusAggregates, iter_shards
+from cross_lingual import build_comparison
+from extraction_cache import CACHE_ROOT, ExtractionCache, extraction_key
+from head_search import build_head_search
+from head_stats import build_head_stats, load_head_stats
+from prompts import all_prompts
+
+# ===== Stand-in model for CPU runs =====
+
+class _TinyAttention(nn.Module):
+    """Eager causal self-attention returning (output, weights) like HF modules."""
+
+    def __init__(self, hidden_size, num_heads):
+        super().__init__()
+        self.num_heads = num_heads
+        self.head_dim = hidden_size // num_heads
+        self.qkv_proj = nn.Linear(hidden_size, 3 * hidden_size)
+        self.o_proj = nn.Linear(hidden_size, hidden_size)
+
+    def forward(self, hidden_states, attention_mask=None, past_key_value=None):
+        batch, seq_len, hidden_size = hidden_states.shape
+        qkv = self.qkv_proj(hidden_states).view(batch, seq_len, 3, self.num_heads, self.head_dim)
+        query, key, value = qkv.permute(2, 0, 3, 1, 4)
+        if past_key_value is not None:
+            key = torch.cat([past_key_value[0], key], dim=2)
+            value = torch.cat([past_key_value[1], value], dim=2)
+        past_len = key.shape[2] - seq_len
+        scores = query @ key.transpose(-1, -2) / math.sqrt(self.head_dim)
+        # Query i sits at absolute position past_len + i
+        mask = torch.ones(seq_len, key.shape[2], dtype=torch.bool, device=scores.device).tril(past_len)
+        mask = mask[None, None]
+        if attention_mask is not None:
+            mask = mask & attention_mask[:, None, None, :].bool()
+        scores = scores.masked_fill(~mask, torch.finfo(scores.dtype).min)
+        weights = scores.softmax(dim=-1)
+        output = (weights @ value).transpose(1, 2).reshape(batch, seq_len, hidden_size)
+        return self.o_proj(output), weights, (key, value)
+
+
+class _TinyDecoderLayer(nn.Module):
+    def __init__(self, hidden_size, num_heads):
+        super().__init__()
+        self.input_layernorm = nn.LayerNorm(hidden_size)
+        self.self_attn = _TinyAttention(hidden_size, num_heads)
+        self.post_attention_layernorm = nn.LayerNorm(hidden_size)
+        self.mlp = nn.Sequential(nn.Linear(hidden_size, 4 * hidden_size), nn.GELU(),
+                                 nn.Linear(4 * hidden_size, hidden_size))
+
+    def forward(self, hidden_states, attention_mask=None, past_key_value=None):
+        attn_output, _, present = self.self_attn(self.input_layernorm(hidden_states), attention_mask,
+                                                 past_key_value)
+        hidden_states = hidden_states + attn_output
+        return hidden_states + self.mlp(self.post_attention_layernorm(hidden_states)), present
+
+
+class _TinyBackbone(nn.Module):
+    def __init__(self, config):
+        super().__init__()
+        self.embed_tokens = nn.Embedding(config.vocab_size, config.hidden_size)
+        self.embed_positions = nn.Embedding(config.max_position_embeddings, config.hidden_size)
+        self.layers = nn.ModuleList(_TinyDecoderLayer(config.hidden_size, config.num_attention_heads)
+                                    for _ in range(config.num_hidden_layers))
+        self.norm = nn.LayerNorm(config.hidden_size)
+
+    def forward(self, input_ids, attention_mask=None, past_key_values=None):
+        past_len = past_key_values[0][0].shape[2] if past_key_values else 0
+        positions = torch.arange(past_len, past_len + input_ids.shape[1], device=input_ids.device)
+        hidden_states = self.embed_tokens(input_ids) + self.embed_positions(positions)[None]
+        presents = []
+        for i, layer in enumerate(self.layers):
+            hidden_states, present = layer(hidden_states, attention_mask,
+                                           past_key_values[i] if past_key_values else None)
+            presents.append(present)
+        return self.norm(hidden_states), tuple(presents)
+
+
+class TinyCausalLM(nn.Module):
+    """Small randomly initialised decoder with the same module layout as HF Llama/Gemma."""
+
+    def __init__(self, num_layers=4, num_heads=4, hidden_size=64, vocab_size=0x3000,
+                 max_position_embeddings=8192, seed=0):
+        super().__init__()
+        torch.manual_seed(seed)
+        self.config = SimpleNamespace(num_hidden_layers=num_layers, num_attention_heads=num_heads,
+                                      hidden_size=hidden_size, vocab_size=vocab_size,
+                                      max_position_embeddings=max_position_embeddings, seed=seed)
+        self.model = _TinyBackbone(self.config)
+        self.lm_head = nn.Linear(hidden_size, vocab_size, bias=False)
+
+    def forward(self, input_ids, attention_mask=None, past_key_values=None, use_cache=False, **kwargs):
+        hidden_states, presents = self.model(input_ids, attention_mask, past_key_values)
+        return SimpleNamespace(logits=self.lm_head(hidden_states),
+                               past_key_values=presents if use_cache else None)
+
+    def generate(self, input_ids, max_new_tokens=20, do_sample=False, temperature=1.0, top_p=1.0,
+                 eos_token_id=None, return_dict_in_generate=False, **kwargs):
+        """KV-cached decoding of one prompt, the slice of `GenerationMixin.generate` we use.
+
+        Like HF, sampling draws from the global torch RNG and the last token
+        produced is never fed back through the model.
+        """
+        sequence = input_ids
+        outputs = self(input_ids=input_ids, use_cache=True)
+        for step in range(max_new_tokens):
+            next_id = sample_next_token(outputs.logits[0, -1], None, do_sample, temperature, top_p)
+            sequence = torch.cat([sequence, sequence.new_tensor([[next_id]])], dim=1)
+            if next_id == eos_token_id or step == max_new_tokens - 1:
+                break
+            outputs = self(input_ids=sequence[:, -1:], past_key_values=outputs.past_key_values,
+                           use_cache=True)
+        return SimpleNamespace(sequences=sequence) if return_dict_in_generate else sequence
+
+
+class TinyTokenizer:
+    """Character-level tokenizer exposing the slice of the HF tokenizer API we use."""
+
+    pad_token_id = 0
+    bos_token_id = 1
+    unk_token_id = 2
+    _offset = 3
+
+    def __init__(self, vocab_size=0x3000):
+        self.vocab_size = vocab_size
+        self.padding_side = "right"
+
+    def _encode(self, text):
+        limit = self.vocab_size - self._offset
+        return [self.bos_token_id] + [ord(ch) + self._offset if ord(ch) < limit else self.unk_token_id
+                                      for ch in text]
+
+    def __call__(self, texts, return_tensors="pt", padding=True):
+        encoded = [self._encode(text) for text in texts]
+        width = max(len(ids) for ids in encoded)
+        input_ids = torch.full((len(encoded), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(encoded), width), dtype=torch.long)
+        for row, ids in enumerate(encoded):
+            span = slice(0, len(ids)) if self.padding_side == "right" else slice(width - len(ids), width)
+            input_ids[row, span] = torch.tensor(ids)
+            attention_mask[row, span] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        chars = []
+        for token_id in token_ids:
+            token_id = int(token_id)
+            if token_id < self._offset:
+                if not skip_special_tokens:
+                    chars.append(["<pad>", "<bos>", "<unk>"][token_id])
+                continue
+            chars.append(chr(token_id - self._offset))
+        return "".join(chars)
+
+
+def load_tiny_model(**kwargs):
+    """Return (model, tokenizer) for the CPU stand-in."""
+    model = TinyCausalLM(**kwargs)
+    return model.eval(), TinyTokenizer(model.config.vocab_size)
+
+
+# ===== Extraction engine =====
+
+def decoder_layers(model):
+    """Return the decoder layers of a decoder-only model."""
+    backbone = getattr(model, "model", model)
+    return list(backbone.layers)
+
+
+def attention_modules(model):
+    """Return the per-layer self-attention modules of a decoder-only model."""
+    return [layer.self_attn for layer in decoder_layers(model)]
+
+
+def flatten_prompts(prompts):
+    """Turn a trio -> language -> prompt dict into a list of (trio, language, prompt)."""
+    return [(trio_name, lang, prompt)
+            for trio_name, languages in prompts.items()
+            for lang, prompt in languages.items()]
+
+
+def sort_by_tokens(tokenizer, items, token_counts=None):
+    """Sort (trio, language, prompt) items by token count so batches carry as little padding as possible.
+
+    `token_counts` maps (trio, language) to counts the caller already has;
+    otherwise every prompt is tokenized once, in one call.
+    """
+    if token_counts is None:
+        mask = tokenizer([prompt for _, _, prompt in items], return_tensors="pt", padding=True)["attention_mask"]
+        token_counts = {(trio_name, lang): count
+                        for (trio_name, lang, _), count in zip(items, mask.sum(dim=1).tolist())}
+    items.sort(key=lambda item: token_counts[item[0], item[1]])
+    return items
+
+
+class _LayerStreamer:
+    """Forward-hook target that writes each layer's attention into memmaps."""
+
+    def __init__(self, writer, batch, tokens, num_layers):
+        self.writer = writer
+        self.batch = batch
+        self.tokens = tokens
+        self.num_layers = num_layers
+        self.arrays = None
+
+    def hook(self, layer_idx):
+        def _hook(module, inputs, output):
+            weights = output[1]
+            if weights is None:
+                raise RuntimeError("Attention module returned no weights; load the model with "
+                                   "attn_implementation='eager'.")
+            if self.arrays is None:
+                # Head count is only known once the first layer has run
+                self.arrays = [
+                    self.writer.create_tensor(trio_name, lang, prompt, tokens,
+                                              self.num_layers, weights.shape[1])
+                    for (trio_name, lang, prompt), tokens in zip(self.batch, self.tokens)
+                ]
+            host = None
+            for row, array in enumerate(self.arrays):
+                seq_len = array.shape[-1]
+                if getattr(array, "topk", None):
+                    # Sparse capture: select top-k on the device, copy only k keys per row
+                    values, indices = weights[row, :, :seq_len, :seq_len].float().topk(
+                        min(array.topk, seq_len), dim=-1)
+                    array.write_topk(layer_idx, indices.cpu().numpy(), values.cpu().numpy())
+                    continue
+                if host is None:
+                    host = weights.detach().to("cpu", torch.float16).numpy()
+                array[layer_idx] = host[row, :, :seq_len, :seq_len]
+            # Drop the weights so the model does not accumulate every layer on device
+            return (output[0], None) + tuple(output[2:])
+        return _hook
+
+    def close(self):
+        for array in self.arrays or []:
+            array.flush()
+        self.arrays = None
+
+
+def extract_to_store(model, tokenizer, prompts, model_name, root=STORE_ROOT, batch_size=8,
+                     device=None, codec=None, topk=None, token_counts=None):
+    """Extract attention for every prompt in batches and stream it into the store.
+
+    `token_counts` optionally maps (trio, language) to the prompt's token
+    count, used to bucket the batches. Returns a dict with the prompt count,
+    wall time and prompts/sec.
+    """
+    device = device or next(model.parameters()).device
+    model.eval()
+    tokenizer.padding_side = "right"  # causal rows of real tokens never see right padding
+    items = sort_by_tokens(tokenizer, flatten_prompts(prompts), token_counts)
+
+    modules = attention_modules(model)
+    writer = StoreWriter(model_name, root, codec=codec, topk=topk)
+    start = time.perf_counter()
+    num_batches = 0
+    for batch_start in range(0, len(items), batch_size):
+        batch = items[batch_start:batch_start + batch_size]
+        inputs = tokenizer([prompt for _, _, prompt in batch], return_tensors="pt", padding=True)
+        inputs = {key: value.to(device) for key, value in inputs.items()}
+        lengths = inputs["attention_mask"].sum(dim=1).tolist()
+        tokens = [
+            [tokenizer.decode([token_id], skip_special_tokens=True)
+             for token_id in inputs["input_ids"][row, :length].tolist()]
+            for row, length in enumerate(lengths)
+        ]
+
+        streamer = _LayerStreamer(writer, batch, tokens, len(modules))
+        handles = [module.register_forward_hook(streamer.hook(layer_idx))
+                   for layer_idx, module in enumerate(modules)]
+        try:
+            with torch.no_grad():
+                model(**inputs, output_attentions=True)
+        finally:
+            for handle in handles:
+                handle.remove()
+            streamer.close()
+        num_batches += 1
+
+    writer.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "prompts": len(items),
+        "batches": num_batches,
+        "seconds": elapsed,
+        "prompts_per_sec": len(items) / elapsed if elapsed > 0 else float("inf"),
+    }
+
+
+def extract_corpus(model, tokenizer, corpus_path, model_name, root=STORE_ROOT, shard_size=SHARD_SIZE,
+                   batch_size=8, device=None, codec=None, topk=None):
+    """Extract a JSONL prompt corpus into a sharded store, folding aggregates shard by shard.
+
+    Each shard is a complete store (with its head-stats and head-search indexes) before it is
+    published in the top-level manifest, so an interrupted run resumes at the
+    first missing shard. Returns a dict with
+    the shard and prompt counts and the wall time.
+    """
+    writer = ShardedStoreWriter(model_name, root)
+    aggregates_path = os.path.join(writer.path, AGGREGATES_NAME)
+    aggregates = (CorpusAggregates.load(aggregates_path) if os.path.exists(aggregates_path)
+                  else CorpusAggregates())
+    start = time.perf_counter()
+    shards = prompts = 0
+    for name, shard_prompts in iter_shards(corpus_path, shard_size):
+        shard_root = writer.shards_root
+        if not writer.has_shard(name):
+            extract_to_store(model, tokenizer, shard_prompts, name, root=shard_root, batch_size=batch_size,
+                             device=device, codec=codec, topk=topk)
+            shard = open_store(name, shard_root)
+            build_head_stats(shard)
+            build_head_search(shard)
+            writer.add_shard(name)
+            prompts += sum(len(languages) for languages in shard_prompts.values())
+        if name not in aggregates.shards:
+            aggregates.add_head_stats(load_head_stats(open_store(name, shard_root)), name)
+            aggregates.save(aggregates_path)
+        shards += 1
+        print(f"\r{shards} shards, {prompts} prompts extracted", end="", flush=True)
+    print()
+    return {"shards": shards, "prompts": prompts, "seconds": time.perf_counter() - start}
+
+
+class _ResidualStreamer:
+    """Forward-hook target that writes decoder layer outputs (the residual stream) into memmaps."""
+
+    def __init__(self, writer, tag, batch, tokens, layers):
+        self.writer = writer
+        self.tag = tag
+        self.batch = batch
+        self.tokens = tokens
+        self.layers = layers
+        self.arrays = None
+
+    def hook(self, position):
+        def _hook(module, inputs, output):
+            hidden_states = output[0] if isinstance(output, tuple) else output
+            if self.arrays is None:
+                self.arrays = [
+                    self.writer.create_activations(self.tag, trio_name, lang, prompt, tokens,
+                                                   (len(self.layers), len(tokens), hidden_states.shape[-1]),
+                                                   self.layers)
+                    for (trio_name, lang, prompt), tokens in zip(self.batch, self.tokens)
+                ]
+            host = hidden_states.detach().to("cpu", torch.float16).numpy()
+            for row, array in enumerate(self.arrays):
+                array[position] = host[row, :array.shape[1]]
+        return _hook
+
+    def close(self):
+        for array in self.arrays or []:
+            array.flush()
+        self.arrays = None
+
+
+def capture_activations(model, tokenizer, prompts, model_name, root=STORE_ROOT, tag=ACTIVATIONS_TAG,
+                        layers=None, batch_size=8, device=None):
+    """Store the residual stream after each of `layers` (default: all) for every prompt.
+
+    Each prompt gets one (layers, seq, hidden) float16 array under
+    activations/<tag>/, written layer by layer from forward hooks like the
+    attention, so host memory stays at one batch. These are the inputs of
+    residual-stream SAEs (see sae_features.py). Returns a dict with the
+    prompt count and wall time.
+    """
+    device = device or next(model.parameters()).device
+    model.eval()
+    tokenizer.padding_side = "right"
+    modules = decoder_layers(model)
+    layers = list(range(len(modules))) if layers is None else sorted(layers)
+    items = sort_by_tokens(tokenizer, flatten_prompts(prompts))
+
+    writer = StoreWriter(model_name, root)
+    start = time.perf_counter()
+    for batch_start in range(0, len(items), batch_size):
+        batch = items[batch_start:batch_start + batch_size]
+        inputs = tokenizer([prompt for _, _, prompt in batch], return_tensors="pt", padding=True)
+        inputs = {key: value.to(device) for key, value in inputs.items()}
+        lengths = inputs["attention_mask"].sum(dim=1).tolist()
+        tokens = [
+            [tokenizer.decode([token_id], skip_special_tokens=True)
+             for token_id in inputs["input_ids"][row, :length].tolist()]
+            for row, length in enumerate(lengths)
+        ]
+
+        streamer = _ResidualStreamer(writer, tag, batch, tokens, layers)
+        handles = [modules[layer_idx].register_forward_hook(streamer.hook(position))
+                   for position, layer_idx in enumerate(layers)]
+        try:
+            with torch.no_grad():
+                model(**inputs)
+        finally:
+            for handle in handles:
+                handle.remove()
+            streamer.close()
+
+    writer.close()
+    return {"prompts": len(items), "layers": len(layers), "seconds": time.perf_counter() - start}
+
+
+class _GenerationRecorder:
+    """Forward-hook target collecting each layer's attention rows across decoding steps.
+
+    The prefill contributes a (heads, prompt, prompt) block and every decoding
+    step one (heads, 1, keys) row; `layer_tensor` assembles them into the
+    causal (heads, seq, seq) matrix of prompt + generated tokens.
+    """
+
+    def __init__(self, num_layers):
+        self.blocks = [[] for _ in range(num_layers)]
+
+    def hook(self, layer_idx):
+        def _hook(module, inputs, output):
+            weights = output[1]
+            if weights is None:
+                raise RuntimeError("Attention module returned no weights; load the model with "
+                                   "attn_implementation='eager'.")
+            self.blocks[layer_idx].append(weights[0].detach().to("cpu", torch.float16).numpy())
+            return (output[0], None) + tuple(output[2:])
+        return _hook
+
+    def num_rows(self):
+        """Query positions recorded so far (prompt plus the tokens fed back)."""
+        return sum(block.shape[1] for block in self.blocks[0])
+
+    def layer_tensor(self, layer_idx, seq_len):
+        blocks = self.blocks[layer_idx]
+        dense = np.zeros((blocks[0].shape[0], seq_len, seq_len), dtype=np.float16)
+        row = 0
+        for block in blocks:
+            rows, keys = block.shape[1:]
+            if keys < row + rows:
+                # A sliding-window cache no longer holds the earliest keys
+                raise ValueError(f"Layer {layer_idx} attends to {keys} cached keys at position "
+                                 f"{row + rows - 1}; the sequence is longer than its attention window")
+            # Pre-sized caches (Gemma-2) report every slot; slots past the sequence are masked out
+            keys = min(keys, seq_len)
+            dense[:, row:row + rows, :keys] = block[:, :, :keys]
+            row += rows
+        return dense
+
+
+def prompt_seed(seed, prompt):
+    """Sampling seed of one prompt: the same text always gets the same seed."""
+    return seed + zlib.crc32(prompt.encode("utf-8"))
+
+
+def sample_next_token(logits, generator, do_sample=True, temperature=1.0, top_p=1.0):
+    """Pick the next token id from (vocab,) logits: greedy, or temperature / nucleus sampling."""
+    if not do_sample:
+        return int(logits.argmax())
+    probs = (logits.float() / temperature).softmax(dim=-1)
+    if top_p < 1.0:
+        sorted_probs, order = probs.sort(descending=True)
+        # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+        outside = sorted_probs.cumsum(dim=-1) - sorted_probs >= top_p
+        sorted_probs[outside] = 0
+        probs = torch.zeros_like(probs).scatter(0, order, sorted_probs)
+    return int(torch.multinomial(probs, 1, generator=generator))
+
+
+def generate_with_attention(model, tokenizer, prompts, model_name, root=STORE_ROOT, max_new_tokens=64,
+                            do_sample=True, temperature=0.7, top_p=0.9, seed=0, device=None,
+                            codec=None, topk=None):
+    """Generate a response per prompt and store attention for prompt + response in one pass.
+
+    `model.generate` prefills the prompt once and then decodes with the KV
+    cache, which it sizes for prompt + response and addresses by cache
+    position itself (Gemma-2's hybrid cache cannot grow). Each forward pass
+    adds attention rows per layer, captured by the same hooks as
+    `extract_to_store`, so no second forward pass over the response is
+    needed. The last sampled token is never fed back and so has no row: one
+    extra token is generated and dropped, and a response that stops at the
+    end-of-sequence token is stored without it. Each prompt's sampling seed
+    (`prompt_seed`) and settings are recorded in the manifest entry under
+    "generation".
+
+    Returns a dict with the prompt count, forward passes, wall time and tokens/sec.
+    """
+    device = device or next(model.parameters()).device
+    model.eval()
+    sampling = {"do_sample": do_sample, "eos_token_id": getattr(tokenizer, "eos_token_id", None),
+                "pad_token_id": getattr(tokenizer, "pad_token_id", None)}
+    if do_sample:
+        # top_k=0 turns off the model's default top-k so only temperature and top_p apply
+        sampling.update(temperature=temperature, top_p=top_p, top_k=0)
+    rng_devices = [device] if torch.device(device).type == "cuda" else []
+    modules = attention_modules(model)
+    writer = StoreWriter(model_name, root, codec=codec, topk=topk)
+    items = flatten_prompts(prompts)
+    start = time.perf_counter()
+    forward_passes = generated_tokens = 0
+    for trio_name, lang, prompt in items:
+        input_ids = tokenizer([prompt], return_tensors="pt")["input_ids"].to(device)
+
+        recorder = _GenerationRecorder(len(modules))
+        handles = [module.register_forward_hook(recorder.hook(layer_idx))
+                   for layer_idx, module in enumerate(modules)]
+        try:
+            # generate() samples from the global RNG; seed it per prompt without leaking the state
+            with torch.no_grad(), torch.random.fork_rng(devices=rng_devices):
+                torch.manual_seed(prompt_seed(seed, prompt))
+                output = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                        max_new_tokens=max_new_tokens + 1, output_attentions=True,
+                                        return_dict_in_generate=True, **sampling)
+        finally:
+            for handle in handles:
+                handle.remove()
+        forward_passes += len(recorder.blocks[0])
+        sequence = output.sequences[0, :recorder.num_rows()].tolist()
+
+        tokens = [tokenizer.decode([token_id], skip_special_tokens=True) for token_id in sequence]
+        num_heads = recorder.blocks[0][0].shape[0]
+        sink = writer.create_tensor(trio_name, lang, prompt, tokens, len(modules), num_heads)
+        for layer_idx in range(len(modules)):
+            sink[layer_idx] = recorder.layer_tensor(layer_idx, len(sequence))
+        sink.flush()
+        del sink
+        writer.set_generation(trio_name, lang, {
+            "prompt_len": input_ids.shape[1],
+            "seed": prompt_seed(seed, prompt),
+            "do_sample": do_sample,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_new_tokens": max_new_tokens,
+        })
+        writer.set_response(trio_name, lang, tokenizer.decode(sequence, skip_special_tokens=True))
+        generated_tokens += len(sequence) - input_ids.shape[1]
+
+    writer.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "prompts": len(items),
+        "forward_passes": forward_passes,
+        "generated_tokens": generated_tokens,
+        "seconds": elapsed,
+        "tokens_per_sec": generated_tokens / elapsed if elapsed > 0 else float("inf"),
+    }
+
+
+def model_fingerprint(model, model_id=None, revision=None):
+    """What identifies a model's weights for cache keys: id, revision, config and dtype.
+
+    The revision defaults to the Hugging Face commit hash the checkpoint was
+    loaded from; pass one explicitly for local checkpoints that change in place.
+    """
+    config = getattr(model, "config", None)
+    config_dict = config.to_dict() if hasattr(config, "to_dict") else vars(config) if config else {}
+    return {
+        "model": model_id or config_dict.get("_name_or_path") or type(model).__name__,
+        "revision": revision or getattr(config, "_commit_hash", None),
+        "config": {key: value for key, value in config_dict.items() if key != "_commit_hash"},
+        "dtype": str(next(model.parameters()).dtype),
+    }
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Tokenizer name and vocabulary size; the token ids themselves are keyed per prompt."""
+    return {
+        "tokenizer": getattr(tokenizer, "name_or_path", None) or type(tokenizer).__name__,
+        "vocab_size": len(tokenizer) if hasattr(tokenizer, "__len__") else tokenizer.vocab_size,
+    }
+
+
+def cached_extract(model, tokenizer, prompts, model_name, root=STORE_ROOT, cache_dir=CACHE_ROOT,
+                   model_id=None, revision=None, generate=False, batch_size=8, device=None, codec=None,
+                   topk=None, max_new_tokens=64, do_sample=True, temperature=0.7, top_p=0.9, seed=0):
+    """Extract (or generate) through the content-addressed cache, then rebuild the store.
+
+    Only prompts whose key is not cached run through the model; every entry
+    of the rebuilt store is hard-linked from the cache, so the store holds
+    exactly `prompts`. Returns a dict with hit/miss counts and wall time.
+    """
+    start = time.perf_counter()
+    existing = open_store(model_name, root)
+    if codec is None:
+        codec = existing.manifest.get("codec", "dense") if existing is not None else "dense"
+    if codec == "topk" and topk is None:
+        topk = existing.manifest.get("topk") if existing is not None else None
+    settings = {"codec": codec, "topk": topk if codec == "topk" else None, "mode": "forward"}
+    if generate:
+        settings.update(mode="generate", max_new_tokens=max_new_tokens, do_sample=do_sample,
+                        temperature=temperature, top_p=top_p)
+
+    cache = ExtractionCache(cache_dir)
+    model_key = model_fingerprint(model, model_id, revision)
+    tokenizer_key = tokenizer_fingerprint(tokenizer)
+    items = flatten_prompts(prompts)
+    keys = {}
+    token_counts = {}
+    misses = {}
+    for trio_name, lang, prompt in items:
+        input_ids = tokenizer([prompt], return_tensors="pt")["input_ids"][0].tolist()
+        token_counts[trio_name, lang] = len(input_ids)
+        prompt_settings = dict(settings, seed=prompt_seed(seed, prompt)) if generate else settings
+        keys[trio_name, lang] = extraction_key(model_key, tokenizer_key, prompt, input_ids, prompt_settings)
+        if not cache.has(keys[trio_name, lang]):
+            misses.setdefault(trio_name, {})[lang] = prompt
+
+    num_misses = sum(len(languages) for languages in misses.values())
+    if misses:
+        staging = cache.staging_dir()
+        try:
+            if generate:
+                generate_with_attention(model, tokenizer, misses, "staging", root=staging,
+                                        max_new_tokens=max_new_tokens, do_sample=do_sample,
+                                        temperature=temperature, top_p=top_p, seed=seed, device=device,
+                                        codec=codec, topk=topk)
+            else:
+                extract_to_store(model, tokenizer, misses, "staging", root=staging, batch_size=batch_size,
+                                 device=device, codec=codec, topk=topk, token_counts=token_counts)
+            staged = open_store("staging", staging)
+            for trio_name, languages in misses.items():
+                for lang in languages:
+                    cache.put(keys[trio_name, lang], staged, trio_name, lang)
+        finally:
+            shutil.rmtree(staging)
+
+    cache.materialize([(trio_name, lang, keys[trio_name, lang]) for trio_name, lang, _ in items],
+                      model_name, root, codec, topk)
+    return {
+        "prompts": len(items),
+        "hits": len(items) - num_misses,
+        "misses": num_misses,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def load_hf_model(model_id, device, revision=None):
+    """Load a Hugging Face causal LM with eager attention so weights are returned."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id, revision=revision, use_fast=True)
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=torch.float16 if device.type == "cuda" else torch.float32,
+        attn_implementation="eager",
+        revision=revision,
+    ).to(device)
+    return model.eval(), tokenizer
+
+
+def main():
+    """Extract attention for the prompt trios into the store."""
+    parser = argparse.ArgumentParser(description="Batched attention extraction into the store.")
+    parser.add_argument("--model-id", help="Hugging Face model id, e.g. meta-llama/Llama-3.2-1B-Instruct")
+    parser.add_argument("--name", help="store name for the model (default: 'tiny' or the model id)")
+    parser.add_argument("--tiny", action="store_true", help="use the CPU stand-in model")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--codec", choices=CODECS, default=None,
+                        help="attention storage codec (see attention_codec.py)")
+    parser.add_argument("--topk", type=int, default=None,
+                        help="keys kept per query row with --codec topk (long prompts)")
+    parser.add_argument("--corpus", default=None,
+                        help="JSONL prompt corpus to extract into a sharded store (see corpus.py)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="prompt triples per shard")
+    parser.add_argument("--generate", action="store_true",
+                        help="generate responses and capture attention for prompt + response in one pass")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--greedy", action="store_true", help="greedy decoding instead of sampling")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0,
+                        help="base sampling seed (each prompt uses seed + CRC32 of its text)")
+    parser.add_argument("--revision", default=None,
+                        help="model revision to load and key the cache on (default: the hub's main)")
+    parser.add_argument("--cache-dir", default=CACHE_ROOT, help="content-addressed extraction cache")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="run every prompt and write straight into the store")
+    parser.add_argument("--activations", action="store_true",
+                        help=f"also store residual-stream activations (tag '{ACTIVATIONS_TAG}') for SAE encoding")
+    parser.add_argument("--activation-layers", default=None,
+                        help="comma-separated layers for --activations (default: all)")
+    args = parser.parse_args()
+    if args.activations and args.corpus:
+        parser.error("--activations is not supported with --corpus")
+
+    device = torch.device("cuda" if torch.cuda.is_available() and not args.tiny else "cpu")
+    if args.tiny or not args.model_id:
+        model, tokenizer = load_tiny_model()
+        name = args.name or "tiny"
+    else:
+        model, tokenizer = load_hf_model(args.model_id, device, args.revision)
+        name = args.name or args.model_id.split("/")[-1]
+
+    if args.corpus:
+        stats = extract_corpus(model, tokenizer, args.corpus, name, root=args.root, shard_size=args.shard_size,
+                               batch_size=args.batch_size, device=device, codec=args.codec, topk=args.topk)
+        print(f"Extracted {stats['prompts']} prompts into {stats['shards']} shards: {stats['seconds']:.2f}s")
+        # Head statistics, search indexes and aggregates were built per shard
+        return 0
+    if not args.no_cache:
+        stats = cached_extract(model, tokenizer, all_prompts, name, root=args.root, cache_dir=args.cache_dir,
+                               model_id=args.model_id, revision=args.revision, generate=args.generate,
+                               batch_size=args.batch_size, device=device, codec=args.codec, topk=args.topk,
+                               max_new_tokens=args.max_new_tokens, do_sample=not args.greedy,
+                               temperature=args.temperature, top_p=args.top_p, seed=args.seed)
+        print(f"{stats['hits']} prompts cached, {stats['misses']} extracted: {stats['seconds']:.2f}s")
+    elif args.generate:
+        stats = generate_with_attention(model, tokenizer, all_prompts, name, root=args.root,
+                                        max_new_tokens=args.max_new_tokens, do_sample=not args.greedy,
+                                        temperature=args.temperature, top_p=args.top_p, seed=args.seed,
+                                        device=device, codec=args.codec, topk=args.topk)
+        print(f"Generated {stats['generated_tokens']} tokens for {stats['prompts']} prompts in "
+              f"{stats['forward_passes']} forward passes: {stats['seconds']:.2f}s "
+              f"({stats['tokens_per_sec']:.1f} tokens/sec)")
+    else:
+        stats = extract_to_store(model, tokenizer, all_prompts, name, root=args.root,
+                                 batch_size=args.batch_size, device=device, codec=args.codec, topk=args.topk)
+        print(f"Extracted {stats['prompts']} prompts in {stats['batches']} batches: "
+              f"{stats['seconds']:.2f}s ({stats['prompts_per_sec']:.1f} prompts/sec)")
+    if args.activations:
+        layers = [int(layer) for layer in args.activation_layers.split(",")] if args.activation_layers else None
+        stats = capture_activations(model, tokenizer, all_prompts, name, root=args.root, layers=layers,
+                                    batch_size=args.batch_size, device=device)
+        print(f"Stored {stats['layers']} layers of activations for {stats['prompts']} prompts: "
+              f"{stats['seconds']:.2f}s")
+    store = open_store(name, args.root)
+    print(f"Wrote {build_head_stats(store)}")
+    print(f"Wrote {build_head_search(store)}")
+    print(f"Wrote {build_comparison(store)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Content-addressed cache of extracted attention, one object per prompt.
+
+An object's key is the SHA-256 of everything that determines its tensor: the
+model (id, revision, config, dtype), the tokenizer, the prompt text and its
+token ids, and the capture settings (codec, forward pass or generation with
+its sampling parameters and seed). Objects hold the entry's store files and
+its manifest entry:
+
+    .extraction_cache/objects/3f/3fa2...e1/entry.json
+    .extraction_cache/objects/3f/3fa2...e1/english.tril.npy
+
+`extract_attention.cached_extract` only runs the model for keys that are not
+cached yet and then rebuilds the app-facing store from hard links to the
+objects, so re-running an unchanged prompt set, or switching back to an
+earlier one, takes seconds.
+
+    python extraction_cache.py info
+    python extraction_cache.py prune    # drop objects no store under attention_store/ uses
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from attention_store import ENTRY_FILE_KEYS, STORE_ROOT, StoreWriter, list_stores, open_store, store_path
+
+CACHE_ROOT = ".extraction_cache"
+CACHE_FORMAT = 1
+ENTRY_NAME = "entry.json"
+# Per-object fields that are not part of the store's manifest entry
+OBJECT_FIELDS = ("num_layers", "num_heads", "response")
+
+
+def extraction_key(model_fingerprint, tokenizer_fingerprint, prompt, input_ids, settings):
+    """Hex SHA-256 identifying one prompt's extraction."""
+    payload = json.dumps({
+        "format": CACHE_FORMAT,
+        "model": model_fingerprint,
+        "tokenizer": tokenizer_fingerprint,
+        "prompt": prompt,
+        # Plain ints: a numpy id would serialise through repr() and change the key
+        "input_ids": [int(token_id) for token_id in input_ids],
+        "settings": settings,
+    }, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Cache objects under `root`; objects are immutable once their entry.json exists."""
+
+    def __init__(self, root=CACHE_ROOT):
+        self.root = root
+
+    def object_path(self, key):
+        return os.path.join(self.root, "objects", key[:2], key)
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self.object_path(key), ENTRY_NAME))
+
+    def entry(self, key):
+        with open(os.path.join(self.object_path(key), ENTRY_NAME), encoding="utf-8") as f:
+            return json.load(f)
+
+    def staging_dir(self):
+        """Scratch directory (on the cache's filesystem) to extract misses into."""
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkdtemp(prefix="staging-", dir=self.root)
+
+    def put(self, key, store, trio, language):
+        """Move one entry's files out of a (staging) store into the object for `key`."""
+        path = self.object_path(key)
+        os.makedirs(path, exist_ok=True)
+        record = dict(store.entry(trio, language))
+        for file_key in ENTRY_FILE_KEYS:
+            if record.get(file_key):
+                name = os.path.basename(record[file_key])
+                os.replace(os.path.join(store.path, record[file_key]), os.path.join(path, name))
+                record[file_key] = name
+        record.update(num_layers=store.num_layers, num_heads=store.num_heads,
+                      response=store.response(trio, language))
+        # entry.json is written last, so a half-written object is never a hit
+        tmp_path = os.path.join(path, ENTRY_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, os.path.join(path, ENTRY_NAME))
+
+    def materialize(self, keyed_items, model_name, root=STORE_ROOT, codec="dense", topk=None):
+        """Rebuild a model's store from cached objects: [(trio, language, key), ...].
+
+        The new store is assembled beside the old one and swapped in, keeping
+        the old store's activations and SAE features. Returns the store path.
+        """
+        building_root = os.path.join(root, ".building")
+        building_path = store_path(model_name, building_root)
+        shutil.rmtree(building_path, ignore_errors=True)
+        writer = StoreWriter(model_name, building_root, codec=codec, topk=topk)
+        for trio, language, key in keyed_items:
+            record = self.entry(key)
+            entry = {name: value for name, value in record.items() if name not in OBJECT_FIELDS}
+            entry["cache_key"] = key
+            writer.link_entry(trio, language, entry, self.object_path(key), record["num_layers"],
+                              record["num_heads"])
+            if record.get("response"):
+                writer.set_response(trio, language, record["response"])
+
+        path = store_path(model_name, root)
+        old = open_store(model_name, root)
+        for section in ("activations", "features"):
+            if old is not None and old.manifest.get(section):
+                os.replace(os.path.join(path, section), os.path.join(building_path, section))
+                writer.manifest[section] = old.manifest[section]
+        writer.close()
+        if os.path.exists(path):
+            retired = path + ".old"
+            shutil.rmtree(retired, ignore_errors=True)
+            os.replace(path, retired)
+            os.replace(building_path, path)
+            shutil.rmtree(retired)
+        else:
+            os.replace(building_path, path)
+        return path
+
+    def keys(self):
+        objects = os.path.join(self.root, "objects")
+        if not os.path.isdir(objects):
+            return []
+        return [key for prefix in os.listdir(objects) for key in os.listdir(os.path.join(objects, prefix))]
+
+    def size(self, key):
+        path = self.object_path(key)
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def prune(self, store_root=STORE_ROOT):
+        """Remove objects no store under `store_root` references; returns (objects, bytes) freed."""
+        used = set()
+        for model_name in list_stores(store_root):
+            store = open_store(model_name, store_root)
+            entries = store.manifest.get("entries", {})
+            used.update(entry.get("cache_key") for languages in entries.values() for entry in languages.values())
+        removed = freed = 0
+        for key in self.keys():
+            if key not in used:
+                freed += self.size(key)
+                shutil.rmtree(self.object_path(key))
+                removed += 1
+        return removed, freed
+
+
+def main():
+    """Report on or prune the extraction cache."""
+    parser = argparse.ArgumentParser(description="Content-addressed attention extraction cache.")
+    parser.add_argument("command", choices=["info", "prune"])
+    parser.add_argument("--cache-dir", default=CACHE_ROOT, help="cache directory")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory (for prune)")
+    args = parser.parse_args()
+
+    cache = ExtractionCache(args.cache_dir)
+    if args.command == "prune":
+        removed, freed = cache.prune(args.root)
+        print(f"Removed {removed} objects ({freed / 2**20:.1f} MiB)")
+    else:
+        keys = cache.keys()
+        total = sum(cache.size(key) for key in keys)
+        print(f"{len(keys)} objects, {total / 2**20:.1f} MiB in {args.cache_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Inverted index from prompt words to the heads that attend to them.
+
+Each head's last-token attention (from the head-statistics index) is summed
+over the tokens of every word of the prompt. The weights are stored as one
+postings list per term, sorted by weight:
+
+    term -> [(trio/language, layer, head, weight), ...]
+
+Answering "which heads put more than 0.3 of the last token's attention on
+'kinetic' or 'गतिज'?" is then one binary search per term, and a top-k query
+reads the head of the list. Terms are words compared case-insensitively
+without surrounding punctuation. The subword tokens of a multi-token word
+(' गति' + 'ज') are indexed on their own as well. Postings below `MIN_WEIGHT`
+are dropped, which keeps the index a few bytes per (prompt, word, head).
+
+The index is built with the head statistics at extraction time, one per store
+(or per shard of a corpus store):
+
+    python head_search.py build gemma2
+    python head_search.py query "kinetic गतिज" --threshold 0.3
+"""
+import argparse
+import os
+import re
+import sys
+import unicodedata
+
+import numpy as np
+
+from attention_store import STORE_ROOT, list_stores, open_store
+from head_stats import load_head_stats
+
+SEARCH_NAME = "head_search.npz"
+MIN_WEIGHT = 0.01
+TOP_K = 20
+COLUMNS = ["model", "trio", "language", "layer", "head", "term", "weight"]
+
+
+def normalize_term(text):
+    """Search form of a word or token: NFC, casefolded, without surrounding whitespace or punctuation."""
+    text = unicodedata.normalize("NFC", text).strip()
+    start, end = 0, len(text)
+    while start < end and unicodedata.category(text[start]).startswith("P"):
+        start += 1
+    while end > start and unicodedata.category(text[end - 1]).startswith("P"):
+        end -= 1
+    return text[start:end].casefold()
+
+
+def query_terms(query):
+    """Normalised terms of a query; whitespace, commas and slashes separate alternatives."""
+    terms = (normalize_term(part) for part in re.split(r"[\s,/]+", query))
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def prompt_weights(tokens, starts, last_attention):
+    """{term: (layers, heads) weight} of one prompt: words, then the subword tokens of multi-token words."""
+    last = np.asarray(last_attention, dtype=np.float32)
+    pooled = np.add.reduceat(last, starts, axis=-1)
+    bounds = list(starts) + [len(tokens)]
+    weights = {}
+
+    def add(text, values):
+        term = normalize_term(text)
+        if term:
+            weights[term] = weights[term] + values if term in weights else values
+
+    for i in range(len(starts)):
+        add("".join(tokens[bounds[i]:bounds[i + 1]]), pooled[..., i])
+    for i in range(len(starts)):
+        if bounds[i + 1] - bounds[i] > 1:
+            subwords = {}
+            for position in range(bounds[i], bounds[i + 1]):
+                term = normalize_term(tokens[position])
+                if term:
+                    subwords[term] = subwords.get(term, 0) + last[..., position]
+            # A word made of one meaningful token is already indexed as that word
+            word = normalize_term("".join(tokens[bounds[i]:bounds[i + 1]]))
+            for term, values in subwords.items():
+                if term != word:
+                    add(term, values)
+    return weights
+
+
+def build_head_search(store, min_weight=MIN_WEIGHT):
+    """Index every (trio, language) of an unsharded store from its head statistics; save beside the manifest."""
+    head_stats = load_head_stats(store)
+    if head_stats is None:
+        raise FileNotFoundError(f"No head statistics in {store.path}; run head_stats.py first")
+    keys = head_stats.arrays["keys"].tolist()
+    num_heads = head_stats.arrays["argmax"].shape[-1]
+    term_ids = {}
+    columns = {"term": [], "entry": [], "head": [], "weight": []}
+    for entry, key in enumerate(keys):
+        trio_name, lang = key.split("/")
+        weights = prompt_weights(store.tokens(trio_name, lang), store.word_starts(trio_name, lang),
+                                 head_stats.last_attention(trio_name, lang))
+        for term, values in weights.items():
+            flat_heads = np.flatnonzero(values >= min_weight)
+            term_id = term_ids.setdefault(term, len(term_ids))
+            columns["term"].append(np.full(len(flat_heads), term_id, dtype=np.int32))
+            columns["entry"].append(np.full(len(flat_heads), entry, dtype=np.int32))
+            columns["head"].append(flat_heads.astype(np.int32))
+            columns["weight"].append(values.ravel()[flat_heads].astype(np.float16))
+    postings = {name: np.concatenate(values or [np.zeros(0, dtype=np.int32)]) for name, values in columns.items()}
+
+    # Renumber terms in sorted order and sort each postings list by falling weight
+    terms = sorted(term_ids)
+    rank = np.empty(len(terms), dtype=np.int32)
+    rank[[term_ids[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+    term_column = rank[postings["term"]]
+    order = np.lexsort((-postings["weight"].astype(np.float32), term_column))
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_column, minlength=len(terms)), out=offsets[1:])
+
+    path = os.path.join(store.path, SEARCH_NAME)
+    np.savez(
+        path,
+        keys=np.array(keys),
+        terms=np.array(terms, dtype=str),
+        offsets=offsets,
+        entry=postings["entry"][order],
+        head=postings["head"][order],
+        weight=postings["weight"][order],
+        num_heads=np.array(num_heads),
+        min_weight=np.array(min_weight),
+    )
+    return path
+
+
+class HeadSearchIndex:
+    """Loaded inverted index of one store (or one shard)."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.arrays = {name: data[name] for name in data.files}
+        self.keys = [key.split("/") for key in self.arrays["keys"].tolist()]
+        self.terms = {term: i for i, term in enumerate(self.arrays["terms"].tolist())}
+        self.num_heads = int(self.arrays["num_heads"])
+        self.min_weight = float(self.arrays["min_weight"])
+        self.languages = sorted({lang for _, lang in self.keys})
+        self._language_ids = {lang: i for i, lang in enumerate(self.languages)}
+        self._entry_language = np.array([self._language_ids[lang] for _, lang in self.keys], dtype=np.int32)
+
+    def postings(self, term, threshold=None, k=None, languages=None):
+        """(entry, flat head, weight) arrays of a normalised term, heaviest first.
+
+        `threshold` keeps weights at or above it (a binary search on the
+        sorted list), `languages` filters entries and `k` keeps the first k.
+        """
+        i = self.terms.get(term)
+        if i is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float16)
+        start, stop = self.arrays["offsets"][i:i + 2]
+        weight = self.arrays["weight"][start:stop]
+        if threshold is not None:
+            stop = start + np.searchsorted(-weight, -np.float16(threshold), side="right")
+        rows = slice(start, stop)
+        entry, head, weight = self.arrays["entry"][rows], self.arrays["head"][rows], self.arrays["weight"][rows]
+        if languages is not None:
+            wanted = [self._language_ids[lang] for lang in languages if lang in self._language_ids]
+            keep = np.isin(self._entry_language[entry], wanted)
+            entry, head, weight = entry[keep], head[keep], weight[keep]
+        if k is not None:
+            entry, head, weight = entry[:k], head[:k], weight[:k]
+        return entry, head, weight
+
+    def complete(self, prefix, limit=10):
+        """Indexed terms starting with a (normalised) prefix, for query suggestions."""
+        terms = self.arrays["terms"]
+        start = np.searchsorted(terms, prefix)
+        stop = np.searchsorted(terms, prefix + "\U0010ffff")
+        return terms[start:min(stop, start + limit)].tolist()
+
+
+def load_head_search(store):
+    """Indexes of a store (one per shard of a corpus store), or None when none has been built."""
+    shards = store.manifest.get("shards")
+    parts = [store.shard(name) for name in shards] if shards is not None else [store]
+    paths = [os.path.join(part.path, SEARCH_NAME) for part in parts]
+    indexes = [HeadSearchIndex(path) for path in paths if os.path.exists(path)]
+    return indexes or None
+
+
+def search_heads(indexes, query, threshold=None, k=TOP_K, languages=None):
+    """Heads of every model whose last-token attention on any query term is heaviest.
+
+    `indexes` maps model names to `load_head_search` results. Returns a
+    DataFrame with COLUMNS, heaviest first, cut to k rows (None for all rows
+    above the threshold).
+    """
+    import pandas as pd
+
+    rows = {name: [] for name in COLUMNS}
+    for term in query_terms(query):
+        for model_name, parts in indexes.items():
+            for index in parts:
+                entry, head, weight = index.postings(term, threshold, k, languages)
+                rows["model"].extend([model_name] * len(entry))
+                rows["trio"].extend(index.keys[i][0] for i in entry)
+                rows["language"].extend(index.keys[i][1] for i in entry)
+                rows["layer"].append(head // index.num_heads)
+                rows["head"].append(head % index.num_heads)
+                rows["term"].extend([term] * len(entry))
+                rows["weight"].append(weight.astype(np.float32))
+    for name in ("layer", "head", "weight"):
+        rows[name] = np.concatenate(rows[name]) if rows[name] else np.zeros(0, dtype=int)
+    table = pd.DataFrame(rows, columns=COLUMNS)
+    table = table.sort_values("weight", ascending=False, kind="stable", ignore_index=True)
+    return table if k is None else table.head(k)
+
+
+def main():
+    """Build head-search indexes or query them across every model."""
+    parser = argparse.ArgumentParser(description="Search heads by the words their last token attends to.")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="(re)build the index of one or more stores")
+    build.add_argument("models", nargs="*", default=["gemma2"])
+    query = commands.add_parser("query", help="heads attending to any of the words in a query")
+    query.add_argument("query", help="words or tokens, e.g. 'kinetic गतिज'")
+    query.add_argument("--threshold", type=float, default=None, help="minimum weight (default: top-k only)")
+    query.add_argument("-k", type=int, default=TOP_K, help="rows to print (0 for all above the threshold)")
+    query.add_argument("--language", action="append", default=None, help="restrict to a language (repeatable)")
+    query.add_argument("--models", nargs="*", default=None, help="models to search (default: every store)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for model_name in args.models:
+            store = open_store(model_name, args.root)
+            if store is None:
+                print(f"Skipping {model_name}: no store under {args.root}")
+                continue
+            shards = store.manifest.get("shards")
+            for part in [store.shard(name) for name in shards] if shards is not None else [store]:
+                print(f"Wrote {build_head_search(part)}")
+        return 0
+
+    indexes = {}
+    for model_name in args.models or list_stores(args.root):
+        store = open_store(model_name, args.root)
+        parts = load_head_search(store) if store is not None else None
+        if parts is None:
+            print(f"Skipping {model_name}: no head-search index; run `python head_search.py build {model_name}`")
+            continue
+        indexes[model_name] = parts
+    table = search_heads(indexes, args.query, args.threshold, args.k or None, args.language)
+    print(table.to_string(index=False) if len(table) else "No heads match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
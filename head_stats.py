@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Per-head attention statistics, computed once per store and kept as a compact index.
+
+Each metric is an array of shape (entries, layers, heads) so the app can draw
+an all-heads grid without opening the raw attention tensors. The last-token
+distributions are ragged (one sequence length per prompt) and are stored
+concatenated along the key axis with an offsets array.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from attention_store import STORE_ROOT, open_store
+
+STATS_NAME = "head_stats.npz"
+
+# Metric name -> label shown in the app
+METRICS = {
+    "entropy": "Mean row entropy (nats)",
+    "last_entropy": "Last-token entropy (nats)",
+    "bos_mass": "BOS-sink mass",
+    "prev_mass": "Previous-token mass",
+    "diag_mass": "Diagonal (self) mass",
+    "last_max": "Last-token max weight",
+}
+
+
+def entropy(weights, axis=-1):
+    """Shannon entropy (nats) of distributions along `axis`; 0 log 0 is taken as 0."""
+    logs = np.log(weights, out=np.zeros_like(weights), where=weights > 0)
+    return -(weights * logs).sum(axis=axis)
+
+
+def compute_head_stats(attention):
+    """Compute every per-head metric for one (layers, heads, seq, seq) tensor in one pass.
+
+    Returns a dict of (layers, heads) arrays plus `argmax` (layers, heads) and
+    `last_attention` (layers, heads, seq).
+    """
+    weights = np.asarray(attention, dtype=np.float32)
+    seq_len = weights.shape[-1]
+    positions = np.arange(seq_len)
+
+    last = weights[..., -1, :]
+    total = last.sum(axis=-1, keepdims=True)
+    last = np.divide(last, total, out=np.zeros_like(last), where=total > 0)
+
+    stats = {
+        "entropy": entropy(weights).mean(axis=-1),
+        "last_entropy": entropy(last),
+        "diag_mass": weights[..., positions, positions].mean(axis=-1),
+        "last_max": last.max(axis=-1),
+        "argmax": last.argmax(axis=-1).astype(np.int32),
+        "last_attention": last.astype(np.float16),
+    }
+    if seq_len > 1:
+        # Row 0 can only attend to itself, so it is left out of the BOS/previous averages
+        stats["bos_mass"] = weights[..., 1:, 0].mean(axis=-1)
+        stats["prev_mass"] = weights[..., positions[1:], positions[:-1]].mean(axis=-1)
+    else:
+        stats["bos_mass"] = np.ones(weights.shape[:2], dtype=np.float32)
+        stats["prev_mass"] = np.zeros(weights.shape[:2], dtype=np.float32)
+    return stats
+
+
+def build_head_stats(store):
+    """Compute the index for every (trio, language) in a store and save it beside the manifest."""
+    from sparse_attention import sparse_head_stats
+
+    keys = []
+    metrics = {name: [] for name in METRICS}
+    argmax = []
+    last_attention = []
+    offsets = [0]
+    for trio_name in store.trios():
+        for lang in store.languages(trio_name):
+            if store.is_sparse(trio_name, lang):
+                stats = sparse_head_stats(store.sparse_tensor(trio_name, lang))
+            else:
+                stats = compute_head_stats(store.tensor(trio_name, lang))
+            keys.append(f"{trio_name}/{lang}")
+            for name in METRICS:
+                metrics[name].append(stats[name].astype(np.float32))
+            argmax.append(stats["argmax"])
+            last_attention.append(stats["last_attention"])
+            offsets.append(offsets[-1] + stats["last_attention"].shape[-1])
+
+    path = os.path.join(store.path, STATS_NAME)
+    np.savez(
+        path,
+        keys=np.array(keys),
+        argmax=np.stack(argmax),
+        last_attention=np.concatenate(last_attention, axis=-1),
+        offsets=np.array(offsets, dtype=np.int64),
+        **{name: np.stack(values) for name, values in metrics.items()},
+    )
+    return path
+
+
+class HeadStats:
+    """Loaded statistics index for one model."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.arrays = {name: data[name] for name in data.files}
+        self.index = {key: i for i, key in enumerate(self.arrays["keys"].tolist())}
+
+    def has_entry(self, trio, language):
+        return f"{trio}/{language}" in self.index
+
+    def metric(self, name, trio, language):
+        """(layers, heads) array of one metric for one prompt."""
+        return self.arrays[name][self.index[f"{trio}/{language}"]]
+
+    def argmax(self, trio, language):
+        return self.arrays["argmax"][self.index[f"{trio}/{language}"]]
+
+    def last_attention(self, trio, language):
+        """(layers, heads, seq) normalised last-token attention for one prompt."""
+        i = self.index[f"{trio}/{language}"]
+        start, stop = self.arrays["offsets"][i:i + 2]
+        return self.arrays["last_attention"][..., start:stop]
+
+
+def load_head_stats(store):
+    """Return the store's HeadStats, or None when the index has not been built."""
+    path = os.path.join(store.path, STATS_NAME)
+    if not os.path.exists(path):
+        return None
+    return HeadStats(path)
+
+
+def main():
+    """Build the per-head statistics index for one or more stores."""
+    parser = argparse.ArgumentParser(description="Precompute per-head attention statistics.")
+    parser.add_argument("models", nargs="*", default=["gemma2"], help="model names to index")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        store = open_store(model_name, args.root)
+        if store is None:
+            print(f"Skipping {model_name}: no store under {args.root}")
+            continue
+        print(f"Wrote {build_head_stats(store)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
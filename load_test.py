@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Simulate concurrent viewer sessions against one process and report latency and memory.
+
+Every session is a headless `streamlit.testing` run of the app in its own
+thread, so all sessions share the process-wide caches exactly like browser
+tabs on a hosted deployment. Each session clicks through random prompts,
+languages, layers and heads; per-rerun latency and process RSS are reported
+for each session count.
+
+    python load_test.py                     # 1, 2, 4, 8 sessions x 10 reruns
+    python load_test.py --sessions 1 16 32 --reruns 20 --json load_test.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attention_viz_exp1.py")
+LANGUAGES = ["English", "Hindi", "Hinglish"]
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _widget(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def run_session(seed, reruns, model_name, num_layers, num_heads, trios, start_barrier=None):
+    """One simulated visitor; returns the latency (seconds) of every rerun after the first."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    app = AppTest.from_file(APP_PATH, default_timeout=300)
+    app.run()
+    _widget(app.sidebar.selectbox, "Select Model").set_value(model_name)
+    app.run()
+    if start_barrier is not None:
+        start_barrier.wait()
+
+    latencies = []
+    for _ in range(reruns):
+        _widget(app.sidebar.selectbox, "Select Prompt").set_value(rng.choice(trios))
+        _widget(app.sidebar.radio, "Language").set_value(rng.choice(LANGUAGES))
+        _widget(app.sidebar.number_input, "Layer").set_value(rng.randrange(num_layers))
+        _widget(app.sidebar.number_input, "Head").set_value(rng.randrange(num_heads))
+        start = time.perf_counter()
+        app.run()
+        latencies.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(f"Session {seed} failed: {app.exception[0].value}")
+    return latencies
+
+
+def load_test(session_counts=(1, 2, 4, 8), reruns=10, model_name="gemma2"):
+    """Run each session count in turn (in one process) and collect latency/RSS rows."""
+    from attention_store import open_store
+
+    store = open_store(model_name)
+    if store is None:
+        raise FileNotFoundError(f"No attention store for {model_name}")
+    trios = store.trios()
+
+    rows = []
+    for count in session_counts:
+        barrier = threading.Barrier(count)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            futures = [pool.submit(run_session, seed, reruns, model_name, store.num_layers,
+                                   store.num_heads, trios, barrier)
+                       for seed in range(count)]
+            latencies = np.concatenate([future.result() for future in futures])
+        wall = time.perf_counter() - start
+        rss = rss_bytes() / 2**20
+        rows.append({
+            "sessions": count,
+            "reruns": int(latencies.size),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "max_ms": float(latencies.max() * 1000),
+            "reruns_per_sec": float(latencies.size / wall),
+            "rss_mib": rss,
+            # Memory added per extra session since the smallest run
+            "rss_per_session_mib": ((rss - rows[0]["rss_mib"]) / (count - rows[0]["sessions"])
+                                    if rows and count > rows[0]["sessions"] else None),
+        })
+    return rows
+
+
+def main():
+    """Run the concurrent-session load test and print (or save) the results."""
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the viewer.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="session counts to simulate, in order")
+    parser.add_argument("--reruns", type=int, default=10, help="widget changes per session")
+    parser.add_argument("--model", default="gemma2", help="model store to browse")
+    parser.add_argument("--json", default=None, help="also write the rows to this JSON file")
+    args = parser.parse_args()
+
+    # The app resolves its store and fonts relative to the repository
+    os.chdir(os.path.dirname(APP_PATH))
+    rows = load_test(args.sessions, args.reruns, args.model)
+    print(f"{'sessions':>8}{'reruns':>8}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+          f"{'reruns/s':>10}{'RSS MiB':>9}{'MiB/session':>13}")
+    for row in rows:
+        per_session = row["rss_per_session_mib"]
+        print(f"{row['sessions']:>8}{row['reruns']:>8}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['max_ms']:>9.1f}{row['reruns_per_sec']:>10.1f}{row['rss_mib']:>9.1f}"
+              f"{'' if per_session is None else f'{per_session:.1f}':>13}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Cross-model comparison of attention on the same prompt.
+
+Two models rarely share a shape: Gemma-2-2B has 26 layers of 8 heads,
+Llama-3.2-1B 16 layers of 32, and their tokenisers split a prompt
+differently. Comparisons are made in a shared frame instead:
+
+- depth: layer l of model A is paired with the layer of model B at the same
+  relative depth, round(l * (layers_B - 1) / (layers_A - 1));
+- heads: each head of A is matched with the head of the paired B layer whose
+  statistics profile (the head_stats metrics, averaged over the prompts both
+  stores hold and standardised per metric) is closest;
+- tokens: both tokenisations are mapped onto the prompt's whitespace words
+  (plus one slot for special tokens such as BOS) by character offsets, and
+  attention is pooled to that grid like `word_spans.pool_words`, so the two
+  matrices have the same shape and can be subtracted.
+
+Only prompt tokens are compared; responses captured during generation differ
+between models.
+
+    python model_diff.py gemma2 Llama3.2 trio1 hindi   # most divergent head pairs
+"""
+import argparse
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from attention_store import STORE_ROOT, open_store
+from cross_lingual import jensen_shannon, token_char_spans
+from head_stats import METRICS, load_head_stats
+
+SPECIAL_LABEL = "<s>"
+
+
+def depth_pairs(num_layers_a, num_layers_b):
+    """(layers_A,) layer of B at the same relative depth as each layer of A."""
+    if num_layers_a == 1:
+        return np.zeros(1, dtype=int)
+    return np.rint(np.arange(num_layers_a) * (num_layers_b - 1) / (num_layers_a - 1)).astype(int)
+
+
+def head_profiles(head_stats, keys=None):
+    """(layers, heads, metrics) head statistics averaged over prompt keys ("trio/language"; default all)."""
+    rows = slice(None) if keys is None else [head_stats.index[key] for key in keys]
+    return np.stack([head_stats.arrays[metric][rows].mean(axis=0) for metric in METRICS], axis=-1)
+
+
+def match_heads(profile_a, profile_b, pairs):
+    """Closest B head (in the paired layer) for every head of A, and the standardised distance."""
+    metrics = profile_a.shape[-1]
+    pooled = np.concatenate([profile_a.reshape(-1, metrics), profile_b.reshape(-1, metrics)])
+    mean, std = pooled.mean(axis=0), pooled.std(axis=0)
+    std[std == 0] = 1
+    z_a, z_b = (profile_a - mean) / std, (profile_b - mean) / std
+    distance = np.sqrt(((z_a[:, :, None, :] - z_b[pairs][:, None, :, :]) ** 2).sum(axis=-1))
+    matched = distance.argmin(axis=-1)
+    return matched, np.take_along_axis(distance, matched[..., None], axis=-1)[..., 0]
+
+
+def prompt_segments(prompt):
+    """Labels of the shared grid: the special-token slot, then each whitespace word."""
+    return [SPECIAL_LABEL] + re.findall(r"\S+", prompt)
+
+
+def segment_ids(tokens, prompt):
+    """(seq,) grid slot of each token: 0 for tokens that decode to nothing, else 1 + word index."""
+    word_ends = [match.end() for match in re.finditer(r"\S+", prompt)]
+    ids = np.zeros(len(tokens), dtype=np.intp)
+    for i, (start, end) in enumerate(token_char_spans(tokens, prompt)):
+        if end > start:
+            # A leading space belongs to the word that follows it
+            ids[i] = 1 + min(np.searchsorted(word_ends, start, side="right"), len(word_ends) - 1)
+    return ids
+
+
+def segment_assignment(ids, count):
+    """(seq, count) one-hot matrix of token -> slot."""
+    assignment = np.zeros((len(ids), count), dtype=np.float32)
+    assignment[np.arange(len(ids)), ids] = 1
+    return assignment
+
+
+def pool_segments(attention, ids, count):
+    """Pool (..., seq, seq) attention onto `count` slots: keys summed, queries averaged.
+
+    Slots no token maps to (e.g. no BOS) stay zero.
+    """
+    assignment = segment_assignment(ids, count)
+    pooled = assignment.T @ (np.asarray(attention, dtype=np.float32) @ assignment)
+    counts = assignment.sum(axis=0)
+    return np.divide(pooled, counts[:, None], out=np.zeros_like(pooled), where=counts[:, None] > 0)
+
+
+class _Side:
+    """One model's store and head statistics, with the prompt-only view of an entry."""
+
+    def __init__(self, store, head_stats):
+        self.store = store
+        self.head_stats = head_stats
+
+    def prompt_len(self, trio, language):
+        generation = self.store.generation(trio, language)
+        return generation["prompt_len"] if generation else len(self.store.tokens(trio, language))
+
+    def ids(self, trio, language):
+        length = self.prompt_len(trio, language)
+        return segment_ids(self.store.tokens(trio, language)[:length], self.store.prompt(trio, language))
+
+    def last_rows(self, trio, language, count):
+        """(layers, heads, slots) last prompt token's attention pooled onto the grid, normalised."""
+        length = self.prompt_len(trio, language)
+        if length == len(self.store.tokens(trio, language)) and self.head_stats.has_entry(trio, language):
+            rows = self.head_stats.last_attention(trio, language).astype(np.float32)
+        else:
+            rows = np.asarray(self.store.tensor(trio, language)[:, :, length - 1, :length], dtype=np.float32)
+        pooled = rows @ segment_assignment(self.ids(trio, language), count)
+        total = pooled.sum(axis=-1, keepdims=True)
+        return np.divide(pooled, total, out=np.zeros_like(pooled), where=total > 0)
+
+    def head(self, trio, language, layer, head, count):
+        length = self.prompt_len(trio, language)
+        # Pooled right away, so the decoder's reused buffer is enough
+        matrix = self.store.head_view(trio, language, layer, head)[:length, :length]
+        return pool_segments(matrix, self.ids(trio, language), count)
+
+
+class ModelDiff:
+    """Two models' stores aligned by relative depth and head statistics; safe to share across sessions.
+
+    Per-prompt work for model B runs on a short-lived second thread while the
+    calling thread does model A's, so a comparison costs about as much as the
+    slower model alone and no threads outlive it.
+    """
+
+    def __init__(self, store_a, head_stats_a, store_b, head_stats_b):
+        self.a = _Side(store_a, head_stats_a)
+        self.b = _Side(store_b, head_stats_b)
+        self.pairs = depth_pairs(store_a.num_layers, store_b.num_layers)
+        shared = [key for key in head_stats_a.index if key in head_stats_b.index]
+        self.shared_prompts = len(shared)
+        self.matched, self.distance = match_heads(head_profiles(head_stats_a, shared or None),
+                                                  head_profiles(head_stats_b, shared or None), self.pairs)
+        self._last_rows = {}
+        self._lock = threading.Lock()
+
+    def has_entry(self, trio, language):
+        """Whether both stores hold this prompt, with the same text."""
+        return (self.a.store.has_entry(trio, language) and self.b.store.has_entry(trio, language)
+                and self.a.store.prompt(trio, language) == self.b.store.prompt(trio, language))
+
+    def partner(self, layer, head):
+        """(layer, head) of B aligned with a head of A."""
+        return int(self.pairs[layer]), int(self.matched[layer, head])
+
+    def _both(self, fn_a, fn_b):
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-diff") as pool:
+            future = pool.submit(fn_b)
+            return fn_a(), future.result()
+
+    def last_rows(self, trio, language):
+        """Grid labels and both models' (layers, heads, slots) last-token attention for one prompt."""
+        key = (trio, language)
+        with self._lock:
+            cached = self._last_rows.get(key)
+        if cached is None:
+            labels = prompt_segments(self.a.store.prompt(trio, language))
+            rows_a, rows_b = self._both(lambda: self.a.last_rows(trio, language, len(labels)),
+                                        lambda: self.b.last_rows(trio, language, len(labels)))
+            cached = labels, rows_a, rows_b
+            with self._lock:
+                self._last_rows[key] = cached
+        return cached
+
+    def head_matrices(self, trio, language, layer, head):
+        """Grid labels and the (slots, slots) attention of an A head and its aligned B head."""
+        labels = prompt_segments(self.a.store.prompt(trio, language))
+        layer_b, head_b = self.partner(layer, head)
+        matrix_a, matrix_b = self._both(lambda: self.a.head(trio, language, layer, head, len(labels)),
+                                        lambda: self.b.head(trio, language, layer_b, head_b, len(labels)))
+        return labels, matrix_a, matrix_b
+
+    def layer_divergence(self, trio, language):
+        """(layers_A,) JSD (bits) between the head-averaged last-token attention of aligned layers."""
+        _, rows_a, rows_b = self.last_rows(trio, language)
+        return jensen_shannon(rows_a.mean(axis=1), rows_b[self.pairs].mean(axis=1))
+
+    def divergent_heads(self, trio, language):
+        """Table of every A head with its aligned B head, most divergent last-token attention first."""
+        import pandas as pd
+
+        _, rows_a, rows_b = self.last_rows(trio, language)
+        layers, heads = np.indices(self.matched.shape)
+        partner_rows = rows_b[self.pairs[layers], self.matched]
+        table = pd.DataFrame({
+            "layer A": layers.ravel(),
+            "head A": heads.ravel(),
+            "layer B": self.pairs[layers].ravel(),
+            "head B": self.matched.ravel(),
+            "profile distance": self.distance.ravel(),
+            "jsd": jensen_shannon(rows_a, partner_rows).ravel(),
+        })
+        return table.sort_values("jsd", ascending=False, ignore_index=True)
+
+
+def load_model_diff(model_a, model_b, root=STORE_ROOT):
+    """ModelDiff of two stores, or None when either store or head-stats index is missing.
+
+    Callers that already hold the stores and head statistics (the app) build
+    ModelDiff directly.
+    """
+    store_a, store_b = open_store(model_a, root), open_store(model_b, root)
+    if store_a is None or store_b is None:
+        return None
+    stats_a, stats_b = load_head_stats(store_a), load_head_stats(store_b)
+    if stats_a is None or stats_b is None:
+        return None
+    return ModelDiff(store_a, stats_a, store_b, stats_b)
+
+
+def main():
+    """Print the head pairs of two models whose attention on one prompt differs most."""
+    parser = argparse.ArgumentParser(description="Compare two models' attention on the same prompt.")
+    parser.add_argument("model_a")
+    parser.add_argument("model_b")
+    parser.add_argument("trio")
+    parser.add_argument("language")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    parser.add_argument("-n", type=int, default=20, help="rows to print")
+    args = parser.parse_args()
+
+    diff = load_model_diff(args.model_a, args.model_b, args.root)
+    if diff is None:
+        print(f"Need stores with head statistics for {args.model_a} and {args.model_b} under {args.root}")
+        return 1
+    if not diff.has_entry(args.trio, args.language):
+        print(f"{args.trio}/{args.language} is not in both stores")
+        return 1
+    depth = diff.layer_divergence(args.trio, args.language)
+    print("Layer JSD (A layer -> B layer): " + ", ".join(f"{layer}->{diff.pairs[layer]} {value:.3f}"
+                                                         for layer, value in enumerate(depth)))
+    print(diff.divergent_heads(args.trio, args.language).head(args.n).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
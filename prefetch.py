@@ -0,0 +1,149 @@
+"""Background pre-rendering of neighbouring heads, and layer-sweep animations.
+
+After a *Head detail* view is drawn, the app hands the views one step away
+(layer +-1, head +-1) to a small thread pool that slices and renders them
+ahead of time. Finished figures wait in a memory-only LRU of their own,
+bounded by `PREFETCH_BYTES`, and move into the shared render cache only when
+a session actually shows them, so speculative work never evicts real views.
+Each session's queued jobs are cancelled when it moves on, so the queue only
+ever holds the neighbourhood of the views currently on screen.
+
+The layer sweep reuses the same jobs for every layer of one head and stitches
+the heatmaps into an animated GIF that the browser plays.
+"""
+import functools
+import io
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from attention_render import (RENDER_SETTINGS, draw_heatmap, draw_token_bar, get_font_for_language,
+                              has_font_for_language, last_token_attention, render_figure,
+                              render_heatmap_image)
+from render_cache import RenderCache, make_key
+
+PREFETCH_WORKERS = 2
+PREFETCH_BYTES = 32 * 2**20
+SWEEP_WIDTH = 800
+
+
+def head_view_key(model_name, store, trio, language, layer, head, granularity="Token", query_position=None):
+    """Render-cache key parts of one Head detail view (shared by the app and the prefetcher)."""
+    return (model_name, store.version, trio, language, int(layer), int(head),
+            tuple(sorted(RENDER_SETTINGS.items())), has_font_for_language(language), granularity,
+            query_position)
+
+
+def head_view_renders(view_key, heatmap_mode, tokens, attention, language, layer, head):
+    """{"token_bar"/"heatmap": (render-cache key, render function)} for one view.
+
+    `attention` returns the view's (seq, seq) matrix and is only called once
+    something has to be drawn. Interactive heatmaps are Altair charts, not
+    cached images, so that mode only has a token bar.
+    """
+    attention = functools.cache(attention)
+
+    # Slicing happens before the figure lock is taken; only drawing holds it
+    def token_bar():
+        weights = last_token_attention(attention(), tokens)
+        return render_figure(lambda: draw_token_bar(tokens, weights, get_font_for_language(language)))
+
+    def annotated_heatmap():
+        matrix = attention()[:len(tokens), :len(tokens)]
+        return render_figure(lambda: draw_heatmap(matrix, tokens, layer, head, get_font_for_language(language)))
+
+    renders = {"token_bar": (make_key("token_bar", *view_key), token_bar)}
+    if heatmap_mode == "Image":
+        renders["heatmap"] = (make_key("heatmap_image", *view_key),
+                              lambda: render_heatmap_image(attention()[:len(tokens), :len(tokens)]))
+    elif heatmap_mode == "Annotated":
+        renders["heatmap"] = (make_key("heatmap", *view_key), annotated_heatmap)
+    return renders
+
+
+def neighbours(layer, head, num_layers, num_heads):
+    """(layer, head) positions one step away in the sidebar inputs."""
+    steps = [(layer + 1, head), (layer - 1, head), (layer, head + 1), (layer, head - 1)]
+    return [(l, h) for l, h in steps if 0 <= l < num_layers and 0 <= h < num_heads]
+
+
+class Prefetcher:
+    """Thread pool rendering views ahead of time into a bounded side cache."""
+
+    def __init__(self, render_cache, workers=PREFETCH_WORKERS, budget_bytes=PREFETCH_BYTES):
+        self.render_cache = render_cache
+        self.frames = RenderCache(directory=None, memory_bytes=budget_bytes)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._pending = {}
+        self._queued = {}
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "used": 0}
+
+    def prefetch(self, renders, owner):
+        """Queue the figures of one view that are not cached or queued yet."""
+        with self._lock:
+            missing = [(key, render) for key, render in renders.values()
+                       if key not in self._pending and not self.frames.contains(key)
+                       and not self.render_cache.contains(key)]
+            if not missing:
+                return
+            future = self._pool.submit(self._run, missing)
+            for key, _ in missing:
+                self._pending[key] = future
+            self._queued.setdefault(owner, []).append(future)
+            self.stats["submitted"] += len(missing)
+        future.add_done_callback(functools.partial(self._forget, [key for key, _ in missing]))
+
+    def cancel(self, owner):
+        """Drop an owner's jobs that have not started; running ones finish."""
+        with self._lock:
+            futures = self._queued.pop(owner, [])
+        for future in futures:
+            future.cancel()
+
+    def _run(self, items):
+        for key, render in items:
+            self.frames.put(key, render())
+
+    def _forget(self, keys, future):
+        with self._lock:
+            for key in keys:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+
+    def take(self, key):
+        """A prefetched figure (waiting for it if its job is running), or None."""
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            try:
+                future.result()
+            except CancelledError:
+                pass
+        data = self.frames.pop(key)
+        if data is not None:
+            with self._lock:
+                self.stats["used"] += 1
+        return data
+
+    def render(self, key, render):
+        """Render-cache lookup that falls back to a prefetched figure, then to rendering."""
+        return self.render_cache.get_or_render(key, lambda: self.take(key) or render())
+
+
+def sweep_animation(frames, duration_ms, labels=None, width=SWEEP_WIDTH):
+    """Animated GIF (looping) of PNG frames scaled to `width`, optionally captioned."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i, data in enumerate(frames):
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert("RGB")
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if labels is not None:
+            ImageDraw.Draw(image).text((8, 8), labels[i], fill="black")
+        images.append(image.convert("P", palette=Image.ADAPTIVE))
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="GIF", save_all=True, append_images=images[1:], duration=duration_ms,
+                   loop=0)
+    return buffer.getvalue()
@@ -0,0 +1,50 @@
+# Trilingual prompt trios shared by the app and the extraction scripts
+all_prompts = {
+    "trio1": {
+        "english": "Will you please help me understand the concept of kinetic energy?",
+        "hindi": "क्या आप कृपया मुझे गतिज ऊर्जा की अवधारणा को समझने में मदद करेंगे?",
+        "hinglish": "Kya aap mujhe kinetic energy ke concept ko samajhne mein help karoge?"
+    },
+    "trio2": {
+        "english": "I want you to tell me a secret about the stars tonight.",
+        "hindi": "मैं चाहता हूँ कि आप आज रात मुझे सितारों के बारे में एक रहस्य बताएँ।",
+        "hinglish": "Main chahta hoon ki aaj raat aap mujhe stars ke baare mein ek secret batao."
+    },
+    "trio3": {
+        "english": "I understand kinetic energy.",
+        "hindi": "मुझे काइनेटिक ऊर्जा समझ आती है।",
+        "hinglish": "Mujhe kinetic energy samajh aata hai."
+    },
+    "trio4": {
+        "english": "Can you help me learn about gravity?",
+        "hindi": "क्या आप मुझे गुरुत्वाकर्षण के बारे में सिखा सकते हैं?",
+        "hinglish": "Kya aap mujhe gravity ke bare mein sikha sakte hain?"
+    }
+}
+
+# The same concept in each language of a trio, used to align attention across
+# languages whose tokenisations differ. Phrases are matched case-insensitively
+# against the prompt text.
+concept_alignments = {
+    "trio1": [
+        {"english": "kinetic energy", "hindi": "गतिज ऊर्जा", "hinglish": "kinetic energy"},
+        {"english": "concept", "hindi": "अवधारणा", "hinglish": "concept"},
+        {"english": "understand", "hindi": "समझने", "hinglish": "samajhne"},
+        {"english": "help", "hindi": "मदद", "hinglish": "help"}
+    ],
+    "trio2": [
+        {"english": "secret", "hindi": "रहस्य", "hinglish": "secret"},
+        {"english": "stars", "hindi": "सितारों", "hinglish": "stars"},
+        {"english": "tonight", "hindi": "आज रात", "hinglish": "aaj raat"},
+        {"english": "tell", "hindi": "बताएँ", "hinglish": "batao"}
+    ],
+    "trio3": [
+        {"english": "kinetic energy", "hindi": "काइनेटिक ऊर्जा", "hinglish": "kinetic energy"},
+        {"english": "understand", "hindi": "समझ", "hinglish": "samajh"}
+    ],
+    "trio4": [
+        {"english": "gravity", "hindi": "गुरुत्वाकर्षण", "hinglish": "gravity"},
+        {"english": "learn", "hindi": "सिखा", "hinglish": "sikha"},
+        {"english": "about", "hindi": "के बारे में", "hinglish": "ke bare mein"}
+    ]
+}
@@ -0,0 +1,142 @@
+"""Two-tier (memory LRU + bounded disk) cache of encoded figure bytes."""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+RENDER_CACHE_DIR = ".render_cache"
+
+
+def make_key(*parts):
+    """Stable hex key for a (model, trio, language, layer, head, settings...) tuple."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered image bytes with a size-bounded on-disk tier.
+
+    The memory tier evicts least-recently-used entries once `memory_bytes` is
+    exceeded; the disk tier survives restarts and evicts the oldest files
+    (by access time recorded in mtime) once `disk_bytes` is exceeded.
+    Safe to share between Streamlit sessions (threads).
+    """
+
+    def __init__(self, directory=RENDER_CACHE_DIR, memory_bytes=64 * 2**20,
+                 disk_bytes=512 * 2**20):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._disk_size = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_size = sum(entry.stat().st_size for entry in os.scandir(directory)
+                                  if entry.is_file() and not entry.name.endswith(".tmp"))
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key):
+        """Return cached bytes or None, promoting disk hits into memory."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+        if self.directory:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self._remember(key, data)
+                    self.stats["disk_hits"] += 1
+                return data
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def contains(self, key):
+        """Whether either tier holds `key` (not counted as a hit or miss)."""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return bool(self.directory) and os.path.exists(self._disk_path(key))
+
+    def pop(self, key):
+        """Remove and return an entry from the memory tier, or None."""
+        with self._lock:
+            data = self._memory.pop(key, None)
+            if data is not None:
+                self._memory_size -= len(data)
+        return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        if not self.directory or len(data) > self.disk_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # Rewriting a key replaces its file, so only the size difference counts
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._disk_size += len(data) - replaced
+            over_budget = self._disk_size > self.disk_bytes
+        if over_budget:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete least recently used files until the disk tier fits its budget."""
+        entries = [entry for entry in os.scandir(self.directory)
+                   if entry.is_file() and not entry.name.endswith(".tmp")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._disk_size = total
+
+    def get_or_render(self, key, render):
+        """Return cached bytes for `key`, calling `render()` to produce them on a miss."""
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def counters(self):
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._memory),
+                        memory_bytes=self._memory_size, disk_bytes=self._disk_size)
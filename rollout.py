@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Attention rollout across depth, built incrementally from the stored tensors.
+
+Each layer's transition is the head-averaged attention mixed with the residual
+stream and renormalised, A_l = norm(r * I + (1 - r) * mean_h attention_l)
+(Abnar & Zuidema, 2020). Rollout through layer L is A_L @ ... @ A_0. Every
+prefix is kept, so asking for layer L after layer K < L only multiplies the
+layers in between, and going back to a lower layer is a lookup.
+
+The last row of each prefix is the last token's rollout: how much of each
+input token has reached the final token by that depth. This is rollout, not
+the max-flow *attention flow* of the same paper.
+
+    python rollout.py gemma2 trio1 hindi          # last token's rollout per layer
+"""
+import argparse
+import sys
+import threading
+
+import numpy as np
+
+from attention_store import STORE_ROOT, open_store
+
+RESIDUAL_WEIGHT = 0.5
+
+
+class Rollout:
+    """Rollout prefixes of one prompt, extended on demand and safe to share across sessions."""
+
+    def __init__(self, store, trio, language, residual=RESIDUAL_WEIGHT):
+        self.store = store
+        self.trio = trio
+        self.language = language
+        self.residual = residual
+        self.seq_len = len(store.tokens(trio, language))
+        self.prefixes = []
+        self._lock = threading.Lock()
+
+    def transition(self, layer):
+        """Residual-corrected, row-normalised head-mean attention of one layer."""
+        mean = np.zeros((self.seq_len, self.seq_len), dtype=np.float64)
+        for head in range(self.store.num_heads):
+            mean += self.store.head(self.trio, self.language, layer, head)[:self.seq_len, :self.seq_len]
+        mean /= self.store.num_heads
+        transition = self.residual * np.eye(self.seq_len) + (1 - self.residual) * mean
+        return transition / transition.sum(axis=-1, keepdims=True)
+
+    def at(self, layer):
+        """(seq, seq) rollout through `layer`, computing only the layers not seen yet."""
+        with self._lock:
+            while len(self.prefixes) <= layer:
+                transition = self.transition(len(self.prefixes))
+                self.prefixes.append(transition @ self.prefixes[-1] if self.prefixes else transition)
+            return self.prefixes[layer]
+
+    def last_token_rollout(self, layer):
+        """(layer + 1, seq) rollout row of the last token at every depth up to `layer`."""
+        self.at(layer)
+        return np.stack([prefix[-1] for prefix in self.prefixes[:layer + 1]])
+
+
+def main():
+    """Print the last token's rollout over every input token, layer by layer."""
+    parser = argparse.ArgumentParser(description="Attention rollout for one stored prompt.")
+    parser.add_argument("model")
+    parser.add_argument("trio")
+    parser.add_argument("language")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    parser.add_argument("--residual", type=float, default=RESIDUAL_WEIGHT, help="identity weight per layer")
+    args = parser.parse_args()
+
+    store = open_store(args.model, args.root)
+    if store is None:
+        print(f"No store for {args.model} under {args.root}")
+        return 1
+    tokens = store.tokens(args.trio, args.language)
+    rows = Rollout(store, args.trio, args.language, args.residual).last_token_rollout(store.num_layers - 1)
+    width = max(len(repr(token)) for token in tokens)
+    print(f"{'token':<{width}}" + "".join(f"{'L' + str(layer):>7}" for layer in range(len(rows))))
+    for i, token in enumerate(tokens):
+        print(f"{token!r:<{width}}" + "".join(f"{value:7.3f}" for value in rows[:, i]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
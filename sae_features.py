@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""Sparse autoencoder (SAE) features of stored residual-stream activations.
+
+An SAE trained on one layer's residual stream maps a token's vector x to
+activations f = act((x - b_dec) @ W_enc + b_enc) over a dictionary of d_sae
+features: ReLU, or JumpReLU with a per-feature `threshold` as in Gemma Scope.
+Weights are read from a local file (`.npz` such as Gemma Scope's params.npz,
+`.safetensors`, or a torch state dict) holding W_enc (d_model, d_sae), b_enc,
+b_dec and optionally threshold.
+
+`encode_store` pushes the activations captured by
+`extract_attention.py --activations` through the encoder on CPU. Tokens of
+many prompts are stacked into row batches (bounded by `BATCH_BYTES` of
+feature activations) so each batch is one large matrix product, and only the
+`TOP_K` strongest features of each token are kept:
+
+    attention_store/<model>/features/<name>/<trio>/<language>.indices.npy  # (seq, k) int32, -1 = unused
+    attention_store/<model>/features/<name>/<trio>/<language>.values.npy   # (seq, k) float16
+    attention_store/<model>/features/<name>/summary.npz
+
+The summary counts, per language, how many tokens each feature fires on
+(before the top-k cut, special tokens left out), so features can be ranked
+by language without opening a single per-token file.
+
+    python extract_attention.py --model-id google/gemma-2-2b-it --name gemma2 --activations
+    python sae_features.py encode gemma2 --sae gemma-scope/layer_12/width_16k/params.npz --layer 12
+    python sae_features.py top gemma2 layer12 hindi hinglish
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from attention_store import ACTIVATIONS_TAG, STORE_ROOT, StoreWriter, open_store
+from cross_lingual import LANGUAGES
+from sparse_attention import topk_rows
+
+TOP_K = 32
+BATCH_BYTES = 128 * 2**20
+SUMMARY_NAME = "summary.npz"
+
+
+class SparseAutoencoder:
+    """Encoder half of an SAE, in float32 numpy."""
+
+    def __init__(self, w_enc, b_enc, b_dec, threshold=None):
+        self.w_enc = np.ascontiguousarray(w_enc, dtype=np.float32)
+        self.b_enc = np.asarray(b_enc, dtype=np.float32)
+        self.b_dec = np.asarray(b_dec, dtype=np.float32)
+        self.threshold = None if threshold is None else np.asarray(threshold, dtype=np.float32)
+        self.d_model, self.d_sae = self.w_enc.shape
+
+    @classmethod
+    def random(cls, d_model, d_sae, seed=0):
+        """Random JumpReLU SAE for pipeline checks (e.g. on the --tiny store); its features mean nothing."""
+        rng = np.random.default_rng(seed)
+        return cls(rng.standard_normal((d_model, d_sae)) / np.sqrt(d_model), np.zeros(d_sae),
+                   np.zeros(d_model), np.ones(d_sae))
+
+    def encode(self, x):
+        """(rows, d_sae) feature activations of (rows, d_model) inputs."""
+        pre = (np.asarray(x, dtype=np.float32) - self.b_dec) @ self.w_enc
+        pre += self.b_enc
+        if self.threshold is not None:
+            pre *= pre > self.threshold
+        else:
+            np.maximum(pre, 0, out=pre)
+        return pre
+
+
+def load_sae(path):
+    """Read SAE weights from .npz, .safetensors or a torch state dict (.pt/.pth)."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            params = {name: data[name] for name in data.files}
+    elif path.endswith(".safetensors"):
+        from safetensors.numpy import load_file
+
+        params = load_file(path)
+    else:
+        import torch
+
+        params = {name: tensor.float().numpy() for name, tensor in torch.load(path, map_location="cpu").items()}
+    missing = [name for name in ("W_enc", "b_enc", "b_dec") if name not in params]
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(missing)}; expected W_enc (d_model, d_sae), b_enc and b_dec")
+    return SparseAutoencoder(params["W_enc"], params["b_enc"], params["b_dec"], params.get("threshold"))
+
+
+def top_k(features, k):
+    """(rows, k) ids and float16 activations of each row's strongest features, strongest first.
+
+    Rows with fewer than k active features are padded with id -1 and 0.
+    """
+    indices, values = topk_rows(features, k)
+    indices = indices.astype(np.int32)
+    indices[values <= 0] = -1
+    return indices, np.maximum(values, 0).astype(np.float16)
+
+
+def encode_store(model_name, sae, name, layer, root=STORE_ROOT, tag=ACTIVATIONS_TAG, k=TOP_K,
+                 batch_bytes=BATCH_BYTES, sae_path=None):
+    """Encode every prompt's layer-`layer` activations into the feature set `name`.
+
+    Returns a dict with the token count, batch count and wall time.
+    """
+    store = open_store(model_name, root)
+    if store is None or tag not in store.activation_tags():
+        raise FileNotFoundError(f"No '{tag}' activations for {model_name}; "
+                                f"run extract_attention.py --activations first")
+    start = time.perf_counter()
+    writer = StoreWriter(model_name, root)
+    # Re-encoding replaces the whole set, so prompts dropped since leave nothing behind
+    writer.manifest.get("features", {}).pop(name, None)
+    shutil.rmtree(os.path.join(writer.path, "features", name), ignore_errors=True)
+
+    counts = np.zeros((len(LANGUAGES), sae.d_sae), dtype=np.int64)
+    sums = np.zeros((len(LANGUAGES), sae.d_sae), dtype=np.float64)
+    tokens = np.zeros(len(LANGUAGES), dtype=np.int64)
+    batch_rows = max(1, batch_bytes // (4 * sae.d_sae))
+    pending = []
+    totals = {"tokens": 0, "batches": 0}
+
+    def flush():
+        x = np.concatenate([activations for _, _, activations, _ in pending])
+        row_language = np.concatenate([np.full(len(activations), LANGUAGES.index(lang))
+                                       for _, lang, activations, _ in pending])
+        counted = np.concatenate([~special for _, _, _, special in pending])
+        indices, values = [], []
+        for batch_start in range(0, len(x), batch_rows):
+            rows = slice(batch_start, batch_start + batch_rows)
+            features = sae.encode(x[rows])
+            batch_indices, batch_values = top_k(features, k)
+            indices.append(batch_indices)
+            values.append(batch_values)
+            for l in np.unique(row_language[rows]):
+                selected = features[(row_language[rows] == l) & counted[rows]]
+                counts[l] += np.count_nonzero(selected, axis=0)
+                sums[l] += selected.sum(axis=0)
+                tokens[l] += len(selected)
+            totals["batches"] += 1
+        indices, values = np.concatenate(indices), np.concatenate(values)
+        offset = 0
+        for trio_name, lang, activations, _ in pending:
+            stop = offset + len(activations)
+            writer.add_features(name, trio_name, lang, indices[offset:stop], values[offset:stop])
+            offset = stop
+        totals["tokens"] += len(x)
+        pending.clear()
+
+    rows = 0
+    for trio_name, languages in store.manifest["activations"][tag].items():
+        for lang in languages:
+            if lang not in LANGUAGES:
+                continue
+            entry = store.activation_entry(tag, trio_name, lang)
+            array = store.activations(tag, trio_name, lang)
+            layers = entry.get("layers")
+            if layers is not None:
+                if layer not in layers:
+                    raise ValueError(f"Layer {layer} was not captured; '{tag}' has layers {layers}")
+                array = array[layers.index(layer)]
+            if array.shape[-1] != sae.d_model:
+                raise ValueError(f"SAE expects {sae.d_model}-dimensional inputs, "
+                                 f"'{tag}' activations have {array.shape[-1]}")
+            # Special tokens (BOS decodes to "") carry outsized norms; keep them out of the summary
+            special = np.array([token == "" for token in entry["tokens"]], dtype=bool)
+            pending.append((trio_name, lang, array, special))
+            rows += len(array)
+            if rows >= batch_rows:
+                flush()
+                rows = 0
+    if pending:
+        flush()
+
+    summary_path = os.path.join(writer.path, "features", name, SUMMARY_NAME)
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    tmp_path = summary_path + ".tmp.npz"
+    np.savez(tmp_path, languages=np.array(LANGUAGES), tokens=tokens, counts=counts, sums=sums)
+    os.replace(tmp_path, summary_path)
+    writer.set_feature_info(name, {
+        "sae": sae_path,
+        "layer": layer,
+        "tag": tag,
+        "k": k,
+        "d_model": sae.d_model,
+        "d_sae": sae.d_sae,
+        "activation": "relu" if sae.threshold is None else "jumprelu",
+    })
+    writer.close()
+    return dict(totals, seconds=time.perf_counter() - start)
+
+
+class FeatureSummary:
+    """Per-language firing counts and activation sums of one feature set."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.arrays = {name: data[name] for name in data.files}
+        self.all_languages = self.arrays["languages"].tolist()
+
+    def languages(self):
+        return [lang for lang, count in zip(self.all_languages, self.arrays["tokens"]) if count > 0]
+
+    def tokens(self, language):
+        return int(self.arrays["tokens"][self.all_languages.index(language)])
+
+    def rate(self, language):
+        """(d_sae,) share of the language's tokens each feature fires on."""
+        i = self.all_languages.index(language)
+        return self.arrays["counts"][i] / max(self.arrays["tokens"][i], 1)
+
+    def mean_activation(self, language):
+        """(d_sae,) mean activation over the tokens a feature fires on."""
+        i = self.all_languages.index(language)
+        return self.arrays["sums"][i] / np.maximum(self.arrays["counts"][i], 1)
+
+    def mean_l0(self, language):
+        """Average number of active features per token."""
+        return self.rate(language).sum()
+
+    def contrast(self, language_a, language_b, n=20):
+        """Table of the n features most specific to each language, by firing-rate difference."""
+        import pandas as pd
+
+        rate_a, rate_b = self.rate(language_a), self.rate(language_b)
+        difference = rate_a - rate_b
+        order = np.argsort(-difference)
+        selected = np.concatenate([order[:n], order[::-1][:n][::-1]])
+        selected = selected[np.abs(difference[selected]) > 0]
+        return pd.DataFrame({
+            "feature": selected,
+            f"{language_a} rate": rate_a[selected],
+            f"{language_b} rate": rate_b[selected],
+            "difference": difference[selected],
+            f"{language_a} mean act": self.mean_activation(language_a)[selected],
+            f"{language_b} mean act": self.mean_activation(language_b)[selected],
+        })
+
+
+def load_feature_summary(store, name):
+    """Return a feature set's FeatureSummary, or None when it has not been encoded."""
+    path = os.path.join(store.path, "features", name, SUMMARY_NAME)
+    if not os.path.exists(path):
+        return None
+    return FeatureSummary(path)
+
+
+def prompt_features(store, name, trio, language, features):
+    """(seq, len(features)) activations of the given features for one prompt (0 where not in its top k)."""
+    indices, values = store.features(name, trio, language)
+    columns = np.full(store.feature_info(name)["d_sae"], -1)
+    columns[features] = np.arange(len(features))
+    columns = np.where(indices >= 0, columns[indices], -1)
+    rows, slots = np.nonzero(columns >= 0)
+    dense = np.zeros((len(indices), len(features)), dtype=np.float32)
+    dense[rows, columns[rows, slots]] = values[rows, slots]
+    return dense
+
+
+def strongest_features(store, name, trio, languages, n=20):
+    """Ids of the n features with the largest total activation over one prompt's languages."""
+    totals = np.zeros(store.feature_info(name)["d_sae"])
+    for lang in languages:
+        indices, values = store.features(name, trio, lang)
+        kept = indices >= 0
+        np.add.at(totals, indices[kept], values[kept])
+    order = np.argsort(-totals)[:n]
+    return order[totals[order] > 0].tolist()
+
+
+def main():
+    """Encode stored activations with an SAE, or list language-specific features."""
+    parser = argparse.ArgumentParser(description="Top-k SAE features of stored activations.")
+    parser.add_argument("--root", default=STORE_ROOT, help="store root directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    encode = commands.add_parser("encode", help="encode one layer's activations into a feature set")
+    encode.add_argument("model")
+    encode.add_argument("--sae", help="SAE weights (.npz, .safetensors or torch state dict)")
+    encode.add_argument("--random-sae", type=int, metavar="D_SAE",
+                        help="use a random SAE of this width instead (pipeline check, e.g. on the tiny store)")
+    encode.add_argument("--layer", type=int, required=True)
+    encode.add_argument("--name", help="feature set name (default: layer<N>)")
+    encode.add_argument("--tag", default=ACTIVATIONS_TAG, help="activation tag to encode")
+    encode.add_argument("-k", type=int, default=TOP_K, help="features kept per token")
+    top = commands.add_parser("top", help="features most specific to one language versus another")
+    top.add_argument("model")
+    top.add_argument("name")
+    top.add_argument("languages", nargs=2, metavar="LANGUAGE")
+    top.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "encode":
+        if (args.sae is None) == (args.random_sae is None):
+            parser.error("pass one of --sae or --random-sae")
+        store = open_store(args.model, args.root)
+        if store is None:
+            print(f"No store for {args.model} under {args.root}")
+            return 1
+        if args.sae:
+            sae = load_sae(args.sae)
+        else:
+            entry = next(iter(next(iter(store.manifest["activations"][args.tag].values())).values()))
+            sae = SparseAutoencoder.random(entry["shape"][-1], args.random_sae)
+        name = args.name or f"layer{args.layer}"
+        stats = encode_store(args.model, sae, name, args.layer, root=args.root, tag=args.tag, k=args.k,
+                             sae_path=args.sae)
+        print(f"Encoded {stats['tokens']} tokens in {stats['batches']} batches into '{name}': "
+              f"{stats['seconds']:.2f}s ({stats['tokens'] / max(stats['seconds'], 1e-9):.0f} tokens/sec)")
+        return 0
+
+    store = open_store(args.model, args.root)
+    summary = load_feature_summary(store, args.name) if store is not None else None
+    if summary is None:
+        print(f"No feature set '{args.name}' for {args.model}; run `sae_features.py encode` first")
+        return 1
+    for lang in args.languages:
+        print(f"{lang}: {summary.tokens(lang)} tokens, {summary.mean_l0(lang):.1f} active features per token")
+    print(summary.contrast(*args.languages, n=args.n).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Top-k sparse attention storage for long prompts.
+
+Each query row keeps only its `k` largest keys plus the residual mass that was
+dropped. Rows are stored CSR-style with one row-pointer array shared by every
+layer and head: causal row i has min(k, i + 1) entries, so the pointers follow
+from (seq_len, k) alone and need not be stored. Per entry:
+
+    <stem>.topk.npy           values   (layers, heads, nnz) float16
+    <stem>.topk_indices.npy   columns  (layers, heads, nnz) int16/int32
+    <stem>.topk_residual.npy  residual (layers, heads, seq) float16
+
+The viewer renders straight from this layout (pooled heatmap images and the
+last-token row) and head statistics are computed without densifying.
+
+    python sparse_attention.py            # memory / load-time table vs dense at 1k/4k/8k
+"""
+import argparse
+import functools
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DEFAULT_TOPK = 32
+
+
+@functools.lru_cache(maxsize=64)
+def row_layout(seq_len, k):
+    """Shared CSR row pointers and the row id of every stored entry."""
+    counts = np.minimum(k, np.arange(1, seq_len + 1))
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    row_ids = np.repeat(np.arange(seq_len), counts)
+    keep = np.arange(min(k, seq_len))[None, :] < counts[:, None]
+    for array in (indptr, row_ids, keep):
+        array.flags.writeable = False
+    return indptr, row_ids, keep
+
+
+def index_dtype(seq_len):
+    return np.int16 if seq_len <= np.iinfo(np.int16).max else np.int32
+
+
+def topk_rows(attention, k):
+    """Top-k (indices, values) per row of (..., seq, seq), largest first."""
+    attention = np.asarray(attention, dtype=np.float32)
+    k = min(k, attention.shape[-1])
+    indices = np.argpartition(-attention, k - 1, axis=-1)[..., :k]
+    values = np.take_along_axis(attention, indices, axis=-1)
+    order = np.argsort(-values, axis=-1)
+    return np.take_along_axis(indices, order, axis=-1), np.take_along_axis(values, order, axis=-1)
+
+
+class TopKSink:
+    """Layer-by-layer writer for the top-k layout (see `attention_codec.open_sink`)."""
+
+    def __init__(self, values, indices, residual, shape, topk):
+        self.values = values
+        self.indices = indices
+        self.residual = residual
+        self.shape = shape
+        self.topk = topk
+
+    def write_topk(self, key, indices, values):
+        """Store pre-selected (heads, seq, k') top-k entries for one layer.
+
+        `key` may also be (layer, head) with (seq, k') entries.
+        """
+        _, _, keep = row_layout(self.shape[-1], self.topk)
+        values = np.asarray(values, dtype=np.float32)
+        self.values[key] = values[..., keep]
+        self.indices[key] = np.asarray(indices)[..., keep]
+        kept = np.where(keep, values, 0).sum(axis=-1)
+        self.residual[key] = np.clip(1.0 - kept, 0, None)
+
+    def __setitem__(self, key, value):
+        self.write_topk(key, *topk_rows(value, self.topk))
+
+    def flush(self):
+        for array in (self.values, self.indices, self.residual):
+            array.flush()
+
+
+def open_topk_sink(directory, stem, shape, topk):
+    """Create the files for one entry; return (sink, manifest fields)."""
+    num_layers, num_heads, seq_len, _ = shape
+    indptr, _, _ = row_layout(seq_len, topk)
+    nnz = int(indptr[-1])
+    fields = {"codec": "topk", "topk": topk, "file": f"{stem}.topk.npy",
+              "indices_file": f"{stem}.topk_indices.npy",
+              "residual_file": f"{stem}.topk_residual.npy"}
+
+    def create(key, dtype, array_shape):
+        return np.lib.format.open_memmap(os.path.join(directory, fields[key]), mode="w+",
+                                         dtype=dtype, shape=array_shape)
+
+    sink = TopKSink(create("file", np.float16, (num_layers, num_heads, nnz)),
+                    create("indices_file", index_dtype(seq_len), (num_layers, num_heads, nnz)),
+                    create("residual_file", np.float16, (num_layers, num_heads, seq_len)),
+                    shape, topk)
+    return sink, fields
+
+
+class SparseHead:
+    """One head in top-k CSR form."""
+
+    def __init__(self, indices, values, residual, seq_len, topk):
+        self.indices = np.asarray(indices)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.residual = np.asarray(residual, dtype=np.float32)
+        self.seq_len = seq_len
+        self.topk = topk
+
+    def last_row(self):
+        """Dense attention of the last query over all keys (dropped keys are 0)."""
+        indptr, _, _ = row_layout(self.seq_len, self.topk)
+        row = np.zeros(self.seq_len, dtype=np.float32)
+        row[self.indices[indptr[-2]:]] = self.values[indptr[-2]:]
+        return row
+
+    def to_dense(self, out=None):
+        _, row_ids, _ = row_layout(self.seq_len, self.topk)
+        if out is None:
+            out = np.zeros((self.seq_len, self.seq_len), dtype=np.float32)
+        else:
+            out.fill(0)
+        out[row_ids, self.indices] = self.values
+        return out
+
+    def pooled(self, max_cells):
+        """Max-pool into at most `max_cells` blocks per axis without densifying."""
+        _, row_ids, _ = row_layout(self.seq_len, self.topk)
+        block = max(1, -(-self.seq_len // max_cells))
+        cells = -(-self.seq_len // block)
+        grid = np.zeros((cells, cells), dtype=np.float32)
+        np.maximum.at(grid, (row_ids // block, self.indices // block), self.values)
+        return grid
+
+
+class SparseTensor:
+    """Memory-mapped top-k arrays for one prompt."""
+
+    def __init__(self, indices, values, residual, seq_len, topk):
+        self.indices = indices
+        self.values = values
+        self.residual = residual
+        self.seq_len = seq_len
+        self.topk = topk
+        self.shape = indices.shape[:2] + (seq_len, seq_len)
+
+    def head(self, layer, head):
+        return SparseHead(self.indices[layer, head], self.values[layer, head],
+                          self.residual[layer, head], self.seq_len, self.topk)
+
+    def to_dense(self):
+        """Full (layers, heads, seq, seq) array; only sensible for short prompts."""
+        _, row_ids, _ = row_layout(self.seq_len, self.topk)
+        dense = np.zeros(self.shape, dtype=np.float32)
+        layers, heads = np.indices(self.shape[:2])
+        dense[layers[..., None], heads[..., None], row_ids, self.indices] = self.values
+        return dense
+
+
+def sparse_head_stats(tensor):
+    """`head_stats.compute_head_stats` computed directly on a SparseTensor.
+
+    Entropies only see the kept entries (the residual is spread over unknown
+    keys), so they are lower bounds of the dense values.
+    """
+    from head_stats import entropy
+
+    indptr, row_ids, _ = row_layout(tensor.seq_len, tensor.topk)
+    values = np.asarray(tensor.values, dtype=np.float32)
+    cols = np.asarray(tensor.indices).astype(np.int64)
+    starts = indptr[:-1]
+
+    def row_sum(selected):
+        return np.add.reduceat(selected, starts, axis=-1)
+
+    logs = np.log(values, out=np.zeros_like(values), where=values > 0)
+    last = np.zeros(values.shape[:2] + (tensor.seq_len,), dtype=np.float32)
+    np.put_along_axis(last, cols[..., indptr[-2]:], values[..., indptr[-2]:], axis=-1)
+    # Normalise by kept + dropped mass so the kept weights are not inflated
+    total = last.sum(axis=-1, keepdims=True) + np.asarray(tensor.residual[..., -1:], dtype=np.float32)
+    last = np.divide(last, total, out=np.zeros_like(last), where=total > 0)
+
+    stats = {
+        "entropy": row_sum(-values * logs).mean(axis=-1),
+        "last_entropy": entropy(last),
+        "diag_mass": row_sum(values * (cols == row_ids)).mean(axis=-1),
+        "last_max": last.max(axis=-1),
+        "argmax": last.argmax(axis=-1).astype(np.int32),
+        "last_attention": last.astype(np.float16),
+    }
+    if tensor.seq_len > 1:
+        stats["bos_mass"] = row_sum(values * (cols == 0))[..., 1:].mean(axis=-1)
+        stats["prev_mass"] = row_sum(values * (cols == row_ids - 1))[..., 1:].mean(axis=-1)
+    else:
+        stats["bos_mass"] = np.ones(values.shape[:2], dtype=np.float32)
+        stats["prev_mass"] = np.zeros(values.shape[:2], dtype=np.float32)
+    return stats
+
+
+def _synthetic_rows(start, stop, seq_len, rng):
+    """Attention-like causal rows: BOS sink + previous token + small noise."""
+    rows = rng.random((stop - start, seq_len), dtype=np.float32) * 0.01
+    positions = np.arange(start, stop)
+    rows[:, 0] += 0.5
+    rows[positions > 0, positions[positions > 0] - 1] += 0.3
+    rows[np.arange(seq_len)[None, :] > positions[:, None]] = 0
+    rows /= rows.sum(axis=-1, keepdims=True)
+    return rows
+
+
+def benchmark(seq_lens=(1024, 4096, 8192), num_layers=26, num_heads=8, topk=DEFAULT_TOPK,
+              block_rows=256):
+    """Bytes per prompt and single-head load time, dense float16 vs top-k.
+
+    One layer is written to disk in row blocks (loading one head does not
+    depend on how many other layers the file holds); sizes are reported for
+    the full `num_layers`. Both load paths read one head and pool it to the
+    app's 256-cell heatmap grid.
+    """
+    from attention_codec import open_sink
+    from attention_render import pool_matrix
+
+    rng = np.random.default_rng(0)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for seq_len in seq_lens:
+            shape = (1, num_heads, seq_len, seq_len)
+            dense, dense_fields = open_sink(directory, f"dense{seq_len}", "dense", shape)
+            sink, sparse_fields = open_topk_sink(directory, f"sparse{seq_len}", shape, topk)
+            indptr, _, keep = row_layout(seq_len, topk)
+            for head in range(num_heads):
+                for start in range(0, seq_len, block_rows):
+                    stop = min(start + block_rows, seq_len)
+                    rows = _synthetic_rows(start, stop, seq_len, rng)
+                    dense[0, head, start:stop] = rows
+                    indices, values = topk_rows(rows, topk)
+                    block_keep = keep[start:stop]
+                    span = slice(indptr[start], indptr[stop])
+                    sink.values[0, head, span] = values[block_keep]
+                    sink.indices[0, head, span] = indices[block_keep]
+                    sink.residual[0, head, start:stop] = 1.0 - np.where(block_keep, values, 0).sum(axis=-1)
+            dense.flush()
+            sink.flush()
+            del dense, sink
+
+            start = time.perf_counter()
+            dense = np.load(os.path.join(directory, dense_fields["file"]), mmap_mode="r")
+            dense_grid, _ = pool_matrix(dense[0, num_heads // 2], 256)
+            dense_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tensor = SparseTensor(
+                np.load(os.path.join(directory, sparse_fields["indices_file"]), mmap_mode="r"),
+                np.load(os.path.join(directory, sparse_fields["file"]), mmap_mode="r"),
+                np.load(os.path.join(directory, sparse_fields["residual_file"]), mmap_mode="r"),
+                seq_len, topk)
+            sparse_grid = tensor.head(0, num_heads // 2).pooled(256)
+            sparse_seconds = time.perf_counter() - start
+            del dense, dense_grid, sparse_grid, tensor
+
+            nnz = int(indptr[-1])
+            results.append({
+                "seq_len": seq_len,
+                "dense_bytes": num_layers * num_heads * seq_len * seq_len * 2,
+                "topk_bytes": num_layers * num_heads * (nnz * (2 + np.dtype(index_dtype(seq_len)).itemsize)
+                                                        + seq_len * 2),
+                "dense_head_seconds": dense_seconds,
+                "topk_head_seconds": sparse_seconds,
+            })
+    return results
+
+
+def main():
+    """Print the dense vs top-k memory and load-time table."""
+    parser = argparse.ArgumentParser(description="Benchmark top-k sparse attention storage.")
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[1024, 4096, 8192])
+    parser.add_argument("--layers", type=int, default=26)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--topk", type=int, default=DEFAULT_TOPK)
+    args = parser.parse_args()
+
+    print(f"{'tokens':>7}{'dense/prompt':>15}{'top-k/prompt':>15}{'dense head load':>18}{'top-k head load':>18}")
+    for row in benchmark(args.seq_lens, args.layers, args.heads, args.topk):
+        print(f"{row['seq_len']:>7}{row['dense_bytes'] / 2**20:>12.0f} MiB{row['topk_bytes'] / 2**20:>12.1f} MiB"
+              f"{row['dense_head_seconds'] * 1000:>15.1f} ms{row['topk_head_seconds'] * 1000:>15.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""Shared fixtures: the modules live flat in the repository root."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def causal_attention(num_layers, num_heads, seq_len, seed=0):
+    """Random (layers, heads, seq, seq) attention: row-stochastic with a zero upper triangle."""
+    rng = np.random.default_rng(seed)
+    scores = rng.normal(scale=2.0, size=(num_layers, num_heads, seq_len, seq_len))
+    scores[..., np.triu(np.ones((seq_len, seq_len), dtype=bool), k=1)] = -np.inf
+    weights = np.exp(scores - scores.max(axis=-1, keepdims=True))
+    return (weights / weights.sum(axis=-1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def attention():
+    return causal_attention(num_layers=3, num_heads=4, seq_len=9)
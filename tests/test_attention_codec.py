@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from attention_codec import (CODECS, HeadDecoder, decode_tensor, encode_tril, packed_length,
+                             quantize_rows, roundtrip)
+from attention_store import StoreWriter, open_store
+
+SEQ_LEN = 9
+
+
+def test_tril_round_trip_is_lossless(attention):
+    stored = attention.astype(np.float16)
+    packed = encode_tril(stored)
+    assert packed.shape == attention.shape[:2] + (packed_length(SEQ_LEN),)
+    np.testing.assert_array_equal(decode_tensor(packed, SEQ_LEN), stored)
+
+
+def test_tril_q8_error_is_within_half_a_step(attention):
+    packed = encode_tril(attention.astype(np.float16))
+    codes, scales = quantize_rows(packed, SEQ_LEN)
+    assert codes.dtype == np.uint8 and scales.shape == attention.shape[:3]
+    decoded = decode_tensor(codes, SEQ_LEN, scales)
+    step = scales.astype(np.float32)[..., None]
+    # Rounding to the nearest code, plus the float16 rounding of the scale itself
+    assert np.all(np.abs(decoded - attention) <= 0.5 * step + 255 * step * 2**-10 + 1e-3)
+    assert np.all(np.triu(decoded, k=1) == 0)
+
+
+def test_head_decoder_matches_decode_tensor(attention):
+    packed = encode_tril(attention.astype(np.float16))
+    codes, scales = quantize_rows(packed, SEQ_LEN)
+    decoder = HeadDecoder()
+    for layer, head in [(0, 0), (1, 3), (2, 1)]:
+        np.testing.assert_array_equal(decoder.decode(packed[layer, head], SEQ_LEN),
+                                      decode_tensor(packed, SEQ_LEN)[layer, head])
+        np.testing.assert_allclose(decoder.decode(codes[layer, head], SEQ_LEN, scales[layer, head]),
+                                   decode_tensor(codes, SEQ_LEN, scales)[layer, head], rtol=1e-6)
+
+
+def test_topk_round_trip_keeps_the_heaviest_keys(attention):
+    decoded = roundtrip(attention, "topk", topk=3)
+    stored = attention.astype(np.float16).astype(np.float32)
+    kept = np.count_nonzero(decoded, axis=-1)
+    assert np.all(kept <= np.minimum(np.arange(1, SEQ_LEN + 1), 3))
+    # Every kept weight is one of the row's three largest
+    third = np.sort(stored, axis=-1)[..., -3][..., None]
+    assert np.all((decoded == 0) | (decoded >= third))
+    np.testing.assert_array_equal(decoded[decoded != 0], stored[decoded != 0])
+
+
+def test_roundtrip_rejects_unknown_codecs(attention):
+    with pytest.raises(ValueError):
+        roundtrip(attention, "zstd")
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_store_reads_back_what_roundtrip_predicts(tmp_path, attention, codec):
+    tokens = [f"t{i}" for i in range(SEQ_LEN)]
+    writer = StoreWriter("model", str(tmp_path), codec=codec, topk=3)
+    # As when re-encoding a dense store, whose float16 values roundtrip() starts from
+    writer.add_tensor("trio1", "english", "prompt", tokens, attention.astype(np.float16))
+    writer.close()
+    store = open_store("model", str(tmp_path))
+    expected = roundtrip(attention, codec, topk=3)
+    for layer in range(attention.shape[0]):
+        for head in range(attention.shape[1]):
+            np.testing.assert_allclose(store.head("trio1", "english", layer, head), expected[layer, head],
+                                       rtol=1e-3, atol=1e-6)
+
+
+def test_store_head_is_not_overwritten_by_the_next_decode(tmp_path, attention):
+    writer = StoreWriter("model", str(tmp_path), codec="tril")
+    writer.add_tensor("trio1", "english", "prompt", [f"t{i}" for i in range(SEQ_LEN)], attention)
+    writer.close()
+    store = open_store("model", str(tmp_path))
+    first = store.head("trio1", "english", 0, 0)
+    store.head("trio1", "english", 1, 1)
+    np.testing.assert_array_equal(first, attention[0, 0].astype(np.float16))
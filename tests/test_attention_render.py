@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+fm = pytest.importorskip("matplotlib.font_manager")
+
+import attention_render  # noqa: E402
+from attention_render import FONT_FILES, register_fonts  # noqa: E402
+
+
+@pytest.fixture
+def font_manager(monkeypatch, tmp_path):
+    """Record what register_fonts adds without touching the real font list."""
+    added = []
+    monkeypatch.setattr(fm.fontManager, "ttflist", list(fm.fontManager.ttflist))
+    monkeypatch.setattr(fm.fontManager, "addfont", added.append)
+    monkeypatch.setattr(attention_render, "FONT_CACHE", str(tmp_path / "font_cache.json"))
+    return added
+
+
+def write_cache(version, **extra_fields):
+    entry = {"fname": FONT_FILES[0], "index": 0, "name": "Noto Sans Devanagari", "style": "normal",
+             "variant": "normal", "weight": 400, "stretch": "normal", "size": "scalable", **extra_fields}
+    with open(attention_render.FONT_CACHE, "w", encoding="utf-8") as f:
+        json.dump({"matplotlib": version, "fonts": [entry]}, f)
+
+
+def appended_names(count_before):
+    return [entry.fname.rsplit("/", 1)[-1] for entry in fm.fontManager.ttflist[count_before:]]
+
+
+def test_cache_written_by_this_matplotlib_is_used(font_manager):
+    import matplotlib
+
+    write_cache(matplotlib.__version__)
+    before = len(fm.fontManager.ttflist)
+    register_fonts()
+    assert appended_names(before) == [FONT_FILES[0]]
+    assert [path.rsplit("/", 1)[-1] for path in font_manager] == list(FONT_FILES[1:])
+
+
+@pytest.mark.parametrize("cache", ["other-version", "renamed-field", "old-list-format"])
+def test_stale_caches_fall_back_to_addfont(font_manager, cache):
+    import matplotlib
+
+    if cache == "other-version":
+        write_cache("0.0")
+    elif cache == "renamed-field":
+        write_cache(matplotlib.__version__, family="Noto")
+    else:
+        with open(attention_render.FONT_CACHE, "w", encoding="utf-8") as f:
+            json.dump([{"fname": FONT_FILES[0], "name": "Noto Sans Devanagari"}], f)
+    before = len(fm.fontManager.ttflist)
+    register_fonts()
+    assert appended_names(before) == []
+    assert [path.rsplit("/", 1)[-1] for path in font_manager] == list(FONT_FILES)
+
+
+def test_build_font_cache_records_the_matplotlib_version(font_manager):
+    import matplotlib
+
+    with open(attention_render.build_font_cache(), encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["matplotlib"] == matplotlib.__version__
+    assert [entry["fname"] for entry in data["fonts"]] == list(FONT_FILES)
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from corpus import CorpusAggregates, RunningStats, page
+from head_stats import METRICS
+
+
+def test_running_stats_match_numpy_on_the_concatenated_batches():
+    rng = np.random.default_rng(0)
+    # Uneven batches, including empty and single-row ones, far from zero to stress the merge
+    batches = [rng.normal(1e4, 3.0, size=(n, 2, 3)) for n in (5, 0, 1, 17, 2, 40)]
+    stats = RunningStats((2, 3))
+    for batch in batches:
+        stats.update(batch)
+    everything = np.concatenate(batches)
+    assert stats.count == len(everything)
+    np.testing.assert_allclose(stats.mean, everything.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.variance(), everything.var(axis=0, ddof=1), rtol=1e-9)
+    np.testing.assert_allclose(stats.std(), everything.std(axis=0, ddof=1), rtol=1e-9)
+
+
+def test_running_stats_need_two_values_for_a_variance():
+    stats = RunningStats((2,))
+    stats.update(np.array([[1.0, 2.0]]))
+    np.testing.assert_array_equal(stats.variance(), [0, 0])
+
+
+def fake_head_stats(keys, seed):
+    rng = np.random.default_rng(seed)
+    arrays = {metric: rng.random((len(keys), 2, 3)) for metric in METRICS}
+    arrays["keys"] = np.array(keys)
+    return SimpleNamespace(arrays=arrays)
+
+
+def test_aggregates_fold_shards_once_and_survive_a_save(tmp_path):
+    shards = {"shard-0000": fake_head_stats(["t1/english", "t1/hindi", "t2/english"], 0),
+              "shard-0001": fake_head_stats(["t3/english", "t3/hindi"], 1)}
+    aggregates = CorpusAggregates()
+    for name, head_stats in shards.items():
+        aggregates.add_head_stats(head_stats, name)
+    aggregates.add_head_stats(shards["shard-0000"], "shard-0000")  # already folded
+    path = str(tmp_path / "aggregates.npz")
+    aggregates.save(path)
+    loaded = CorpusAggregates.load(path)
+    assert loaded.shards == set(shards) and loaded.languages() == ["english", "hindi"]
+    english = np.concatenate([shards["shard-0000"].arrays["entropy"][[0, 2]],
+                              shards["shard-0001"].arrays["entropy"][[0]]])
+    assert loaded.count("english") == 3
+    np.testing.assert_allclose(loaded.mean("entropy", "english"), english.mean(axis=0))
+    np.testing.assert_allclose(loaded.std("entropy", "english"), english.std(axis=0, ddof=1))
+
+
+def test_page_clamps_the_page_number():
+    items = list(range(7))
+    assert page(items, 1, 3) == ([0, 1, 2], 3)
+    assert page(items, 9, 3) == ([6], 3)
+    assert page([], 0, 3) == ([], 1)
@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+
+from cross_lingual import jensen_shannon, spearman
+
+
+def brute_jensen_shannon(p, q):
+    m = [(a + b) / 2 for a, b in zip(p, q)]
+    kl = lambda a, b: sum(x * math.log2(x / y) for x, y in zip(a, b) if x > 0)  # noqa: E731
+    return kl(p, m) / 2 + kl(q, m) / 2
+
+
+def brute_spearman(x, y):
+    rank = lambda values: [sorted(values).index(v) for v in values]  # distinct values  # noqa: E731
+    rx, ry = np.array(rank(list(x)), dtype=float), np.array(rank(list(y)), dtype=float)
+    return float(np.corrcoef(rx, ry)[0, 1])
+
+
+def test_jensen_shannon_over_concept_slots():
+    rng = np.random.default_rng(0)
+    # (layers, heads, slots) concept mass, including empty slots
+    p = rng.dirichlet(np.ones(4), size=(3, 5))
+    q = rng.dirichlet(np.ones(4), size=(3, 5))
+    p[0, 0, 2] = q[1, 1, 0] = 0
+    p /= p.sum(axis=-1, keepdims=True)
+    q /= q.sum(axis=-1, keepdims=True)
+    divergence = jensen_shannon(p, q)
+    assert divergence.shape == (3, 5)
+    for index in np.ndindex(3, 5):
+        assert math.isclose(divergence[index], brute_jensen_shannon(p[index], q[index]), abs_tol=1e-12)
+    np.testing.assert_allclose(jensen_shannon(p, p), 0, atol=1e-12)
+    assert math.isclose(jensen_shannon(np.array([1.0, 0, 0]), np.array([0, 0.5, 0.5])), 1.0)
+
+
+def test_spearman_over_concept_slots():
+    rng = np.random.default_rng(1)
+    x, y = rng.random((4, 6, 5)), rng.random((4, 6, 5))
+    correlation = spearman(x, y)
+    for index in np.ndindex(4, 6):
+        assert math.isclose(correlation[index], brute_spearman(x[index], y[index]), abs_tol=1e-6)
+    np.testing.assert_allclose(spearman(x, x * 3 + 1), 1, atol=1e-6)
+    np.testing.assert_allclose(spearman(x, -x), -1, atol=1e-6)
+    # A single slot has no ranking to correlate
+    assert np.isnan(spearman(np.array([0.4]), np.array([0.7])))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from attention_store import open_store  # noqa: E402
+from extract_attention import (TinyTokenizer, attention_modules, extract_to_store,  # noqa: E402
+                               flatten_prompts, load_tiny_model, sort_by_tokens)
+
+# Mixed lengths, so every batch of three pads most of its rows
+PROMPTS = {
+    "trio1": {"english": "Energy", "hindi": "गतिज ऊर्जा किसे कहते हैं?", "hinglish": "Gatij urja"},
+    "trio2": {"english": "What is the kinetic energy of a moving car?", "hindi": "ऊर्जा",
+              "hinglish": "Kinetic energy kya hai"},
+    "trio3": {"english": "Heat", "hindi": "ताप", "hinglish": "Garmi kya hoti hai, aur kaise napte hain?"},
+}
+
+
+class WordTokenizer(TinyTokenizer):
+    """One token per whitespace-separated word, so token and character counts disagree."""
+
+    def _encode(self, text):
+        return [self.bos_token_id] + [self._offset + len(word) for word in text.split()]
+
+
+def unbatched_attention(model, tokenizer, prompt):
+    """(layers, heads, seq, seq) attention of a forward pass over the prompt alone (no padding)."""
+    captured = []
+    handles = [module.register_forward_hook(lambda module, inputs, output: captured.append(output[1][0]))
+               for module in attention_modules(model)]
+    try:
+        with torch.no_grad():
+            model(**tokenizer([prompt]))
+    finally:
+        for handle in handles:
+            handle.remove()
+    return torch.stack(captured).to(torch.float16).numpy()
+
+
+def test_batches_are_sorted_by_token_count():
+    items = [("trio1", "english", "a b c d"), ("trio1", "hindi", "extraordinarily"), ("trio2", "english", "x y")]
+    order = [prompt for _, _, prompt in sort_by_tokens(WordTokenizer(), list(items))]
+    assert order == ["extraordinarily", "x y", "a b c d"]
+    counts = {("trio1", "english"): 1, ("trio1", "hindi"): 3, ("trio2", "english"): 2}
+    assert [item[:2] for item in sort_by_tokens(None, list(items), counts)] == sorted(counts, key=counts.get)
+
+
+@pytest.mark.parametrize("codec", ["dense", "tril"])
+def test_batched_extraction_matches_unbatched_forward(tmp_path, codec):
+    model, tokenizer = load_tiny_model(num_layers=2, num_heads=2, hidden_size=32)
+    extract_to_store(model, tokenizer, PROMPTS, "tiny", root=str(tmp_path), batch_size=3, codec=codec)
+    store = open_store("tiny", str(tmp_path))
+    for trio_name, lang, prompt in flatten_prompts(PROMPTS):
+        expected = unbatched_attention(model, tokenizer, prompt)
+        seq_len = expected.shape[-1]
+        # No padding positions: the entry has exactly the prompt's tokens
+        assert store.tokens(trio_name, lang) == [tokenizer.decode([token_id])
+                                                 for token_id in tokenizer([prompt])["input_ids"][0].tolist()]
+        stored = np.asarray(store.tensor(trio_name, lang))
+        assert stored.shape == (2, 2, seq_len, seq_len)
+        np.testing.assert_allclose(stored.astype(np.float32), expected.astype(np.float32), atol=2e-3)
+        # No attention leaks onto padding keys: every row still sums to one over the prompt
+        np.testing.assert_allclose(stored.astype(np.float32).sum(axis=-1), 1.0, atol=1e-2)
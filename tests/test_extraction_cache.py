@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from extraction_cache import extraction_key
+
+MODEL = {"model": "meta-llama/Llama-3.2-1B-Instruct", "revision": "9213176726f5",
+         "config": {"num_hidden_layers": 16, "num_attention_heads": 32}, "dtype": "torch.float16"}
+TOKENIZER = {"tokenizer": "meta-llama/Llama-3.2-1B-Instruct", "vocab_size": 128256}
+PROMPT = "गतिज ऊर्जा क्या है?"
+INPUT_IDS = [128000, 100, 2001, 37, 9]
+SETTINGS = {"codec": "tril", "topk": None, "mode": "forward"}
+
+
+def key(**changes):
+    arguments = dict(model_fingerprint=MODEL, tokenizer_fingerprint=TOKENIZER, prompt=PROMPT,
+                     input_ids=INPUT_IDS, settings=SETTINGS)
+    arguments.update(changes)
+    return extraction_key(**arguments)
+
+
+def test_key_is_pinned():
+    # Changing this invalidates every cached extraction; bump CACHE_FORMAT instead
+    assert key() == "e78544094c0e1441977362eb248e1149fbf079eae8de3f2cdffe75441f79b441"
+
+
+def test_key_ignores_dict_order_and_id_container():
+    assert key(settings=dict(reversed(list(SETTINGS.items())))) == key()
+    assert key(model_fingerprint={name: MODEL[name] for name in reversed(list(MODEL))}) == key()
+    assert key(input_ids=tuple(INPUT_IDS)) == key()
+    assert key(input_ids=np.array(INPUT_IDS)) == key()
+
+
+@pytest.mark.parametrize("changes", [
+    {"model_fingerprint": dict(MODEL, revision="0e9e39f249a1")},
+    {"model_fingerprint": dict(MODEL, dtype="torch.float32")},
+    {"tokenizer_fingerprint": dict(TOKENIZER, vocab_size=128257)},
+    {"prompt": PROMPT + " "},
+    {"input_ids": INPUT_IDS[:-1]},
+    {"settings": dict(SETTINGS, codec="tril_q8")},
+    {"settings": dict(SETTINGS, mode="generate", seed=1)},
+])
+def test_key_changes_with_every_input(changes):
+    assert key(**changes) != key()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from attention_store import open_store  # noqa: E402
+from extract_attention import (TinyCausalLM, TinyTokenizer, attention_modules,  # noqa: E402
+                               generate_with_attention)
+
+PROMPTS = {"trio1": {"english": "Kinetic energy is", "hindi": "गतिज ऊर्जा"}}
+MAX_NEW_TOKENS = 6
+
+
+def tiny_gemma2(sliding_window=64):
+    """Randomly initialised two-layer Gemma-2 with eager attention (no hub access)."""
+    transformers = pytest.importorskip("transformers")
+    config = transformers.Gemma2Config(
+        vocab_size=0x3000, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, head_dim=16, sliding_window=sliding_window,
+        max_position_embeddings=256, attn_implementation="eager")
+    torch.manual_seed(0)
+    return transformers.Gemma2ForCausalLM(config).eval()
+
+
+def full_forward_attention(model, input_ids):
+    """(layers, heads, seq, seq) attention of one teacher-forced forward pass over `input_ids`."""
+    captured = []
+    handles = [module.register_forward_hook(lambda module, inputs, output: captured.append(output[1][0]))
+               for module in attention_modules(model)]
+    try:
+        with torch.no_grad():
+            model(input_ids=input_ids, output_attentions=True)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return torch.stack(captured).float().numpy()
+
+
+@pytest.mark.parametrize("make_model", [TinyCausalLM, tiny_gemma2], ids=["stand-in", "gemma2"])
+def test_generated_attention_matches_a_teacher_forced_pass(tmp_path, make_model):
+    model = make_model()
+    tokenizer = TinyTokenizer(model.config.vocab_size)
+    stats = generate_with_attention(model, tokenizer, PROMPTS, "generated", root=str(tmp_path),
+                                    max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+    store = open_store("generated", str(tmp_path))
+    assert stats["prompts"] == 2
+    for lang, prompt in PROMPTS["trio1"].items():
+        input_ids = tokenizer([prompt])["input_ids"]
+        generation = store.generation("trio1", lang)
+        assert generation["prompt_len"] == input_ids.shape[1]
+        # Greedy decoding is deterministic: replay it to get the token ids behind the stored text
+        with torch.no_grad():
+            replay = model.generate(input_ids=input_ids, max_new_tokens=MAX_NEW_TOKENS + 1, do_sample=False,
+                                    return_dict_in_generate=True).sequences
+        seq_len = len(store.tokens("trio1", lang))
+        assert input_ids.shape[1] < seq_len <= input_ids.shape[1] + MAX_NEW_TOKENS
+        expected = full_forward_attention(model, replay[:, :seq_len])
+        stored = np.asarray(store.tensor("trio1", lang), dtype=np.float32)
+        assert stored.shape == expected.shape
+        np.testing.assert_allclose(stored, expected, atol=2e-3)
+
+
+def test_sequences_longer_than_the_attention_window_are_refused(tmp_path):
+    model = tiny_gemma2(sliding_window=8)
+    with pytest.raises(ValueError, match="attention window"):
+        generate_with_attention(model, TinyTokenizer(model.config.vocab_size), PROMPTS, "generated",
+                                root=str(tmp_path), max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+
+
+def test_recorded_seed_reproduces_the_sampled_response(tmp_path):
+    model = TinyCausalLM()
+    tokenizer = TinyTokenizer(model.config.vocab_size)
+    for name in ("first", "second"):
+        generate_with_attention(model, tokenizer, PROMPTS, name, root=str(tmp_path),
+                                max_new_tokens=MAX_NEW_TOKENS, seed=3)
+    first, second = open_store("first", str(tmp_path)), open_store("second", str(tmp_path))
+    for lang in PROMPTS["trio1"]:
+        assert first.response("trio1", lang) == second.response("trio1", lang)
+        assert first.generation("trio1", lang)["seed"] == second.generation("trio1", lang)["seed"]
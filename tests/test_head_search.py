@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from attention_store import StoreWriter, open_store
+from conftest import causal_attention
+from head_search import MIN_WEIGHT, HeadSearchIndex, build_head_search, normalize_term, prompt_weights, query_terms
+from head_stats import build_head_stats, load_head_stats
+
+ENTRIES = {
+    ("trio1", "english"): ["", "Kinetic", " energy", " is", "?"],
+    ("trio1", "hindi"): ["", "ग", "ति", "ज", " ऊ", "र्जा"],
+    ("trio2", "english"): ["", "Energy", " and", " kinetic", " heat"],
+    ("trio2", "hindi"): ["", "ऊ", "र्जा", " और", " ताप"],
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    writer = StoreWriter("model", str(tmp_path), codec="tril")
+    for seed, ((trio, lang), tokens) in enumerate(ENTRIES.items()):
+        writer.add_tensor(trio, lang, "".join(tokens), tokens,
+                          causal_attention(3, 4, len(tokens), seed=seed).astype(np.float16))
+    writer.close()
+    store = open_store("model", str(tmp_path))
+    build_head_stats(store)
+    path = build_head_search(store)
+    return store, HeadSearchIndex(path)
+
+
+def brute_postings(store, index, term):
+    """Every (entry, flat head, weight) of a term, from the head statistics directly."""
+    head_stats = load_head_stats(store)
+    postings = []
+    for entry, (trio, lang) in enumerate(index.keys):
+        weights = prompt_weights(store.tokens(trio, lang), store.word_starts(trio, lang),
+                                 head_stats.last_attention(trio, lang))
+        if term in weights:
+            for head, weight in enumerate(weights[term].ravel()):
+                if weight >= MIN_WEIGHT:
+                    postings.append((entry, head, float(np.float16(weight))))
+    return postings
+
+
+def test_query_terms_normalise_case_and_punctuation():
+    assert query_terms("Kinetic, ENERGY? / गतिज  kinetic") == ["kinetic", "energy", "गतिज"]
+    assert normalize_term(" «Heat»! ") == "heat"
+
+
+@pytest.mark.parametrize("term", ["kinetic", "energy", "ऊर्जा", "गतिज", "ज"])
+def test_postings_are_every_weight_heaviest_first(index, term):
+    store, index = index
+    entry, head, weight = index.postings(term)
+    expected = brute_postings(store, index, term)
+    assert len(expected) > 0
+    assert sorted(zip(entry.tolist(), head.tolist(), weight.astype(float).tolist())) == sorted(expected)
+    assert np.all(np.diff(weight.astype(np.float32)) <= 0)
+
+
+def test_threshold_k_and_language_filters(index):
+    store, index = index
+    expected = brute_postings(store, index, "energy")
+    threshold = float(np.median([weight for _, _, weight in expected]))
+    entry, head, weight = index.postings("energy", threshold=threshold)
+    assert sorted(zip(entry.tolist(), head.tolist(), weight.astype(float).tolist())) == \
+        sorted(posting for posting in expected if posting[2] >= np.float16(threshold))
+    top = index.postings("energy", k=3)[2]
+    np.testing.assert_array_equal(top, np.sort(np.array([w for *_, w in expected], dtype=np.float16))[::-1][:3])
+    entry, _, _ = index.postings("ऊर्जा", languages=["english"])
+    assert len(entry) == 0
+    entry, _, _ = index.postings("ऊर्जा", languages=["hindi"])
+    assert {index.keys[i][1] for i in entry.tolist()} == {"hindi"}
+    assert len(index.postings("absent")[0]) == 0
+
+
+def test_complete_lists_terms_by_prefix(index):
+    _, index = index
+    assert index.complete("ki") == ["kinetic"]
+    assert index.complete("e") == ["energy"]
@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import pytest
+
+from model_diff import depth_pairs, match_heads, pool_segments
+
+
+@pytest.mark.parametrize("num_layers_a, num_layers_b", [(26, 16), (16, 26), (4, 4), (1, 5), (5, 1)])
+def test_depth_pairs_picks_the_nearest_relative_depth(num_layers_a, num_layers_b):
+    pairs = depth_pairs(num_layers_a, num_layers_b)
+    assert pairs.shape == (num_layers_a,)
+    depth = lambda layer, count: layer / (count - 1) if count > 1 else 0.0  # noqa: E731
+    for layer_a, layer_b in enumerate(pairs):
+        nearest = min(range(num_layers_b), key=lambda b: abs(depth(b, num_layers_b) - depth(layer_a, num_layers_a)))
+        assert layer_b == nearest
+    assert pairs[0] == 0 and pairs[-1] == (num_layers_b - 1 if num_layers_a > 1 else 0)
+
+
+def test_match_heads_against_a_loop_over_candidate_heads():
+    rng = np.random.default_rng(0)
+    profile_a, profile_b = rng.random((5, 4, 3)), rng.random((3, 6, 3)) * 2
+    pairs = depth_pairs(5, 3)
+    matched, distance = match_heads(profile_a, profile_b, pairs)
+    assert matched.shape == distance.shape == (5, 4)
+    pooled = np.concatenate([profile_a.reshape(-1, 3), profile_b.reshape(-1, 3)])
+    mean, std = pooled.mean(axis=0), pooled.std(axis=0)
+    for layer in range(5):
+        for head in range(4):
+            candidates = [math.dist((profile_a[layer, head] - mean) / std, (profile_b[pairs[layer], b] - mean) / std)
+                          for b in range(6)]
+            assert matched[layer, head] == int(np.argmin(candidates))
+            assert math.isclose(distance[layer, head], min(candidates), rel_tol=1e-9)
+
+
+def test_match_heads_recovers_a_permutation():
+    rng = np.random.default_rng(1)
+    profile = rng.random((3, 5, 4))
+    profile[..., 2] = 0.5  # constant metric: zero spread must not divide by zero
+    order = rng.permutation(5)
+    matched, distance = match_heads(profile, profile[:, order], depth_pairs(3, 3))
+    np.testing.assert_array_equal(order[matched], np.tile(np.arange(5), (3, 1)))
+    np.testing.assert_allclose(distance, 0, atol=1e-12)
+
+
+def test_pool_segments_sums_keys_and_averages_queries():
+    rng = np.random.default_rng(2)
+    attention = rng.random((2, 6, 6))
+    ids = np.array([1, 1, 2, 3, 3, 3])  # slot 0 (no special token) and slot 4 stay empty
+    pooled = pool_segments(attention, ids, 5)
+    for i in range(5):
+        for j in range(5):
+            rows, cols = np.flatnonzero(ids == i), np.flatnonzero(ids == j)
+            expected = attention[:, rows][:, :, cols].sum(axis=-1).mean(axis=-1) if len(rows) else 0
+            np.testing.assert_allclose(pooled[:, i, j], expected, rtol=1e-6)
@@ -0,0 +1,64 @@
+import os
+
+from render_cache import RenderCache, make_key
+
+
+def disk_usage(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def test_make_key_is_stable():
+    assert make_key("gemma2", "trio1", "hindi", 3, 4) == make_key("gemma2", "trio1", "hindi", 3, 4)
+    assert make_key("gemma2", "trio1", "hindi", 3, 4) != make_key("gemma2", "trio1", "hindi", 4, 3)
+
+
+def test_rewriting_a_key_counts_its_file_once(tmp_path):
+    cache = RenderCache(str(tmp_path), disk_bytes=1000)
+    for size in (300, 300, 500, 100):
+        cache.put("key", b"x" * size)
+        assert cache.counters()["disk_bytes"] == disk_usage(tmp_path) == size
+    assert RenderCache(str(tmp_path)).counters()["disk_bytes"] == 100
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(None, memory_bytes=300)
+    for key in "abc":
+        cache.put(key, key.encode() * 100)
+    assert cache.get("a") == b"a" * 100  # now most recently used
+    cache.put("d", b"d" * 100)
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True, True, True]
+    counters = cache.counters()
+    assert counters["memory_entries"] == 3 and counters["memory_bytes"] == 300
+    assert counters["misses"] == 1
+
+
+def test_disk_tier_trims_oldest_files_to_its_budget(tmp_path):
+    cache = RenderCache(str(tmp_path), disk_bytes=250)
+    for age, key in enumerate("abc"):
+        cache.put(key, key.encode() * 100)
+        # Distinct access times, oldest first, whatever the filesystem's mtime resolution
+        if key != "c":
+            os.utime(tmp_path / key, (1000 + age, 1000 + age))
+    assert sorted(os.listdir(tmp_path)) == ["b", "c"]
+    assert cache.counters()["disk_bytes"] == disk_usage(tmp_path) == 200 <= cache.disk_bytes
+
+
+def test_disk_hits_are_promoted_into_memory(tmp_path):
+    RenderCache(str(tmp_path)).put("key", b"png")
+    cache = RenderCache(str(tmp_path))
+    assert cache.contains("key")
+    assert cache.get("key") == b"png"
+    assert cache.get("key") == b"png"
+    counters = cache.counters()
+    assert (counters["disk_hits"], counters["memory_hits"], counters["memory_entries"]) == (1, 1, 1)
+    assert cache.pop("key") == b"png" and cache.counters()["memory_bytes"] == 0
+
+
+def test_get_or_render_renders_once(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    calls = []
+    render = lambda: calls.append(1) or b"svg"  # noqa: E731
+    assert cache.get_or_render("key", render) == b"svg"
+    assert cache.get_or_render("key", render) == b"svg"
+    assert len(calls) == 1
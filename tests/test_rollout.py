@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from attention_store import StoreWriter, open_store
+from conftest import causal_attention
+from rollout import RESIDUAL_WEIGHT, Rollout
+
+NUM_LAYERS, NUM_HEADS, SEQ_LEN = 4, 3, 7
+
+
+@pytest.fixture
+def stored():
+    return causal_attention(NUM_LAYERS, NUM_HEADS, SEQ_LEN, seed=1).astype(np.float16)
+
+
+@pytest.fixture
+def store(tmp_path, stored):
+    writer = StoreWriter("model", str(tmp_path), codec="tril")
+    writer.add_tensor("trio1", "hindi", "prompt", [f"t{i}" for i in range(SEQ_LEN)], stored)
+    writer.close()
+    return open_store("model", str(tmp_path))
+
+
+def reference(attention, layer, residual):
+    """A_layer @ ... @ A_0 with A_l = norm(r * I + (1 - r) * mean_h attention_l), one matmul at a time."""
+    product = np.eye(SEQ_LEN)
+    for index in range(layer + 1):
+        transition = residual * np.eye(SEQ_LEN) + (1 - residual) * attention[index].astype(np.float64).mean(axis=0)
+        transition /= transition.sum(axis=-1, keepdims=True)
+        product = transition @ product
+    return product
+
+
+@pytest.mark.parametrize("residual", [RESIDUAL_WEIGHT, 0.0, 0.8])
+def test_rollout_matches_matrix_product(store, stored, residual):
+    rollout = Rollout(store, "trio1", "hindi", residual)
+    for layer in range(NUM_LAYERS):
+        np.testing.assert_allclose(rollout.at(layer), reference(stored, layer, residual), rtol=1e-10)
+        np.testing.assert_allclose(rollout.at(layer).sum(axis=-1), 1.0)
+
+
+def test_rollout_out_of_order_and_last_token_rows(store, stored):
+    rollout = Rollout(store, "trio1", "hindi")
+    deepest = rollout.at(NUM_LAYERS - 1)
+    assert len(rollout.prefixes) == NUM_LAYERS
+    # Going back is a lookup of an already computed prefix
+    assert rollout.at(1) is rollout.prefixes[1]
+    np.testing.assert_allclose(rollout.at(1), reference(stored, 1, RESIDUAL_WEIGHT), rtol=1e-10)
+    np.testing.assert_allclose(deepest, Rollout(store, "trio1", "hindi").at(NUM_LAYERS - 1))
+    rows = rollout.last_token_rollout(2)
+    assert rows.shape == (3, SEQ_LEN)
+    for layer in range(3):
+        np.testing.assert_allclose(rows[layer], reference(stored, layer, RESIDUAL_WEIGHT)[-1], rtol=1e-10)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from attention_store import StoreWriter, open_store
+from sparse_attention import row_layout, topk_rows
+
+SEQ_LEN, TOPK = 23, 4
+
+
+def distinct_causal_attention(num_layers, num_heads, seq_len, seed=0):
+    """Causal attention whose rows have no ties, so the top-k keys are unambiguous (also in float16)."""
+    rng = np.random.default_rng(seed)
+    attention = np.zeros((num_layers, num_heads, seq_len, seq_len), dtype=np.float32)
+    for index in np.ndindex(num_layers, num_heads, seq_len):
+        row = index[-1]
+        weights = rng.permutation(row + 1) + 1.0
+        attention[index][:row + 1] = weights / weights.sum()
+    return attention.astype(np.float16).astype(np.float32)
+
+
+def brute_topk_dense(attention, k):
+    """Dense copy keeping each row's k largest weights, one row at a time."""
+    dense = np.zeros_like(attention)
+    for index in np.ndindex(attention.shape[:-1]):
+        for key in sorted(range(attention.shape[-1]), key=lambda key: -attention[index][key])[:k]:
+            dense[index][key] = attention[index][key]
+    return dense
+
+
+def test_topk_rows_returns_the_largest_keys_in_order():
+    attention = distinct_causal_attention(2, 3, SEQ_LEN)
+    indices, values = topk_rows(attention, TOPK)
+    assert indices.shape == values.shape == (2, 3, SEQ_LEN, TOPK)
+    for index in np.ndindex(attention.shape[:-1]):
+        expected = np.sort(attention[index])[::-1][:TOPK]
+        np.testing.assert_array_equal(values[index], expected)
+        np.testing.assert_array_equal(attention[index][indices[index]], expected)
+    # k larger than the row keeps every key
+    assert topk_rows(attention[..., :3, :3], 10)[0].shape[-1] == 3
+
+
+@pytest.fixture
+def sparse(tmp_path):
+    attention = distinct_causal_attention(2, 2, SEQ_LEN, seed=1)
+    writer = StoreWriter("model", str(tmp_path), codec="topk", topk=TOPK)
+    writer.add_tensor("trio1", "english", "prompt", [f"t{i}" for i in range(SEQ_LEN)], attention)
+    writer.close()
+    return attention, open_store("model", str(tmp_path)).sparse_tensor("trio1", "english")
+
+
+def test_sparse_tensor_keeps_top_k_and_the_residual(sparse):
+    attention, tensor = sparse
+    expected = brute_topk_dense(attention, TOPK)
+    np.testing.assert_allclose(tensor.to_dense(), expected, rtol=1e-3)
+    head = tensor.head(1, 0)
+    np.testing.assert_allclose(head.last_row(), expected[1, 0, -1], rtol=1e-3)
+    np.testing.assert_allclose(np.asarray(head.residual, dtype=np.float32), 1 - expected[1, 0].sum(axis=-1),
+                               atol=2e-3)
+
+
+@pytest.mark.parametrize("max_cells", [1, 5, 8, SEQ_LEN, 100])
+def test_pooled_matches_max_pooling_the_dense_head(sparse, max_cells):
+    attention, tensor = sparse
+    dense = brute_topk_dense(attention, TOPK)[0, 1]
+    block = -(-SEQ_LEN // max_cells)
+    cells = -(-SEQ_LEN // block)
+    expected = np.zeros((cells, cells), dtype=np.float32)
+    for i in range(cells):
+        for j in range(cells):
+            expected[i, j] = dense[i * block:(i + 1) * block, j * block:(j + 1) * block].max()
+    np.testing.assert_allclose(tensor.head(0, 1).pooled(max_cells), expected, rtol=1e-3)
+
+
+def test_row_layout_counts_the_causal_width():
+    indptr, row_ids, keep = row_layout(6, 3)
+    assert indptr.tolist() == [0, 1, 3, 6, 9, 12, 15]
+    assert row_ids.tolist() == [0, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5]
+    assert keep.sum() == indptr[-1]
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+import tracing
+from tracing import _NULL_SPAN, TraceRecorder, span, traced
+
+MS = 1_000_000  # ns
+
+
+@pytest.fixture(autouse=True)
+def no_recorder():
+    tracing.deactivate()
+    yield
+    tracing.deactivate()
+
+
+def test_span_is_a_shared_no_op_without_a_recorder():
+    assert span("heatmap.draw") is _NULL_SPAN
+    assert span("other", layer=3) is _NULL_SPAN
+    with span("heatmap.draw") as active:
+        assert active is _NULL_SPAN
+
+
+def test_spans_and_traced_functions_are_recorded_per_rerun():
+    @traced("decorated")
+    def work():
+        with span("inner", head=2):
+            return 7
+
+    recorder = TraceRecorder()
+    recorder.start_rerun("Head detail")
+    assert work() == 7
+    recorder.finish_rerun()
+    assert span("after") is _NULL_SPAN
+    names = [name for name, *_ in recorder.reruns[0]["spans"]]
+    assert names == ["inner", "decorated", "rerun"]
+    assert recorder.reruns[0]["spans"][0][4] == {"head": 2}
+    assert recorder.reruns[0]["spans"][0][3] == threading.get_ident()
+
+
+def recorder_with(spans, label="Head detail"):
+    recorder = TraceRecorder()
+    recorder.reruns.append({"label": label, "spans": spans})
+    return recorder
+
+
+def test_stage_breakdown_does_not_count_nested_spans_twice():
+    recorder = recorder_with([
+        ("rerun", 0, 100 * MS, 1, {}),
+        ("load", 0, 20 * MS, 1, {}),
+        ("heatmap", 30 * MS, 50 * MS, 1, {}),
+        ("pool", 35 * MS, 10 * MS, 1, {}),  # inside heatmap
+        ("pool", 50 * MS, 5 * MS, 1, {}),  # inside heatmap
+    ])
+    [row] = recorder.stage_breakdown()
+    assert row["view"] == "Head detail"
+    assert row["load"] == pytest.approx(20.0)
+    assert row["heatmap"] == pytest.approx(50.0)
+    assert row["pool"] == pytest.approx(15.0)
+    # 100 - (20 + 50), not 100 - (20 + 50 + 15)
+    assert row["other"] == pytest.approx(30.0)
+    assert row["total"] == pytest.approx(100.0)
+
+
+def test_chrome_trace_uses_microseconds():
+    recorder = recorder_with([("heatmap", 3 * MS, 2 * MS, 9, {"layer": 1}), ("rerun", 0, 10 * MS, 9, {})])
+    trace = recorder.chrome_trace()
+    assert trace["displayTimeUnit"] == "ms"
+    heatmap, rerun = trace["traceEvents"]
+    assert heatmap["ph"] == "X" and heatmap["tid"] == 9 and heatmap["args"] == {"layer": 1}
+    assert heatmap["ts"] == pytest.approx(3000.0) and heatmap["dur"] == pytest.approx(2000.0)
+    assert rerun["ts"] == 0 and rerun["dur"] == pytest.approx(10000.0)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from word_spans import pool_words, word_starts, words_from_starts
+
+TOKENS = ["", "ग", "ति", "ज", " ऊ", "र्जा", " क्या", " है", "?"]
+
+
+def test_word_starts_split_on_spaces_and_punctuation():
+    starts = word_starts(TOKENS)
+    assert starts == [0, 1, 4, 6, 7, 8]
+    assert words_from_starts(TOKENS, starts) == ["", "गतिज", " ऊर्जा", " क्या", " है", "?"]
+
+
+def test_pool_words_sums_keys_and_averages_queries():
+    rng = np.random.default_rng(0)
+    seq_len = len(TOKENS)
+    attention = np.tril(rng.random((2, 3, seq_len, seq_len)))
+    attention /= attention.sum(axis=-1, keepdims=True)
+    starts = word_starts(TOKENS)
+    bounds = starts + [seq_len]
+    pooled = pool_words(attention, starts)
+    assert pooled.shape == (2, 3, len(starts), len(starts))
+    for i in range(len(starts)):
+        for j in range(len(starts)):
+            block = attention[..., bounds[i]:bounds[i + 1], bounds[j]:bounds[j + 1]]
+            expected = block.sum(axis=-1).mean(axis=-1)
+            np.testing.assert_allclose(pooled[..., i, j], expected, rtol=1e-5)
+    np.testing.assert_allclose(pooled.sum(axis=-1), 1, rtol=1e-5)
@@ -0,0 +1,131 @@
+"""Lightweight per-stage timing spans for the viewer's hot path.
+
+Code marks a stage with `with tracing.span("heatmap.draw"):`. Unless a
+`TraceRecorder` is active on the current thread, `span()` returns a shared
+no-op context manager, so instrumented code costs one thread-local lookup.
+
+The app activates a recorder per session while its debug panel is on; the
+recorder keeps the last N reruns and exports them as a Chrome trace
+(`chrome://tracing`, Perfetto) for offline profiling.
+"""
+import collections
+import functools
+import os
+import threading
+import time
+
+_local = threading.local()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, spans, name, args):
+        self.spans = spans
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        self.spans.append((self.name, self.start, end - self.start, threading.get_ident(), self.args))
+        return False
+
+
+def span(name, **args):
+    """Time the enclosed block on the current thread's recorder, if any."""
+    recorder = getattr(_local, "recorder", None)
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder.current, name, args)
+
+
+def traced(name):
+    """Decorator form of `span` for whole functions."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            recorder = getattr(_local, "recorder", None)
+            if recorder is None:
+                return function(*args, **kwargs)
+            with _Span(recorder.current, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def deactivate():
+    _local.recorder = None
+
+
+class TraceRecorder:
+    """Spans of the last `max_reruns` reruns of one session."""
+
+    def __init__(self, max_reruns=20):
+        self.reruns = collections.deque(maxlen=max_reruns)
+        self.current = None
+        self._label = None
+        self._start = None
+
+    def start_rerun(self, label=None):
+        """Begin recording on this thread; an unfinished previous rerun is dropped."""
+        self.current = []
+        self._label = label
+        self._start = time.perf_counter_ns()
+        _local.recorder = self
+
+    def finish_rerun(self, label=None):
+        """Close the rerun, optionally labelling it now that the view is known."""
+        if self.current is None:
+            return
+        self._label = label or self._label
+        end = time.perf_counter_ns()
+        self.current.append(("rerun", self._start, end - self._start, threading.get_ident(),
+                             {"view": self._label}))
+        self.reruns.append({"label": self._label, "spans": self.current})
+        self.current = None
+        deactivate()
+
+    def stage_breakdown(self):
+        """One dict per rerun: milliseconds per stage, total and unattributed time."""
+        rows = []
+        for rerun in self.reruns:
+            row = {"view": rerun["label"]}
+            total = staged = 0
+            covered_until = None
+            for name, start, duration, _, _ in sorted(rerun["spans"], key=lambda s: s[1]):
+                if name == "rerun":
+                    total = duration
+                    continue
+                row[name] = row.get(name, 0.0) + duration / 1e6
+                # Nested spans (e.g. pooling inside the hover heatmap) are not counted twice
+                if covered_until is None or start >= covered_until:
+                    staged += duration
+                    covered_until = start + duration
+            row["other"] = max(total - staged, 0) / 1e6
+            row["total"] = total / 1e6
+            rows.append(row)
+        return rows
+
+    def chrome_trace(self):
+        """The recorded reruns in Chrome trace-event format (complete "X" events, microseconds)."""
+        pid = os.getpid()
+        events = []
+        for rerun in self.reruns:
+            for name, start, duration, thread_id, args in rerun["spans"]:
+                events.append({"name": name, "cat": "attention_viz", "ph": "X", "pid": pid,
+                               "tid": thread_id, "ts": start / 1000, "dur": duration / 1000,
+                               "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
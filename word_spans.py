@@ -0,0 +1,52 @@
+"""Subword-to-word span index and word-level attention pooling.
+
+Devanagari prompts fragment into many subword tokens (' गति', 'ज', ' ऊ',
+'र्जा'), which makes token-level views hard to compare with English. A prompt's
+word spans are stored once as the token index where each word starts; pooling
+then reduces a whole (layers, heads, seq, seq) tensor to (layers, heads, words,
+words) with one `np.add.reduceat` per axis.
+"""
+import unicodedata
+
+import numpy as np
+
+
+def _is_punctuation(token):
+    stripped = token.strip()
+    return bool(stripped) and all(unicodedata.category(ch).startswith("P") for ch in stripped)
+
+
+def word_starts(tokens):
+    """Token index at which each word starts.
+
+    A word starts at the BOS token, right after it, at any token that begins
+    with whitespace, and at standalone punctuation (so '?' and '।' do not merge
+    into the last word).
+    """
+    starts = []
+    for i, token in enumerate(tokens):
+        if (i <= 1 or token[:1].isspace() or _is_punctuation(token)
+                or _is_punctuation(tokens[i - 1])):
+            starts.append(i)
+    return starts
+
+
+def words_from_starts(tokens, starts):
+    """Surface string of each word, joined from its tokens."""
+    bounds = list(starts) + [len(tokens)]
+    return ["".join(tokens[bounds[i]:bounds[i + 1]]) for i in range(len(starts))]
+
+
+def pool_words(attention, starts):
+    """Pool token-level attention into word-level attention.
+
+    Columns are summed (attention mass a query sends to a word) and rows are
+    averaged over the word's tokens, so every pooled row still sums to 1.
+    Works on any leading shape, e.g. the full (layers, heads, seq, seq) tensor.
+    """
+    starts = np.asarray(starts, dtype=np.intp)
+    weights = np.asarray(attention, dtype=np.float32)
+    counts = np.diff(np.append(starts, weights.shape[-1])).astype(np.float32)
+    pooled = np.add.reduceat(weights, starts, axis=-1)
+    pooled = np.add.reduceat(pooled, starts, axis=-2)
+    return pooled / counts[:, None]